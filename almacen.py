@@ -0,0 +1,448 @@
+"""
+Almacén columnar de resultados particionado por día.
+
+Cada día es una partición con una columna NumPy por campo de resultado
+(`timestamp` en ns, `intensity`, `expected`, `score`, `es_anomalia`,
+`confianza`) ordenada por tiempo, más un resumen por hora (puntos,
+anomalías, suma/mín/máx de intensidad, suma de expected, score máximo) que
+se mantiene al escribir. Las particiones están en una lista ordenada de
+días, así que un rango temporal son dos búsquedas binarias para los días
+y dos `searchsorted` dentro de la primera y la última partición: O(log n)
+más las filas devueltas. Los resúmenes por hora o por día de un rango no
+tocan las filas.
+
+Las escrituras son por lotes y al final (lo habitual en streaming); un lote
+con filas anteriores a las ya guardadas solo reordena las particiones de
+esos días. `guardar()` escribe un directorio con `meta.json` y un
+subdirectorio por día con sus `.npy`; solo reescribe los días que han
+cambiado desde la última vez. `abrir()` no lee ninguna fila hasta que se
+consulta su día, y entonces las abre con `mmap_mode="r"`.
+"""
+
+import bisect
+import json
+import os
+import shutil
+import tempfile
+import threading
+
+import numpy as np
+import pandas as pd
+
+from historial import DTYPE_RESULTADO
+
+VERSION_ALMACEN = 1
+
+_NS_HORA = 3_600_000_000_000
+_NS_DIA = 24 * _NS_HORA
+
+_COLUMNAS = tuple(
+    (nombre, np.dtype(np.int64) if nombre == "timestamp" else DTYPE_RESULTADO[nombre])
+    for nombre in DTYPE_RESULTADO.names
+)
+
+DTYPE_HORARIO = np.dtype(
+    [
+        ("puntos", "i8"),
+        ("anomalias", "i8"),
+        ("suma_intensity", "f8"),
+        ("min_intensity", "f8"),
+        ("max_intensity", "f8"),
+        ("suma_expected", "f8"),
+        ("puntos_expected", "i8"),
+        ("score_max", "f8"),
+    ]
+)
+
+# campos del resumen que se suman al agregar horas en días
+_CAMPOS_SUMA = ("puntos", "anomalias", "suma_intensity", "suma_expected", "puntos_expected")
+
+
+def _a_ns(valor):
+    return pd.Timestamp(valor).as_unit("ns").value
+
+
+def _horario_vacio():
+    h = np.zeros(24, dtype=DTYPE_HORARIO)
+    h["min_intensity"] = np.inf
+    h["max_intensity"] = -np.inf
+    h["score_max"] = -np.inf
+    return h
+
+
+class _Particion:
+    """Filas de un día, ordenadas, con su resumen por hora."""
+
+    def __init__(self, dia, ruta=None, filas=0):
+        self.dia = dia
+        self._ruta = ruta
+        self._n = filas
+        self._datos = None
+        self.horario = None
+        if ruta is None:
+            self._datos = {nombre: np.empty(0, dtype=dtype) for nombre, dtype in _COLUMNAS}
+            self.horario = _horario_vacio()
+        else:
+            self.horario = np.load(os.path.join(ruta, "horario.npy"))
+
+    def __len__(self):
+        return self._n
+
+    def columna(self, nombre):
+        if self._datos is None:
+            # partición abierta de disco: las filas se mapean al consultarlas
+            self._datos = {
+                nombre: np.load(os.path.join(self._ruta, f"{nombre}.npy"), mmap_mode="r")
+                for nombre, _ in _COLUMNAS
+            }
+        return self._datos[nombre][: self._n]
+
+    @property
+    def nbytes(self):
+        if self._datos is None:
+            return self.horario.nbytes
+        return self.horario.nbytes + sum(v.nbytes for v in self._datos.values())
+
+    def _reservar(self, capacidad):
+        actual = len(self._datos["timestamp"])
+        # los memmaps de solo lectura se copian al primer cambio
+        if capacidad <= actual and all(v.flags.writeable for v in self._datos.values()):
+            return
+        nueva = max(capacidad, 2 * actual, 64)
+        for nombre, dtype in _COLUMNAS:
+            arr = np.empty(nueva, dtype=dtype)
+            arr[: self._n] = self._datos[nombre][: self._n]
+            self._datos[nombre] = arr
+
+    def agregar(self, lote):
+        """Añade filas de este día (ordenadas) y actualiza el resumen por hora."""
+        t = lote["timestamp"]
+        k = len(t)
+        self.columna("timestamp")
+        if self._n and t[0] < self._datos["timestamp"][self._n - 1]:
+            # filas atrasadas: se mezcla y se reordena solo este día
+            todos = {
+                nombre: np.concatenate([self.columna(nombre), lote[nombre]])
+                for nombre, _ in _COLUMNAS
+            }
+            orden = np.argsort(todos["timestamp"], kind="stable")
+            self._datos = {nombre: v[orden] for nombre, v in todos.items()}
+            self._n += k
+        else:
+            self._reservar(self._n + k)
+            for nombre, _ in _COLUMNAS:
+                self._datos[nombre][self._n : self._n + k] = lote[nombre]
+            self._n += k
+        _acumular_horas(self.horario, self.dia, lote)
+
+
+def _acumular_horas(horario, dia, lote):
+    """Suma al resumen por hora un lote ordenado de filas del día `dia`."""
+    hora = (lote["timestamp"] - dia * _NS_DIA) // _NS_HORA
+    inicios = np.r_[0, np.flatnonzero(np.diff(hora)) + 1]
+    h = hora[inicios]
+
+    intensity = lote["intensity"]
+    expected = lote["expected"]
+    con_expected = ~np.isnan(expected)
+    horario["puntos"][h] += np.diff(np.r_[inicios, len(hora)])
+    horario["anomalias"][h] += np.add.reduceat(lote["es_anomalia"].astype(np.int64), inicios)
+    horario["suma_intensity"][h] += np.add.reduceat(intensity, inicios)
+    horario["min_intensity"][h] = np.minimum(
+        horario["min_intensity"][h], np.minimum.reduceat(intensity, inicios)
+    )
+    horario["max_intensity"][h] = np.maximum(
+        horario["max_intensity"][h], np.maximum.reduceat(intensity, inicios)
+    )
+    horario["suma_expected"][h] += np.add.reduceat(np.where(con_expected, expected, 0.0), inicios)
+    horario["puntos_expected"][h] += np.add.reduceat(con_expected.astype(np.int64), inicios)
+    horario["score_max"][h] = np.maximum(
+        horario["score_max"][h], np.maximum.reduceat(lote["score"], inicios)
+    )
+
+
+class AlmacenResultados:
+    """
+    Resultados de un detector particionados por día, con consultas por rango.
+
+    `max_dias` limita las particiones en memoria (se descartan los días más
+    antiguos, como los históricos de `historial.py`); `None` no limita.
+    Es seguro escribir desde un hilo (p. ej. el del servicio en vivo) y
+    consultar desde otro.
+    """
+
+    def __init__(self, max_dias=None):
+        self.max_dias = max_dias
+        self._dias = []
+        self._particiones = {}
+        self._sucias = set()
+        # directorio del último guardar/abrir: ahí solo se reescriben los días sucios
+        self._ruta = None
+        self._lock = threading.RLock()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(p) for p in self._particiones.values())
+
+    @property
+    def nbytes(self):
+        with self._lock:
+            return sum(p.nbytes for p in self._particiones.values())
+
+    @property
+    def primero(self):
+        """Primer timestamp guardado (o None)."""
+        with self._lock:
+            if not self._dias:
+                return None
+            return pd.Timestamp(int(self._particiones[self._dias[0]].columna("timestamp")[0]))
+
+    @property
+    def ultimo(self):
+        with self._lock:
+            if not self._dias:
+                return None
+            return pd.Timestamp(int(self._particiones[self._dias[-1]].columna("timestamp")[-1]))
+
+    # --- escritura ---
+
+    def agregar(self, df_res: pd.DataFrame):
+        """Añade un lote de resultados (el DataFrame de `procesar_lote`)."""
+        if len(df_res) == 0:
+            return
+        lote = {"timestamp": pd.DatetimeIndex(df_res["timestamp"]).as_unit("ns").asi8}
+        for nombre, dtype in _COLUMNAS[1:]:
+            lote[nombre] = df_res[nombre].to_numpy(dtype=dtype)
+        self._agregar_columnas(lote)
+
+    def agregar_punto(self, res):
+        """Añade un resultado suelto (el dict de `procesar_punto`)."""
+        lote = {"timestamp": np.array([_a_ns(res["timestamp"])], dtype=np.int64)}
+        for nombre, dtype in _COLUMNAS[1:]:
+            lote[nombre] = np.array([res[nombre]], dtype=dtype)
+        self._agregar_columnas(lote)
+
+    def _agregar_columnas(self, lote):
+        t = lote["timestamp"]
+        if len(t) > 1 and (np.diff(t) < 0).any():
+            orden = np.argsort(t, kind="stable")
+            lote = {nombre: v[orden] for nombre, v in lote.items()}
+            t = lote["timestamp"]
+
+        dias = t // _NS_DIA
+        cortes = np.r_[0, np.flatnonzero(np.diff(dias)) + 1, len(t)]
+        with self._lock:
+            for ini, fin in zip(cortes[:-1], cortes[1:]):
+                dia = int(dias[ini])
+                self._particion(dia).agregar({nombre: v[ini:fin] for nombre, v in lote.items()})
+                self._sucias.add(dia)
+            self._recortar()
+
+    def _particion(self, dia):
+        particion = self._particiones.get(dia)
+        if particion is None:
+            particion = self._particiones[dia] = _Particion(dia)
+            bisect.insort(self._dias, dia)
+        return particion
+
+    def _recortar(self):
+        if self.max_dias is None:
+            return
+        while len(self._dias) > self.max_dias:
+            dia = self._dias.pop(0)
+            del self._particiones[dia]
+            self._sucias.discard(dia)
+
+    def clear(self):
+        with self._lock:
+            self._dias = []
+            self._particiones = {}
+            self._sucias = set()
+
+    # --- consultas ---
+
+    def _dias_en(self, desde, hasta):
+        """Días [lo, hi) de `_dias` que pueden tener filas en [desde, hasta]."""
+        lo = 0 if desde is None else bisect.bisect_left(self._dias, desde // _NS_DIA)
+        hi = len(self._dias) if hasta is None else bisect.bisect_right(self._dias, hasta // _NS_DIA)
+        return self._dias[lo:hi]
+
+    def _tramos(self, desde=None, hasta=None):
+        """(partición, ini, fin) con las filas de `desde <= timestamp <= hasta`."""
+        desde = None if desde is None else _a_ns(desde)
+        hasta = None if hasta is None else _a_ns(hasta)
+        dias = self._dias_en(desde, hasta)
+        tramos = []
+        for i, dia in enumerate(dias):
+            particion = self._particiones[dia]
+            ini, fin = 0, len(particion)
+            # solo la primera y la última partición pueden quedar a medias
+            if i == 0 and desde is not None:
+                ini = int(np.searchsorted(particion.columna("timestamp"), desde, side="left"))
+            if i == len(dias) - 1 and hasta is not None:
+                fin = int(np.searchsorted(particion.columna("timestamp"), hasta, side="right"))
+            if fin > ini:
+                tramos.append((particion, ini, fin))
+        return tramos
+
+    def contar(self, desde=None, hasta=None):
+        with self._lock:
+            return sum(fin - ini for _, ini, fin in self._tramos(desde, hasta))
+
+    def rango(self, desde=None, hasta=None) -> pd.DataFrame:
+        """Resultados con `desde <= timestamp <= hasta`, en el formato de `procesar_lote`."""
+        with self._lock:
+            return _frame(
+                [
+                    {nombre: p.columna(nombre)[ini:fin] for nombre, _ in _COLUMNAS}
+                    for p, ini, fin in self._tramos(desde, hasta)
+                ]
+            )
+
+    def anomalias(self, desde=None, hasta=None) -> pd.DataFrame:
+        """Filas anómalas del rango; los días sin anomalías no se leen."""
+        with self._lock:
+            partes = []
+            for p, ini, fin in self._tramos(desde, hasta):
+                if not p.horario["anomalias"].any():
+                    continue
+                mascara = np.asarray(p.columna("es_anomalia")[ini:fin])
+                partes.append(
+                    {nombre: p.columna(nombre)[ini:fin][mascara] for nombre, _ in _COLUMNAS}
+                )
+            return _frame(partes)
+
+    def resumen(self, frecuencia="h", desde=None, hasta=None) -> pd.DataFrame:
+        """
+        Agregados por hora (`"h"`) o por día (`"D"`) del rango, sin leer filas.
+
+        Una fila por hora o día con datos, indexada por su inicio: `puntos`,
+        `anomalias`, `intensity_media`, `intensity_min`, `intensity_max`,
+        `expected_media` y `score_max`. El rango se ajusta a horas o días
+        completos.
+        """
+        if frecuencia not in ("h", "D"):
+            raise ValueError(f"Frecuencia no soportada: {frecuencia}")
+        desde = None if desde is None else _a_ns(desde)
+        hasta = None if hasta is None else _a_ns(hasta)
+        with self._lock:
+            dias = self._dias_en(desde, hasta)
+            if not dias:
+                horario = np.empty(0, dtype=DTYPE_HORARIO)
+            else:
+                horario = np.concatenate([self._particiones[d].horario for d in dias])
+        inicio = (np.repeat(np.asarray(dias, dtype=np.int64), 24) * _NS_DIA) + np.tile(
+            np.arange(24, dtype=np.int64) * _NS_HORA, len(dias)
+        )
+
+        if frecuencia == "D":
+            por_dia = horario.reshape(-1, 24)
+            inicio = inicio[::24]
+            horario = np.empty(len(dias), dtype=DTYPE_HORARIO)
+            for campo in _CAMPOS_SUMA:
+                horario[campo] = por_dia[campo].sum(axis=1)
+            horario["min_intensity"] = por_dia["min_intensity"].min(axis=1)
+            horario["max_intensity"] = por_dia["max_intensity"].max(axis=1)
+            horario["score_max"] = por_dia["score_max"].max(axis=1)
+            paso = _NS_DIA
+        else:
+            paso = _NS_HORA
+
+        mascara = horario["puntos"] > 0
+        if desde is not None:
+            mascara &= inicio + paso > desde
+        if hasta is not None:
+            mascara &= inicio <= hasta
+        h = horario[mascara]
+        with np.errstate(invalid="ignore", divide="ignore"):
+            return pd.DataFrame(
+                {
+                    "puntos": h["puntos"],
+                    "anomalias": h["anomalias"],
+                    "intensity_media": h["suma_intensity"] / h["puntos"],
+                    "intensity_min": h["min_intensity"],
+                    "intensity_max": h["max_intensity"],
+                    "expected_media": np.where(
+                        h["puntos_expected"] > 0, h["suma_expected"] / h["puntos_expected"], np.nan
+                    ),
+                    "score_max": h["score_max"],
+                },
+                index=pd.DatetimeIndex(inicio[mascara].astype("M8[ns]"), name="timestamp"),
+            )
+
+    # --- disco ---
+
+    def guardar(self, ruta):
+        """
+        Escribe el almacén en el directorio `ruta`.
+
+        Solo se reescriben los días nuevos o modificados desde el último
+        `guardar`/`abrir` sobre la misma ruta; cada día se sustituye de forma
+        atómica y `meta.json` se escribe al final.
+        """
+        with self._lock:
+            os.makedirs(ruta, exist_ok=True)
+            ruta_meta = os.path.join(ruta, "meta.json")
+            en_disco = set()
+            if os.path.exists(ruta_meta) and self._ruta == os.path.abspath(ruta):
+                with open(ruta_meta) as f:
+                    en_disco = {int(d) for d in json.load(f)["dias"]}
+            pendientes = [d for d in self._dias if d in self._sucias or d not in en_disco]
+
+            for dia in pendientes:
+                _escribir_particion(ruta, self._particiones[dia])
+            for dia in en_disco - set(self._dias):
+                shutil.rmtree(os.path.join(ruta, str(dia)), ignore_errors=True)
+
+            meta = {
+                "version": VERSION_ALMACEN,
+                "max_dias": self.max_dias,
+                "dias": {str(d): len(self._particiones[d]) for d in self._dias},
+            }
+            fd, tmp = tempfile.mkstemp(prefix=".meta_", dir=ruta)
+            with os.fdopen(fd, "w") as f:
+                json.dump(meta, f)
+            os.replace(tmp, ruta_meta)
+            self._sucias = set()
+            self._ruta = os.path.abspath(ruta)
+
+    @classmethod
+    def abrir(cls, ruta):
+        """Almacén guardado con `guardar`; las filas se leen al consultarlas."""
+        with open(os.path.join(ruta, "meta.json")) as f:
+            meta = json.load(f)
+        if meta.get("version") != VERSION_ALMACEN:
+            raise ValueError(f"Versión de almacén no soportada en {ruta}")
+        almacen = cls(max_dias=meta["max_dias"])
+        for dia, filas in sorted((int(d), n) for d, n in meta["dias"].items()):
+            almacen._particiones[dia] = _Particion(dia, os.path.join(ruta, str(dia)), filas)
+            almacen._dias.append(dia)
+        almacen._ruta = os.path.abspath(ruta)
+        return almacen
+
+
+def _escribir_particion(ruta, particion):
+    destino = os.path.join(ruta, str(particion.dia))
+    tmp = tempfile.mkdtemp(prefix=".tmp_", dir=ruta)
+    try:
+        for nombre, _ in _COLUMNAS:
+            np.save(os.path.join(tmp, f"{nombre}.npy"), particion.columna(nombre))
+        np.save(os.path.join(tmp, "horario.npy"), particion.horario)
+        # los memmaps de la versión anterior siguen válidos tras el rmtree (Linux)
+        if os.path.exists(destino):
+            shutil.rmtree(destino)
+        os.replace(tmp, destino)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def _frame(partes):
+    columnas = {
+        nombre: (
+            np.concatenate([p[nombre] for p in partes]) if partes else np.empty(0, dtype=dtype)
+        )
+        for nombre, dtype in _COLUMNAS
+    }
+    columnas["timestamp"] = columnas["timestamp"].astype("M8[ns]")
+    return pd.DataFrame(columnas)
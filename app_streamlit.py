@@ -1,11 +1,35 @@
+import copy
+import hashlib
+import io
+import os
+import threading
+from collections import OrderedDict
+
+import numpy as np
 import streamlit as st
 import pandas as pd
-import numpy as np
-import plotly.graph_objects as go
-from datetime import datetime
-from collections import deque
 
-from sklearn.ensemble import IsolationForest  # Isolation Forest[web:143]
+from almacen import AlmacenResultados
+from barrido import barrer_parametros
+from caracteristicas import caracteristicas_disponibles
+from detectores import (
+    MODOS_ENSEMBLE,
+    TrafficAnomalyDetectorEnsemble,
+    TrafficAnomalyDetectorIForest,
+    TrafficAnomalyDetectorMAD,
+    TrafficAnomalyDetectorMADEstacional,
+    TrafficAnomalyDetectorMADMultivariante,
+)
+from ingesta import cargar_dataset
+from instrumentacion import Cronometro, perfilar
+from servicio import (
+    PUERTO,
+    ServicioIngesta,
+    arrancar_en_hilo,
+    detener_en_hilo,
+    sondear,
+)
+from submuestreo import submuestrear
 
 # ============================================================================
 # CONFIGURACIÓN STREAMLIT
@@ -48,259 +72,324 @@ st.markdown(
 )
 
 # ============================================================================
-# CLASE 1: DETECTOR MAD (VENTANA DESLIZANTE)
+# INICIALIZACIÓN DE ESTADO
 # ============================================================================
 
+if "algoritmo" not in st.session_state:
+    st.session_state.algoritmo = "MAD (Ventana deslizante)"
 
-class TrafficAnomalyDetectorMAD:
-    """
-    Detector de anomalías basado en:
-    - Baseline = mediana de intensidad
-    - MAD = mediana(|x - mediana|)
-    - Score = |x - baseline| / MAD
-    - Anomalía si score > threshold
+if "detector" not in st.session_state:
+    st.session_state.detector = None
 
-    Usa solo los últimos `window_days` días del dataset para calcular baseline.[web:29][web:121]
-    """
+if "df_cargado" not in st.session_state:
+    st.session_state.df_cargado = None
 
-    def __init__(self, window_days=42, threshold=3.5):
-        self.window_days = window_days
-        self.window_minutos = window_days * 1440
-        self.threshold = threshold
-
-        self.buffer = deque(maxlen=self.window_minutos)
-        self.baseline_med = None
-        self.baseline_mad = None
-        self.baseline_ts = None
-
-        self.anomalias_detectadas = []
-        self.score_history = []
-
-    def _filtrar_ventana(self, df: pd.DataFrame) -> pd.DataFrame:
-        df = df.copy()
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        df = df.sort_values("timestamp")
-        if df.empty:
-            return df
-
-        t_max = df["timestamp"].max()
-        t_min = t_max - pd.Timedelta(days=self.window_days)
-        df_win = df[df["timestamp"] >= t_min]
-
-        if len(df_win) < 100:
-            df_win = df
-
-        return df_win
-
-    def cargar_historico(self, df: pd.DataFrame):
-        df_win = self._filtrar_ventana(df)
-        intensity = df_win["intensity"].values
-
-        if len(intensity) == 0:
-            self.baseline_med = None
-            self.baseline_mad = None
-            self.baseline_ts = None
-            return {"mediana": np.nan, "mad": np.nan, "puntos": 0}
-
-        self.baseline_med = np.median(intensity)
-        desviaciones = np.abs(intensity - self.baseline_med)
-        mad_val = np.median(desviaciones)
-        self.baseline_mad = mad_val if mad_val > 0 else np.std(intensity)
-
-        self.baseline_ts = df_win["timestamp"].max()
-        self.buffer = deque(intensity, maxlen=self.window_minutos)
-
-        return {
-            "mediana": self.baseline_med,
-            "mad": self.baseline_mad,
-            "puntos": len(intensity),
-        }
+if "almacen" not in st.session_state:
+    # AlmacenResultados del detector actual (particiones por día)
+    st.session_state.almacen = None
 
-    def procesar_punto(self, timestamp, intensity, threshold=None):
-        if (
-            self.baseline_med is None
-            or self.baseline_mad is None
-            or self.baseline_mad == 0
-        ):
-            return None
+if "clave_dataset" not in st.session_state:
+    st.session_state.clave_dataset = None
 
-        th = threshold if threshold is not None else self.threshold
-        score = abs((intensity - self.baseline_med) / self.baseline_mad)
-        es_anomalia = score > th
+if "threshold_actual" not in st.session_state:
+    st.session_state.threshold_actual = 3.5
 
-        self.buffer.append(intensity)
+if "window_days" not in st.session_state:
+    st.session_state.window_days = 42
 
-        res = {
-            "timestamp": timestamp,
-            "intensity": intensity,
-            "expected": self.baseline_med,
-            "score": score,
-            "es_anomalia": es_anomalia,
-            "confianza": min(score / th, 1.0) if th > 0 else 0.0,
-        }
+if "contamination_iforest" not in st.session_state:
+    st.session_state.contamination_iforest = 0.01
 
-        self.score_history.append(res)
-        if es_anomalia:
-            self.anomalias_detectadas.append(res)
-
-        return res
-
-    def procesar_lote(self, df: pd.DataFrame, threshold=None):
-        resultados = []
-        th = threshold if threshold is not None else self.threshold
-
-        for _, row in df.iterrows():
-            r = self.procesar_punto(row["timestamp"], row["intensity"], threshold=th)
-            if r is not None:
-                resultados.append(r)
-
-        return resultados
-
-    def get_estadisticas(self):
-        return {
-            "total_anomalias": len(self.anomalias_detectadas),
-            "baseline_mediana": self.baseline_med,
-            "baseline_mad": self.baseline_mad,
-            "buffer_tamaño": len(self.buffer),
-            "baseline_edad_horas": (
-                (datetime.now() - self.baseline_ts).total_seconds() / 3600
-                if self.baseline_ts is not None
-                else None
-            ),
-            "ultima_anomalia": (
-                self.anomalias_detectadas[-1]["timestamp"]
-                if self.anomalias_detectadas
-                else None
-            ),
-        }
+if "features" not in st.session_state:
+    st.session_state.features = ["intensity"]
+
+if "deriva" not in st.session_state:
+    st.session_state.deriva = False
+
+if "modo_ensemble" not in st.session_state:
+    st.session_state.modo_ensemble = "ponderado"
+
+if "instrumentar" not in st.session_state:
+    st.session_state.instrumentar = False
+    # informe de `perfilar` de la última captura
+    st.session_state.perfil = None
+
+if "servicio_vivo" not in st.session_state:
+    # (servicio, cola de suscriptor, puerto) del servicio de ingesta en vivo
+    st.session_state.servicio_vivo = None
+    st.session_state.anomalias_vivo = []
+
+# tiempos de este rerun (carga, detector, gráficos); se muestran en Rendimiento
+crono_app = Cronometro(activo=st.session_state.instrumentar)
 
 
 # ============================================================================
-# CLASE 2: DETECTOR ISOLATION FOREST
+# CACHÉS ENTRE RERUNS
 # ============================================================================
 
+# Streamlit vuelve a ejecutar el script en cada interacción. Los DataFrames
+# cargados y los barridos van a st.cache_data (LRU por número de entradas) y
+# los detectores ya entrenados y puntuados a una CacheLRU con tope de memoria
+# que vive en st.cache_resource. Las claves son la firma del dataset más los
+# parámetros, así que volver a un dataset o a unos parámetros ya vistos no
+# recalcula nada.
 
-class TrafficAnomalyDetectorIForest:
-    """
-    Detector de anomalías basado en Isolation Forest (sklearn).[web:140][web:143]
+CACHE_MAX_MB = 512
+CACHE_MAX_ENTRADAS = 8
 
-    - Entrena un bosque de árboles que aíslan puntos "raros".
-    - Devuelve score (cuanto más negativo, más anómalo) y etiqueta.
-    """
+# por encima, los incidentes se pintan solo como marcadores (sin bandas)
+MAX_BANDAS_INCIDENTES = 150
 
-    def __init__(self, contamination=0.01, random_state=42):
-        self.contamination = contamination
-        self.random_state = random_state
+# rangos visibles más largos se pintan desde el resumen por hora del almacén
+DIAS_DETALLE = 31
 
-        self.modelo = None
-        self.fitted = False
+ENSEMBLE = "Ensemble (MAD + Isolation Forest)"
 
-        self.anomalias_detectadas = []
-        self.score_history = []
+# rejilla del barrido MAD: coincide con los pasos de los sliders
+VENTANAS_BARRIDO = list(range(7, 91, 7))
+THRESHOLDS_BARRIDO = [round(1.5 + 0.1 * i, 1) for i in range(36)]
 
-    def cargar_historico(self, df: pd.DataFrame):
-        """
-        Entrena el IsolationForest sobre las features disponibles.
-        Aquí usamos solo intensity, pero puedes añadir occupancy, etc.[web:17][web:146]
-        """
-        df = df.copy()
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        df = df.sort_values("timestamp")
 
-        X = df[["intensity"]].values  # extender con más features si quieres
+class CacheLRU:
+    """LRU con tope de memoria aproximada (bytes) y de número de entradas."""
 
-        self.modelo = IsolationForest(
-            contamination=self.contamination,
-            random_state=self.random_state,
-        )
-        self.modelo.fit(X)
-        self.fitted = True
-
-        return {"puntos": len(df)}
-
-    def procesar_lote(self, df: pd.DataFrame):
-        if not self.fitted or self.modelo is None:
-            return []
-
-        df = df.copy()
-        df["timestamp"] = pd.to_datetime(df["timestamp"])
-        df = df.sort_values("timestamp")
-
-        X = df[["intensity"]].values
-
-        # predict: 1 = normal, -1 = anomalía
-        y_pred = self.modelo.predict(X)
-        scores = self.modelo.score_samples(X)  # mayor = más normal, más bajo = más raro[web:140]
-
-        resultados = []
-        self.anomalias_detectadas = []
-        self.score_history = []
-
-        # normalizamos el score a algo positivo para compararlo visualmente
-        score_min = scores.min()
-        score_max = scores.max()
-        denom = score_max - score_min if score_max > score_min else 1.0
-        scores_norm = (scores - score_min) / denom
-
-        for i, row in df.iterrows():
-            es_anomalia = y_pred[i] == -1
-            score_norm = 1.0 - scores_norm[i]  # 0 normal, 1 muy raro
-
-            res = {
-                "timestamp": row["timestamp"],
-                "intensity": row["intensity"],
-                "expected": np.nan,  # IF no da baseline explícito
-                "score": score_norm,
-                "es_anomalia": es_anomalia,
-                "confianza": score_norm,
-            }
-
-            resultados.append(res)
-            self.score_history.append(res)
-            if es_anomalia:
-                self.anomalias_detectadas.append(res)
-
-        return resultados
-
-    def get_estadisticas(self):
-        return {
-            "total_anomalias": len(self.anomalias_detectadas),
-            "baseline_mediana": np.nan,
-            "baseline_mad": np.nan,
-            "buffer_tamaño": len(self.score_history),
-            "baseline_edad_horas": None,
-            "ultima_anomalia": (
-                self.anomalias_detectadas[-1]["timestamp"]
-                if self.anomalias_detectadas
-                else None
-            ),
-        }
+    def __init__(self, max_bytes, max_entradas=32):
+        self.max_bytes = max_bytes
+        self.max_entradas = max_entradas
+        self._datos = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
 
+    def get(self, clave):
+        with self._lock:
+            if clave not in self._datos:
+                return None
+            self._datos.move_to_end(clave)
+            return self._datos[clave][0]
 
-# ============================================================================
-# INICIALIZACIÓN DE ESTADO
-# ============================================================================
+    def put(self, clave, valor, nbytes):
+        with self._lock:
+            if clave in self._datos:
+                self._bytes -= self._datos.pop(clave)[1]
+            self._datos[clave] = (valor, nbytes)
+            self._bytes += nbytes
+            # siempre se conserva la entrada recién añadida
+            while len(self._datos) > 1 and (
+                self._bytes > self.max_bytes or len(self._datos) > self.max_entradas
+            ):
+                _, (_, n) = self._datos.popitem(last=False)
+                self._bytes -= n
 
-if "algoritmo" not in st.session_state:
-    st.session_state.algoritmo = "MAD (Ventana deslizante)"
+    def uso_bytes(self):
+        return self._bytes
 
-if "detector" not in st.session_state:
-    st.session_state.detector = None
 
-if "df_cargado" not in st.session_state:
-    st.session_state.df_cargado = None
+@st.cache_resource
+def _cache_detectores():
+    return CacheLRU(CACHE_MAX_MB * 2**20, max_entradas=4 * CACHE_MAX_ENTRADAS)
 
-if "resultados" not in st.session_state:
-    st.session_state.resultados = []
 
-if "threshold_actual" not in st.session_state:
-    st.session_state.threshold_actual = 3.5
+def clave_dataset(archivo) -> str:
+    """Firma del dataset: ruta+mtime+tamaño para ficheros, hash para subidas."""
+    if isinstance(archivo, str):
+        info = os.stat(archivo)
+        return f"{os.path.abspath(archivo)}:{info.st_mtime_ns}:{info.st_size}"
+    return hashlib.sha256(archivo.getvalue()).hexdigest()
 
-if "window_days" not in st.session_state:
-    st.session_state.window_days = 42
 
-if "contamination_iforest" not in st.session_state:
-    st.session_state.contamination_iforest = 0.01
+@st.cache_data(max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def cargar_frame(clave, _archivo) -> pd.DataFrame:
+    if isinstance(_archivo, str):
+        # datasets incluidos: caché binaria .npy, sin volver a parsear el CSV
+        return cargar_dataset(_archivo).a_dataframe()
+    df = pd.read_csv(io.BytesIO(_archivo.getvalue()))
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    return df.sort_values("timestamp").reset_index(drop=True)
+
+
+@st.cache_data(max_entries=CACHE_MAX_ENTRADAS, show_spinner=False)
+def _barrido_dataset(clave, _df):
+    return barrer_parametros(_df, VENTANAS_BARRIDO, THRESHOLDS_BARRIDO)
+
+
+def obtener_barrido():
+    """Barrido MAD del dataset cargado, calculado una vez por dataset."""
+    return _barrido_dataset(st.session_state.clave_dataset, st.session_state.df_cargado)
+
+
+def _tamano_aprox(detector, almacen):
+    """Bytes aproximados de un detector puntuado y sus resultados."""
+    nbytes = almacen.nbytes
+    # históricos preasignados y floats del buffer (~32 B)
+    nbytes += detector.score_history.nbytes + detector.anomalias_detectadas.nbytes
+    nbytes += 32 * len(getattr(detector, "buffer", []))
+    return nbytes
+
+
+def detector_puntuado(algoritmo):
+    """
+    Detector entrenado y resultados para el dataset y parámetros actuales.
+
+    El valor cacheado se comparte entre reruns y sesiones: no se modifica.
+    """
+    features = tuple(st.session_state.features)
+    if algoritmo.startswith("MAD"):
+        params = (st.session_state.window_days, st.session_state.threshold_actual)
+    elif algoritmo == ENSEMBLE:
+        params = (
+            st.session_state.window_days,
+            st.session_state.threshold_actual,
+            st.session_state.contamination_iforest,
+            st.session_state.modo_ensemble,
+        )
+    else:
+        params = (st.session_state.contamination_iforest,)
+    if "estacional" not in algoritmo:
+        params += (features,)
+    # la deriva solo cuenta en el MAD univariante
+    if algoritmo == "MAD (Ventana deslizante)" and features == ("intensity",):
+        params += (st.session_state.deriva,)
+
+    cache = _cache_detectores()
+    clave = (st.session_state.clave_dataset, algoritmo, params)
+    valor = cache.get(clave)
+    if valor is not None:
+        return valor
+
+    valor = construir_detector(algoritmo, instrumentar=st.session_state.instrumentar)
+    cache.put(clave, valor, _tamano_aprox(valor[0], valor[2]))
+    return valor
+
+
+def construir_detector(algoritmo, instrumentar=False):
+    """Entrena y puntúa un detector nuevo para el dataset y parámetros actuales."""
+    features = tuple(st.session_state.features)
+    df = st.session_state.df_cargado
+    almacen = AlmacenResultados()
+    if algoritmo.startswith("MAD"):
+        kwargs = {}
+        if "estacional" in algoritmo:
+            clase_mad = TrafficAnomalyDetectorMADEstacional
+        elif features != ("intensity",):
+            clase_mad = TrafficAnomalyDetectorMADMultivariante
+            kwargs["features"] = features
+        else:
+            clase_mad = TrafficAnomalyDetectorMAD
+            kwargs["deriva"] = st.session_state.deriva
+        detector = clase_mad(
+            window_days=st.session_state.window_days,
+            threshold=st.session_state.threshold_actual,
+            **kwargs,
+        )
+        detector.cronometro.activo = instrumentar
+        stats_base = detector.cargar_historico(df)
+        detector.almacen = almacen
+        detector.procesar_lote(df, threshold=st.session_state.threshold_actual)
+    elif algoritmo == ENSEMBLE:
+        # una sola pasada de orden y features para los dos modelos
+        detector = TrafficAnomalyDetectorEnsemble(
+            window_days=st.session_state.window_days,
+            threshold=st.session_state.threshold_actual,
+            contamination=st.session_state.contamination_iforest,
+            features=features,
+            modo=st.session_state.modo_ensemble,
+        )
+        detector.cronometro.activo = instrumentar
+        stats_base = detector.cargar_historico(df)
+        detector.almacen = almacen
+        detector.procesar_lote(df, threshold=st.session_state.threshold_actual)
+    else:
+        detector = TrafficAnomalyDetectorIForest(
+            contamination=st.session_state.contamination_iforest,
+            features=features,
+        )
+        detector.cronometro.activo = instrumentar
+        stats_base = detector.cargar_historico(df)
+        detector.almacen = almacen
+        detector.procesar_lote(df)
+
+    # el detector cacheado no sigue escribiendo: el almacén se devuelve aparte
+    detector.almacen = None
+    return detector, stats_base, almacen
+
+
+def series_visibles(almacen, desde, hasta, con_expected=False):
+    """
+    Intensidad, expected (si `con_expected`) y score a pintar en [desde, hasta], y una nota.
+
+    Hasta `DIAS_DETALLE` días se leen los minutos del rango y se submuestrean
+    (las anomalías se conservan todas); en rangos más largos se pintan los
+    agregados por hora del almacén sin leer ninguna fila.
+    """
+    desde, hasta = pd.Timestamp(desde), pd.Timestamp(hasta)
+    if hasta - desde <= pd.Timedelta(days=DIAS_DETALLE):
+        df_vis = almacen.rango(desde, hasta)
+        df_int = submuestrear(df_vis, "intensity", forzar=df_vis["es_anomalia"])
+        df_score = submuestrear(df_vis, "score", forzar=df_vis["es_anomalia"])
+        nota = None
+        if len(df_int) < len(df_vis):
+            nota = (
+                f"Mostrando {len(df_int):,} de {len(df_vis):,} "
+                "puntos (mín/máx por intervalo; acota el rango para más detalle)."
+            )
+        df_exp = submuestrear(df_vis, "expected") if con_expected else None
+        return df_int, df_exp, df_score, nota
+
+    df_hora = almacen.resumen("h", desde, hasta).reset_index()
+    # mínimo y máximo de cada hora como dos puntos, igual que el submuestreo
+    df_int = pd.DataFrame(
+        {
+            "timestamp": pd.concat(
+                [df_hora["timestamp"], df_hora["timestamp"] + pd.Timedelta(minutes=30)],
+                ignore_index=True,
+            ),
+            "intensity": np.r_[df_hora["intensity_min"], df_hora["intensity_max"]],
+        }
+    ).sort_values("timestamp", kind="stable")
+    df_exp = df_hora[["timestamp", "expected_media"]].rename(columns={"expected_media": "expected"})
+    df_score = df_hora[["timestamp", "score_max"]].rename(columns={"score_max": "score"})
+    nota = (
+        f"Rango de más de {DIAS_DETALLE} días: mínimo y máximo de cada una de las "
+        f"{len(df_hora):,} horas y score máximo por hora (acota el rango para ver los minutos)."
+    )
+    return df_int, df_exp, df_score, nota
+
+
+def ejecutar_detector(algoritmo, recalculo=False):
+    with crono_app.etapa("detector"):
+        detector, stats_base, almacen = detector_puntuado(algoritmo)
+    st.session_state.detector = detector
+    st.session_state.almacen = almacen
+
+    if algoritmo.startswith("MAD"):
+        if recalculo:
+            st.success(
+                f"MAD recalculado (puntos={stats_base['puntos']}, "
+                f"mediana={stats_base['mediana']:.1f}, MAD={stats_base['mad']:.2f})"
+            )
+        else:
+            st.success(
+                f"MAD entrenado con {stats_base['puntos']} puntos "
+                f"(mediana={stats_base['mediana']:.1f}, MAD={stats_base['mad']:.2f})"
+            )
+    elif algoritmo == ENSEMBLE:
+        st.success(
+            f"Ensemble {'recalculado' if recalculo else 'entrenado'} con "
+            f"{stats_base['puntos']} puntos (mediana={stats_base['mediana']:.1f}, "
+            f"MAD={stats_base['mad']:.2f}, "
+            f"contamination={st.session_state.contamination_iforest:.3f}, "
+            f"modo {st.session_state.modo_ensemble})"
+        )
+    elif recalculo:
+        st.success(
+            f"Isolation Forest recalculado (puntos={stats_base['puntos']}, "
+            f"contamination={st.session_state.contamination_iforest:.3f})"
+        )
+    else:
+        st.success(
+            f"Isolation Forest entrenado con {stats_base['puntos']} puntos, "
+            f"contamination={st.session_state.contamination_iforest:.3f}"
+        )
 
 
 # ============================================================================
@@ -325,10 +414,16 @@ with st.sidebar:
 
     # Algoritmo
     st.subheader("0️⃣ Algoritmo")
+    algoritmos_disponibles = [
+        "MAD (Ventana deslizante)",
+        "MAD estacional (franja horaria)",
+        "Isolation Forest",
+        ENSEMBLE,
+    ]
     algoritmo = st.selectbox(
         "Método de detección:",
-        ["MAD (Ventana deslizante)", "Isolation Forest"],
-        index=0 if st.session_state.algoritmo == "MAD (Ventana deslizante)" else 1,
+        algoritmos_disponibles,
+        index=algoritmos_disponibles.index(st.session_state.algoritmo),
     )
     st.session_state.algoritmo = algoritmo
 
@@ -365,40 +460,11 @@ with st.sidebar:
     # Botón cargar
     if st.button("📂 Cargar Dataset", key="btn_cargar"):
         try:
-            if isinstance(archivo_usar, str):
-                df = pd.read_csv(archivo_usar)
-            else:
-                df = pd.read_csv(archivo_usar)
-
-            df["timestamp"] = pd.to_datetime(df["timestamp"])
-            df = df.sort_values("timestamp").reset_index(drop=True)
-
-            st.session_state.df_cargado = df
-
-            # Crear detector según algoritmo
-            if algoritmo.startswith("MAD"):
-                st.session_state.detector = TrafficAnomalyDetectorMAD(
-                    window_days=st.session_state.window_days,
-                    threshold=st.session_state.threshold_actual,
-                )
-                stats_base = st.session_state.detector.cargar_historico(df)
-                st.session_state.resultados = st.session_state.detector.procesar_lote(
-                    df, threshold=st.session_state.threshold_actual
-                )
-                st.success(
-                    f"MAD entrenado con {stats_base['puntos']} puntos "
-                    f"(mediana={stats_base['mediana']:.1f}, MAD={stats_base['mad']:.2f})"
-                )
-            else:
-                st.session_state.detector = TrafficAnomalyDetectorIForest(
-                    contamination=st.session_state.contamination_iforest
-                )
-                stats_base = st.session_state.detector.cargar_historico(df)
-                st.session_state.resultados = st.session_state.detector.procesar_lote(df)
-                st.success(
-                    f"Isolation Forest entrenado con {stats_base['puntos']} puntos, "
-                    f"contamination={st.session_state.contamination_iforest:.3f}"
-                )
+            with crono_app.etapa("carga"):
+                clave = clave_dataset(archivo_usar)
+                st.session_state.df_cargado = cargar_frame(clave, archivo_usar)
+            st.session_state.clave_dataset = clave
+            ejecutar_detector(algoritmo)
 
         except Exception as e:
             st.error(f"❌ Error cargando datos: {str(e)}")
@@ -408,7 +474,7 @@ with st.sidebar:
     # Parámetros según algoritmo
     st.subheader("2️⃣ Parámetros")
 
-    if algoritmo.startswith("MAD"):
+    if algoritmo.startswith("MAD") or algoritmo == ENSEMBLE:
         window_days = st.slider(
             "Ventana histórica (días):",
             min_value=7,
@@ -426,7 +492,35 @@ with st.sidebar:
             step=0.1,
         )
         st.session_state.threshold_actual = threshold
-    else:
+
+        # vista previa instantánea a partir del barrido (sin reescanear el dataset)
+        if algoritmo == "MAD (Ventana deslizante)":
+            # el selector de features va más abajo: su valor actual está en su clave
+            actuales = st.session_state.get("sel_features", st.session_state.features)
+            solo_intensity = list(actuales or ["intensity"]) == ["intensity"]
+            if "chk_deriva" not in st.session_state or not solo_intensity:
+                st.session_state.chk_deriva = st.session_state.deriva and solo_intensity
+            st.session_state.deriva = st.checkbox(
+                "Detectar cambios de régimen (obras)",
+                disabled=not solo_intensity,
+                help="Page-Hinkley sobre los residuos: al confirmar un cambio "
+                "sostenido de nivel, el baseline se rehace desde ese punto. "
+                "Solo con la feature intensity.",
+                key="chk_deriva",
+            )
+
+        if (
+            algoritmo == "MAD (Ventana deslizante)"
+            and st.session_state.features == ["intensity"]
+            and not st.session_state.deriva
+            and st.session_state.df_cargado is not None
+        ):
+            n_prev = obtener_barrido().anomalias(window_days, threshold)
+            st.caption(
+                f"Con estos parámetros: **{n_prev}** anomalías "
+                "(pulsa Recalcular para aplicarlos)."
+            )
+    if not algoritmo.startswith("MAD"):
         contamination = st.slider(
             "Contamination (proporción esperada de anomalías):",
             min_value=0.001,
@@ -436,6 +530,32 @@ with st.sidebar:
         )
         st.session_state.contamination_iforest = contamination
 
+    if algoritmo == ENSEMBLE:
+        st.session_state.modo_ensemble = st.selectbox(
+            "Combinación:",
+            MODOS_ENSEMBLE,
+            index=MODOS_ENSEMBLE.index(st.session_state.modo_ensemble),
+            help="Scores de los dos modelos en una escala común (1 = umbral de cada uno). "
+            "ponderado: anomalía si la media supera 1; cualquiera / todos: si uno / "
+            "los dos superan su umbral.",
+        )
+
+    if "estacional" not in algoritmo:
+        columnas = (
+            st.session_state.df_cargado.columns
+            if st.session_state.df_cargado is not None
+            else ("intensity", "occupancy")
+        )
+        opciones = caracteristicas_disponibles(columnas)
+        features = st.multiselect(
+            "Features:",
+            opciones,
+            default=[f for f in st.session_state.features if f in opciones],
+            help="Con varias features, el score MAD es el mayor de sus scores.",
+            key="sel_features",
+        )
+        st.session_state.features = features or ["intensity"]
+
     st.divider()
 
     # Recalcular
@@ -445,31 +565,7 @@ with st.sidebar:
         if st.session_state.df_cargado is None:
             st.warning("⚠️ Carga un dataset primero.")
         else:
-            df = st.session_state.df_cargado
-
-            if algoritmo.startswith("MAD"):
-                st.session_state.detector = TrafficAnomalyDetectorMAD(
-                    window_days=st.session_state.window_days,
-                    threshold=st.session_state.threshold_actual,
-                )
-                stats_base = st.session_state.detector.cargar_historico(df)
-                st.session_state.resultados = st.session_state.detector.procesar_lote(
-                    df, threshold=st.session_state.threshold_actual
-                )
-                st.success(
-                    f"MAD recalculado (puntos={stats_base['puntos']}, "
-                    f"mediana={stats_base['mediana']:.1f}, MAD={stats_base['mad']:.2f})"
-                )
-            else:
-                st.session_state.detector = TrafficAnomalyDetectorIForest(
-                    contamination=st.session_state.contamination_iforest
-                )
-                stats_base = st.session_state.detector.cargar_historico(df)
-                st.session_state.resultados = st.session_state.detector.procesar_lote(df)
-                st.success(
-                    f"Isolation Forest recalculado (puntos={stats_base['puntos']}, "
-                    f"contamination={st.session_state.contamination_iforest:.3f})"
-                )
+            ejecutar_detector(algoritmo, recalculo=True)
 
     st.divider()
 
@@ -480,9 +576,10 @@ with st.sidebar:
         stats = det.get_estadisticas()
         col1, col2 = st.columns(2)
         with col1:
+            st.metric("Incidentes", stats["total_incidentes"])
             st.metric("Anomalías", stats["total_anomalias"])
         with col2:
-            st.metric("Puntos procesados", len(st.session_state.resultados))
+            st.metric("Puntos procesados", len(st.session_state.almacen))
 
 
 # ============================================================================
@@ -492,148 +589,272 @@ with st.sidebar:
 if st.session_state.df_cargado is None or st.session_state.detector is None:
     st.warning("👈 Carga un dataset en la barra lateral para comenzar.")
 else:
+    # plotly solo hace falta con resultados que pintar
+    import plotly.graph_objects as go
+
     df = st.session_state.df_cargado
-    resultados = st.session_state.resultados
+    almacen = st.session_state.almacen
     detector = st.session_state.detector
 
-    df_res = pd.DataFrame(resultados)
-    if not df_res.empty:
-        df_res["timestamp"] = pd.to_datetime(df_res["timestamp"])
-
-    tab1, tab2, tab3, tab4 = st.tabs(
-        ["📊 Gráficos", "🔴 Anomalías", "📈 Análisis", "ℹ️ Información"]
+    tab1, tab2, tab3, tab4, tab5, tab6 = st.tabs(
+        [
+            "📊 Gráficos",
+            "🔴 Anomalías",
+            "📈 Análisis",
+            "ℹ️ Información",
+            "📡 En vivo",
+            "⏱️ Rendimiento",
+        ]
     )
 
     # ---------- TAB 1: GRÁFICOS ----------
     with tab1:
         st.subheader("Intensidad de Tráfico con Anomalías")
 
-        if df_res.empty:
+        if len(almacen) == 0:
             st.info("No hay resultados aún.")
         else:
-            df_normales = df_res[~df_res["es_anomalia"]]
-            df_anom = df_res[df_res["es_anomalia"]]
-
-            fig = go.Figure()
-            fig.add_trace(
-                go.Scatter(
-                    x=df_normales["timestamp"],
-                    y=df_normales["intensity"],
-                    name="Intensidad (Normal)",
-                    mode="lines",
-                    line=dict(color="#1f77b4", width=1),
+            # rango visible: solo se leen del almacén los días que toca
+            t_ini = almacen.primero.to_pydatetime()
+            t_fin = almacen.ultimo.to_pydatetime()
+            if t_ini < t_fin:
+                rango = st.slider(
+                    "Rango visible:",
+                    min_value=t_ini,
+                    max_value=t_fin,
+                    value=(t_ini, t_fin),
+                    format="YYYY-MM-DD HH:mm",
                 )
-            )
-            if len(df_anom) > 0:
+            else:
+                rango = (t_ini, t_fin)
+
+            # como mucho unos miles de puntos por traza; las anomalías se pintan todas
+            with crono_app.etapa("graficos"):
+                # el baseline se pinta como curva con MAD estacional o con derivas
+                con_expected = isinstance(detector, TrafficAnomalyDetectorMADEstacional) or (
+                    isinstance(detector, TrafficAnomalyDetectorMAD)
+                    and bool(detector.eventos_deriva)
+                )
+                df_int, df_exp, df_score, nota = series_visibles(
+                    almacen, *rango, con_expected=con_expected
+                )
+                if nota:
+                    st.caption(nota)
+                # incidentes del rango visible: búsqueda binaria en el índice
+                df_inc = detector.incidentes.solapados(*rango)
+
+                fig = go.Figure()
                 fig.add_trace(
                     go.Scatter(
-                        x=df_anom["timestamp"],
-                        y=df_anom["intensity"],
-                        name="Anomalías",
-                        mode="markers",
-                        marker=dict(
-                            size=9,
-                            color="red",
-                            symbol="x",
-                            line=dict(color="darkred", width=1),
-                        ),
+                        x=df_int["timestamp"],
+                        y=df_int["intensity"],
+                        name="Intensidad",
+                        mode="lines",
+                        line=dict(color="#1f77b4", width=1),
                     )
                 )
-
-            # Si es MAD, pintamos baseline y bandas
-            if isinstance(detector, TrafficAnomalyDetectorMAD):
-                if detector.baseline_med is not None:
-                    fig.add_hline(
-                        y=detector.baseline_med,
-                        line_dash="dash",
-                        line_color="green",
-                        annotation_text=f"Baseline {detector.baseline_med:.0f}",
-                        annotation_position="right",
+                if len(df_inc) > 0:
+                    # un marcador por incidente, en su pico
+                    fig.add_trace(
+                        go.Scatter(
+                            x=df_inc["pico"],
+                            y=df_inc["intensity_pico"],
+                            name="Incidentes (pico)",
+                            mode="markers",
+                            marker=dict(
+                                size=11,
+                                color="red",
+                                symbol="x",
+                                line=dict(color="darkred", width=1),
+                            ),
+                            customdata=np.column_stack(
+                                [
+                                    df_inc["inicio"].dt.strftime("%Y-%m-%d %H:%M"),
+                                    df_inc["fin"].dt.strftime("%Y-%m-%d %H:%M"),
+                                    df_inc["duracion_min"],
+                                    df_inc["score_max"],
+                                ]
+                            ),
+                            hovertemplate=(
+                                "%{customdata[0]} → %{customdata[1]}<br>"
+                                "%{customdata[2]:.0f} min, score máx %{customdata[3]:.2f}"
+                                "<extra></extra>"
+                            ),
+                        )
                     )
-                    thr = st.session_state.threshold_actual
-                    fig.add_hline(
-                        y=detector.baseline_med + thr * detector.baseline_mad,
-                        line_dash="dot",
-                        line_color="orange",
-                        opacity=0.5,
+                    if len(df_inc) <= MAX_BANDAS_INCIDENTES:
+                        for inc in df_inc.itertuples():
+                            fig.add_vrect(
+                                x0=inc.inicio,
+                                x1=inc.fin,
+                                fillcolor="red",
+                                opacity=0.12,
+                                line_width=0,
+                            )
+
+                # Si es MAD estacional, el baseline cambia por franja: lo pintamos como curva
+                if isinstance(detector, TrafficAnomalyDetectorMADEstacional):
+                    fig.add_trace(
+                        go.Scatter(
+                            x=df_exp["timestamp"],
+                            y=df_exp["expected"],
+                            name="Baseline por franja",
+                            mode="lines",
+                            line=dict(color="green", width=1, dash="dash"),
+                        )
                     )
-                    fig.add_hline(
-                        y=detector.baseline_med - thr * detector.baseline_mad,
-                        line_dash="dot",
-                        line_color="orange",
-                        opacity=0.5,
+                # Con derivas confirmadas el baseline cambia a tramos
+                elif isinstance(detector, TrafficAnomalyDetectorMAD) and detector.eventos_deriva:
+                    fig.add_trace(
+                        go.Scatter(
+                            x=df_exp["timestamp"],
+                            y=df_exp["expected"],
+                            name="Baseline",
+                            mode="lines",
+                            line=dict(color="green", width=1, dash="dash", shape="hv"),
+                        )
                     )
-
-            fig.update_layout(
-                title=f"Intensidad - Algoritmo: {st.session_state.algoritmo}",
-                xaxis_title="Tiempo",
-                yaxis_title="Intensidad (veh/min)",
-                hovermode="x unified",
-                height=500,
-                template="plotly_white",
-            )
-            st.plotly_chart(fig, use_container_width=True)
+                    for evento in detector.eventos_deriva:
+                        fig.add_vline(x=evento["timestamp"], line_dash="dot", line_color="gray")
+                # Si es MAD, pintamos baseline y bandas
+                elif isinstance(detector, TrafficAnomalyDetectorMAD):
+                    if detector.baseline_med is not None:
+                        fig.add_hline(
+                            y=detector.baseline_med,
+                            line_dash="dash",
+                            line_color="green",
+                            annotation_text=f"Baseline {detector.baseline_med:.0f}",
+                            annotation_position="right",
+                        )
+                        thr = st.session_state.threshold_actual
+                        fig.add_hline(
+                            y=detector.baseline_med + thr * detector.baseline_mad,
+                            line_dash="dot",
+                            line_color="orange",
+                            opacity=0.5,
+                        )
+                        fig.add_hline(
+                            y=detector.baseline_med - thr * detector.baseline_mad,
+                            line_dash="dot",
+                            line_color="orange",
+                            opacity=0.5,
+                        )
+
+                fig.update_layout(
+                    title=f"Intensidad - Algoritmo: {st.session_state.algoritmo}",
+                    xaxis_title="Tiempo",
+                    yaxis_title="Intensidad (veh/min)",
+                    hovermode="x unified",
+                    height=500,
+                    template="plotly_white",
+                )
+            with crono_app.etapa("plotly"):
+                st.plotly_chart(fig, use_container_width=True)
 
             # Score
             st.subheader("Score de Anomalía")
 
-            fig2 = go.Figure()
-            fig2.add_trace(
-                go.Scatter(
-                    x=df_res["timestamp"],
-                    y=df_res["score"],
-                    name="Score",
-                    mode="lines",
-                    line=dict(color="purple", width=2),
-                    fill="tozeroy",
+            with crono_app.etapa("graficos"):
+                fig2 = go.Figure()
+                fig2.add_trace(
+                    go.Scatter(
+                        x=df_score["timestamp"],
+                        y=df_score["score"],
+                        name="Score",
+                        mode="lines",
+                        line=dict(color="purple", width=2),
+                        fill="tozeroy",
+                    )
                 )
-            )
 
-            if isinstance(detector, TrafficAnomalyDetectorMAD):
-                thr = st.session_state.threshold_actual
-                fig2.add_hline(
-                    y=thr,
-                    line_dash="dash",
-                    line_color="red",
-                    annotation_text=f"Threshold {thr:.1f} MADs",
-                    annotation_position="right",
+                if isinstance(detector, TrafficAnomalyDetectorMAD):
+                    thr = st.session_state.threshold_actual
+                    fig2.add_hline(
+                        y=thr,
+                        line_dash="dash",
+                        line_color="red",
+                        annotation_text=f"Threshold {thr:.1f} MADs",
+                        annotation_position="right",
+                    )
+                    y_title = "Score (MADs desde baseline)"
+                elif isinstance(detector, TrafficAnomalyDetectorEnsemble):
+                    fig2.add_hline(
+                        y=detector.umbral,
+                        line_dash="dash",
+                        line_color="red",
+                        annotation_text="Umbral",
+                        annotation_position="right",
+                    )
+                    y_title = "Score calibrado (1 = umbral de cada modelo)"
+                else:
+                    y_title = "Score normalizado (0 normal, 1 muy raro)"
+
+                fig2.update_layout(
+                    title="Score de Anomalía en el Tiempo",
+                    xaxis_title="Tiempo",
+                    yaxis_title=y_title,
+                    hovermode="x unified",
+                    height=400,
+                    template="plotly_white",
                 )
-                y_title = "Score (MADs desde baseline)"
-            else:
-                y_title = "Score normalizado (0 normal, 1 muy raro)"
-
-            fig2.update_layout(
-                title="Score de Anomalía en el Tiempo",
-                xaxis_title="Tiempo",
-                yaxis_title=y_title,
-                hovermode="x unified",
-                height=400,
-                template="plotly_white",
-            )
-            st.plotly_chart(fig2, use_container_width=True)
+            with crono_app.etapa("plotly"):
+                st.plotly_chart(fig2, use_container_width=True)
 
     # ---------- TAB 2: ANOMALÍAS ----------
     with tab2:
-        st.subheader("Detalle de Anomalías")
-        if detector.anomalias_detectadas:
-            df_anom = pd.DataFrame(detector.anomalias_detectadas)
-            df_anom["timestamp"] = pd.to_datetime(df_anom["timestamp"])
+        st.subheader("Incidentes")
+        # los días sin anomalías no se leen del almacén
+        df_anom = almacen.anomalias()
+        if not df_anom.empty:
+            df_inc = detector.incidentes.a_dataframe()
+            st.caption(
+                f"{len(df_inc)} incidentes: {len(df_anom)} minutos anómalos agrupados "
+                f"con huecos de hasta {detector.incidentes.hueco_minutos} min."
+            )
             st.dataframe(
-                df_anom[["timestamp", "intensity", "score", "confianza"]]
+                df_inc[["inicio", "fin", "duracion_min", "puntos", "score_max", "intensity_pico"]]
                 .assign(
-                    timestamp=lambda x: x["timestamp"].dt.strftime(
-                        "%Y-%m-%d %H:%M"
-                    ),
-                    intensity=lambda x: x["intensity"].round(1),
-                    score=lambda x: x["score"].round(3),
-                    confianza=lambda x: (
-                        x["confianza"] * 100
-                    ).round(0).astype(int).astype(str)
-                    + "%",
+                    inicio=lambda x: x["inicio"].dt.strftime("%Y-%m-%d %H:%M"),
+                    fin=lambda x: x["fin"].dt.strftime("%Y-%m-%d %H:%M"),
+                    duracion_min=lambda x: x["duracion_min"].round(0).astype(int),
+                    score_max=lambda x: x["score_max"].round(3),
+                    intensity_pico=lambda x: x["intensity_pico"].round(1),
                 ),
                 use_container_width=True,
                 hide_index=True,
             )
+
+            with st.expander("Minutos anómalos"):
+                st.dataframe(
+                    df_anom[["timestamp", "intensity", "score", "confianza"]]
+                    .assign(
+                        timestamp=lambda x: x["timestamp"].dt.strftime(
+                            "%Y-%m-%d %H:%M"
+                        ),
+                        intensity=lambda x: x["intensity"].round(1),
+                        score=lambda x: x["score"].round(3),
+                        confianza=lambda x: (
+                            x["confianza"] * 100
+                        ).round(0).astype(int).astype(str)
+                        + "%",
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+
+            # agregados diarios del almacén: no se recorre ningún minuto
+            st.subheader("Anomalías por día")
+            df_dia = almacen.resumen("D")
+            fig_dia = go.Figure(
+                go.Bar(x=df_dia.index, y=df_dia["anomalias"], marker_color="indianred")
+            )
+            fig_dia.update_layout(
+                xaxis_title="Día",
+                yaxis_title="Minutos anómalos",
+                height=300,
+                template="plotly_white",
+            )
+            st.plotly_chart(fig_dia, use_container_width=True)
         else:
             st.info("No se han detectado anomalías.")
 
@@ -648,6 +869,47 @@ else:
             with col2:
                 st.metric("Threshold", f"{st.session_state.threshold_actual:.1f} MADs")
                 st.metric("Ventana", f"{st.session_state.window_days} días")
+
+            if detector.eventos_deriva:
+                st.subheader("Cambios de régimen confirmados")
+                st.dataframe(
+                    pd.DataFrame(list(detector.eventos_deriva)).round(
+                        {"mediana_anterior": 1, "mediana_nueva": 1, "mad_nuevo": 2}
+                    ),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+
+            # el barrido es del MAD univariante sobre intensity
+            if type(detector) is TrafficAnomalyDetectorMAD and detector.deriva is None:
+                st.subheader("Sensibilidad: anomalías por ventana y threshold")
+                conteos = obtener_barrido().conteos
+                fig3 = go.Figure(
+                    go.Heatmap(
+                        z=conteos.values,
+                        x=conteos.columns,
+                        y=conteos.index,
+                        colorscale="Reds",
+                        colorbar=dict(title="Anomalías"),
+                    )
+                )
+                fig3.update_layout(
+                    xaxis_title="Threshold (MADs)",
+                    yaxis_title="Ventana (días)",
+                    height=400,
+                    template="plotly_white",
+                )
+                st.plotly_chart(fig3, use_container_width=True)
+        elif isinstance(detector, TrafficAnomalyDetectorEnsemble):
+            por_componente = detector.get_estadisticas()["anomalias_por_componente"]
+            col1, col2, col3 = st.columns(3)
+            col1.metric("Sobre umbral: MAD", por_componente["mad"])
+            col2.metric("Sobre umbral: Isolation Forest", por_componente["iforest"])
+            col3.metric("Ensemble", detector.anomalias_detectadas.total)
+            st.caption(
+                f"Combinación **{detector.modo}**; los tiempos de cada modelo están en "
+                "la pestaña Rendimiento (`entrenamiento.*`, `puntuacion.*`)."
+            )
         else:
             st.write(
                 f"Isolation Forest con contamination={st.session_state.contamination_iforest:.3f}."
@@ -665,6 +927,25 @@ else:
 - Mide cuánto se aleja cada punto usando MAD (mediana de las desviaciones absolutas).
 - Marca como anomalías los puntos cuya desviación supera un umbral en MADs.
 - Usa solo los últimos *N días* seleccionados para calcular el baseline.
+"""
+            )
+            if isinstance(detector, TrafficAnomalyDetectorMADEstacional):
+                st.markdown(
+                    f"""
+**Variante estacional:** mediana y MAD por franja de {detector.bucket_minutos} minutos
+({detector.n_slots} franjas por {"semana" if detector.semanal else "día"}), de modo que
+las horas punta normales no se marcan como anomalías.
+"""
+                )
+        elif isinstance(detector, TrafficAnomalyDetectorEnsemble):
+            st.markdown(
+                """
+**Ensemble MAD + Isolation Forest**
+
+- Ordena el dataset y calcula las features una sola vez para los dos modelos.
+- Entrena y puntúa MAD e Isolation Forest a la vez, en hilos separados.
+- Lleva los dos scores a una escala común: 0 es lo típico y 1 el umbral de cada modelo.
+- Combina por media ponderada o por votos (*cualquiera* / *todos*).
 """
             )
         else:
@@ -679,6 +960,122 @@ else:
 """
             )
 
+    # ---------- TAB 5: EN VIVO ----------
+    with tab5:
+        st.subheader("Servicio de ingesta en vivo")
+        vivo = st.session_state.servicio_vivo
+
+        if vivo is None:
+            st.markdown(
+                "Arranca un servicio TCP local que puntúa los puntos que le lleguen "
+                "con una copia del detector actual. Para probarlo:  \n"
+                f"`python servicio.py reproducir datos_trafico/trafico_ultimas_24h.csv "
+                f"--puerto {PUERTO} --velocidad 60`"
+            )
+            if st.button("▶️ Arrancar servicio", key="btn_vivo_on"):
+                try:
+                    # el detector cacheado es compartido: el servicio usa una copia
+                    servicio = ServicioIngesta(copy.deepcopy(detector))
+                    cola = servicio.suscribir()
+                    puerto = arrancar_en_hilo(servicio, puerto=PUERTO)
+                    st.session_state.servicio_vivo = (servicio, cola, puerto)
+                    st.session_state.anomalias_vivo = []
+                    st.rerun()
+                except OSError as e:
+                    st.error(f"❌ No se pudo abrir el puerto {PUERTO}: {e}")
+        else:
+            servicio, cola, puerto = vivo
+            # el dashboard sondea: cada rerun recoge lo publicado desde el anterior
+            nuevas = sondear(cola)
+            st.session_state.anomalias_vivo = (st.session_state.anomalias_vivo + nuevas)[-1000:]
+            stats_vivo = servicio.estadisticas()
+
+            st.caption(f"Escuchando en 127.0.0.1:{puerto}")
+            col1, col2, col3, col4 = st.columns(4)
+            col1.metric("Puntos recibidos", stats_vivo["puntos_recibidos"])
+            col2.metric("Pendientes", stats_vivo["pendientes"])
+            col3.metric("Lotes", stats_vivo["lotes"])
+            col4.metric("Anomalías", stats_vivo["anomalias"])
+
+            col_a, col_b = st.columns(2)
+            with col_a:
+                st.button("🔄 Actualizar", key="btn_vivo_refresh")
+            with col_b:
+                if st.button("⏹️ Detener servicio", key="btn_vivo_off"):
+                    detener_en_hilo(servicio)
+                    st.session_state.servicio_vivo = None
+                    st.rerun()
+
+            if st.session_state.anomalias_vivo:
+                st.dataframe(
+                    pd.DataFrame(st.session_state.anomalias_vivo)[
+                        ["timestamp", "intensity", "score", "confianza"]
+                    ].iloc[::-1],
+                    use_container_width=True,
+                    hide_index=True,
+                )
+            else:
+                st.info("Sin anomalías en vivo todavía.")
+
+    # ---------- TAB 6: RENDIMIENTO ----------
+    with tab6:
+        st.subheader("Rendimiento")
+        st.checkbox(
+            "Medir tiempos por etapa",
+            key="instrumentar",
+            help="Cronometra la app en cada rerun y los detectores que se entrenen desde ahora.",
+        )
+
+        if st.session_state.instrumentar:
+            st.markdown("**App (este rerun)**")
+            df_app = crono_app.a_dataframe()
+            if df_app.empty:
+                st.caption("Nada medido en este rerun.")
+            else:
+                st.dataframe(df_app.round(2), use_container_width=True)
+
+            st.markdown("**Detector (entrenamiento y puntuación)**")
+            rendimiento = detector.get_estadisticas()["rendimiento"]
+            if rendimiento["etapas"]:
+                df_det = pd.DataFrame.from_dict(rendimiento["etapas"], orient="index")
+                st.dataframe(df_det.round(2), use_container_width=True)
+                st.caption(f"Contadores: {rendimiento['contadores']}")
+            else:
+                st.caption(
+                    "El detector actual se entrenó sin medir (viene de la caché): "
+                    "cambia algún parámetro o perfila una ejecución."
+                )
+        else:
+            st.info("Activa la medición para ver los tiempos de carga, detector y gráficos.")
+
+        st.divider()
+        st.markdown("**Perfilar una ejecución**")
+        st.caption(
+            "Entrena y puntúa una vez el detector actual, sin caché, con cProfile y "
+            "tracemalloc (tracemalloc la hace bastante más lenta)."
+        )
+        if st.button("🔬 Perfilar", key="btn_perfilar"):
+            (det_perfil, _, _), informe = perfilar(
+                construir_detector, st.session_state.algoritmo, instrumentar=True
+            )
+            informe["etapas"] = det_perfil.cronometro.a_dataframe()
+            st.session_state.perfil = informe
+
+        informe = st.session_state.perfil
+        if informe is not None:
+            col1, col2 = st.columns(2)
+            col1.metric("Tiempo total", f"{informe['segundos']:.2f} s")
+            col2.metric("Pico de memoria", f"{informe['memoria_pico_mb']:.1f} MB")
+            st.dataframe(informe["etapas"].round(2), use_container_width=True)
+            with st.expander("Funciones (tiempo acumulado)"):
+                st.code(informe["perfil"], language=None)
+            with st.expander("Memoria por línea"):
+                st.dataframe(
+                    informe["asignaciones"].round(1),
+                    use_container_width=True,
+                    hide_index=True,
+                )
+
 # ============================================================================
 # FOOTER: DESCRIPCIÓN RESUMIDA DEL ALGORITMO SELECCIONADO
 # ============================================================================
@@ -690,6 +1087,11 @@ if st.session_state.algoritmo.startswith("MAD"):
         "MAD con ventana deslizante: baseline robusto por mediana, "
         "ventana temporal configurable y umbral en MADs."
     )
+elif st.session_state.algoritmo == ENSEMBLE:
+    desc_corta = (
+        "Ensemble: MAD e Isolation Forest sobre la misma pasada de los datos, "
+        "con scores calibrados y combinados por peso o por votos."
+    )
 else:
     desc_corta = (
         "Isolation Forest: bosque de árboles que aísla puntos raros; "
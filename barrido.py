@@ -0,0 +1,117 @@
+"""
+Barrido de parámetros del detector MAD (ventana × threshold).
+
+El threshold solo cambia la comparación, no el score: cada ventana se
+puntúa una vez y todos los thresholds se evalúan contra ese array. Las
+ventanas son sufijos anidados de la serie, así que se recorren de menor a
+mayor y el array ordenado de una se reutiliza para la siguiente, fusionando
+solo las filas nuevas.
+"""
+
+import numpy as np
+import pandas as pd
+
+from detectores import mad_ordenado, mediana_ordenada
+
+MIN_PUNTOS_VENTANA = 100  # mismo criterio que TrafficAnomalyDetectorMAD._filtrar_ventana
+
+
+class ResultadoBarrido:
+    """
+    Resultado de `barrer_parametros`.
+
+    - `conteos`: DataFrame window_days × threshold → anomalías.
+    - `baselines`: DataFrame con mediana, MAD y puntos de cada ventana.
+    - `scores[window_days]`: score de cada fila del DataFrame original.
+    - `etiquetas(window_days, threshold)`: máscara de anomalías de una combinación.
+    """
+
+    def __init__(self, ventanas, thresholds, scores, baselines, conteos):
+        self.ventanas = ventanas
+        self.thresholds = thresholds
+        self.scores = scores
+        self.baselines = baselines
+        self.conteos = conteos
+
+    def etiquetas(self, window_days, threshold) -> np.ndarray:
+        return self.scores[window_days] > threshold
+
+    def matriz_etiquetas(self) -> np.ndarray:
+        """Etiquetas de todas las combinaciones, forma (ventanas, thresholds, filas)."""
+        scores = np.stack([self.scores[w] for w in self.ventanas])
+        return scores[:, None, :] > np.asarray(self.thresholds)[None, :, None]
+
+    def anomalias(self, window_days, threshold) -> int:
+        """Número de anomalías; vale también para thresholds fuera de la rejilla."""
+        return int(np.count_nonzero(self.etiquetas(window_days, threshold)))
+
+
+def barrer_parametros(df: pd.DataFrame, ventanas, thresholds) -> ResultadoBarrido:
+    """
+    Evalúa el detector MAD para todas las combinaciones de ventana y threshold.
+
+    Da los mismos scores y etiquetas que crear un `TrafficAnomalyDetectorMAD`
+    por combinación y llamar a `cargar_historico(df)` + `procesar_lote(df)`.
+    """
+    ventanas = sorted(set(ventanas))
+    thresholds = np.asarray(sorted(set(thresholds)), dtype=float)
+
+    ts = pd.DatetimeIndex(pd.to_datetime(df["timestamp"]))
+    intensity = df["intensity"].to_numpy(dtype=float)
+    orden = np.argsort(ts, kind="stable")
+    ts_ord = ts[orden]
+    x_ord = intensity[orden]
+    n = len(x_ord)
+
+    # inicio efectivo de cada ventana; con el mínimo de puntos, una ventana
+    # pequeña puede acabar usando toda la serie, así que se ordena por inicio
+    inicios = {}
+    for w in ventanas:
+        ini = int(ts_ord.searchsorted(ts_ord[-1] - pd.Timedelta(days=w))) if n else 0
+        inicios[w] = 0 if n - ini < MIN_PUNTOS_VENTANA else ini
+
+    scores = {}
+    baselines = {}
+    conteos = {}
+
+    ordenado = np.empty(0)
+    ini_prev = n
+    for w in sorted(ventanas, key=lambda v: -inicios[v]):
+        ini = inicios[w]
+        if n == 0:
+            scores[w] = np.empty(0)
+            baselines[w] = (np.nan, np.nan, 0)
+            conteos[w] = np.zeros(len(thresholds), dtype=np.int64)
+            continue
+
+        # fusión de lo ya ordenado con las filas nuevas (timsort: dos tramos, O(n))
+        if ini < ini_prev:
+            ordenado = np.concatenate([np.sort(x_ord[ini:ini_prev]), ordenado])
+            ordenado.sort(kind="stable")
+            ini_prev = ini
+
+        med = mediana_ordenada(ordenado)
+        mad = mad_ordenado(ordenado, med, int(np.searchsorted(ordenado, med)))
+        if not mad > 0:
+            mad = np.std(x_ord[ini:])
+
+        score = np.abs((intensity - med) / mad)
+        scores[w] = score
+        baselines[w] = (med, mad, len(ordenado))
+
+        # anomalías = score > th: una búsqueda binaria por threshold
+        score_ord = np.sort(score)
+        conteos[w] = n - np.searchsorted(score_ord, thresholds, side="right")
+
+    df_baselines = pd.DataFrame(
+        [baselines[w] for w in ventanas],
+        index=pd.Index(ventanas, name="window_days"),
+        columns=["mediana", "mad", "puntos"],
+    )
+    df_conteos = pd.DataFrame(
+        np.stack([conteos[w] for w in ventanas]),
+        index=pd.Index(ventanas, name="window_days"),
+        columns=pd.Index(thresholds, name="threshold"),
+    )
+
+    return ResultadoBarrido(ventanas, thresholds, scores, df_baselines, df_conteos)
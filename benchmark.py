@@ -0,0 +1,519 @@
+"""
+Benchmarks de los detectores.
+
+Mide, para cada detector:
+- `ajuste_s`: tiempo de `cargar_historico` (entrenamiento del bosque en IF).
+- `lote_puntos_s`: throughput de `procesar_lote`.
+- `latencia_p50_us` / `latencia_p99_us`: latencia de `procesar_punto`.
+- `rss_pico_mb`: pico de memoria residente del proceso que ejecuta el caso.
+
+Casos:
+- los cinco escenarios de `datos_trafico` (histórico = dataset completo,
+  igual que la app),
+- series sintéticas de un sensor de `--puntos` puntos, puntuadas por bloques,
+- flotas sintéticas de `--sensores` sensores con `TrafficAnomalyDetectorFlota`
+  y su ventana por defecto (`--dias-flota` para otra), con el tamaño del
+  estado (`estado_mb`) junto al pico de RSS,
+- arranque en frío: `import` de los módulos de `MODULOS_ARRANQUE` y un
+  trabajo de la CLI con MAD, cada uno en un intérprete nuevo (`arranque_s`,
+  mediana de `--repeticiones-arranque`; `importacion_s` según
+  `python -X importtime`, y qué módulos pesados acaban cargados).
+
+Cada caso corre en un proceso nuevo para que el pico de RSS sea solo suyo.
+El resultado se guarda como JSON (con commit y entorno) para comparar entre
+versiones con `--comparar`.
+
+Uso:
+    python benchmark.py
+    python benchmark.py --puntos 1e6 1e7 1e8 --sensores 1000 10000
+    python benchmark.py --solo-arranque
+    python benchmark.py --comparar benchmarks/antes.json benchmarks/despues.json
+"""
+
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import numpy as np
+import pandas as pd
+
+_DATOS = os.path.join(os.path.dirname(os.path.abspath(__file__)), "datos_trafico")
+ESCENARIOS = {
+    "normal": os.path.join(_DATOS, "trafico_normal.csv"),
+    "incidencias": os.path.join(_DATOS, "trafico_con_incidencias.csv"),
+    "cambio_gradual": os.path.join(_DATOS, "trafico_cambio_gradual.csv"),
+    "ruido_alto": os.path.join(_DATOS, "trafico_ruido_alto.csv"),
+    "ultimas_24h": os.path.join(_DATOS, "trafico_ultimas_24h.csv"),
+}
+DETECTORES = (
+    "mad",
+    "mad-movil",
+    "mad-estacional",
+    "mad-multivariante",
+    "iforest",
+    "iforest-online",
+    "ensemble",
+)
+# los que no tienen bucle por punto en procesar_lote: aguantan 1e8 puntos
+DETECTORES_SINTETICOS = ("mad", "mad-estacional", "iforest")
+N_LATENCIA = 2000
+MODULOS_ARRANQUE = ("detectores", "main", "servicio")
+# dependencias que solo deberían cargarse en los caminos que las usan
+MODULOS_PESADOS = ("sklearn", "joblib", "plotly", "streamlit")
+REPETICIONES_ARRANQUE = 5
+TAM_BLOQUE = 1_000_000
+DIRECTORIO = "benchmarks"
+
+
+def crear_detector(nombre):
+    from detectores import (
+        TrafficAnomalyDetectorEnsemble,
+        TrafficAnomalyDetectorIForest,
+        TrafficAnomalyDetectorIForestOnline,
+        TrafficAnomalyDetectorMAD,
+        TrafficAnomalyDetectorMADEstacional,
+        TrafficAnomalyDetectorMADMultivariante,
+    )
+
+    if nombre == "mad":
+        return TrafficAnomalyDetectorMAD()
+    if nombre == "mad-movil":
+        return TrafficAnomalyDetectorMAD(ventana_movil=True)
+    if nombre == "mad-estacional":
+        return TrafficAnomalyDetectorMADEstacional()
+    if nombre == "mad-multivariante":
+        return TrafficAnomalyDetectorMADMultivariante()
+    if nombre == "iforest":
+        return TrafficAnomalyDetectorIForest()
+    if nombre == "iforest-online":
+        return TrafficAnomalyDetectorIForestOnline()
+    if nombre == "ensemble":
+        return TrafficAnomalyDetectorEnsemble()
+    raise ValueError(f"Detector desconocido: {nombre}")
+
+
+# ============================================================================
+# MEDICIONES (se ejecutan en el proceso hijo)
+# ============================================================================
+
+
+def _rss_pico_mb():
+    # ru_maxrss viene en KB en Linux y en bytes en macOS
+    pico = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return pico / (2**20 if sys.platform == "darwin" else 2**10)
+
+
+def _latencias(detector, df, n):
+    """Latencia de `procesar_punto` sobre las primeras `n` filas de `df`."""
+    if not hasattr(detector, "procesar_punto"):
+        return {}
+    filas = df.iloc[:n]
+    tiempos = np.empty(len(filas))
+    reloj = time.perf_counter_ns
+    for i, (ts, x) in enumerate(zip(filas["timestamp"], filas["intensity"].to_numpy())):
+        t0 = reloj()
+        detector.procesar_punto(ts, x)
+        tiempos[i] = reloj() - t0
+    if not len(tiempos):
+        return {}
+    tiempos /= 1000.0
+    return {
+        "latencia_p50_us": float(np.percentile(tiempos, 50)),
+        "latencia_p99_us": float(np.percentile(tiempos, 99)),
+        "punto_puntos_s": float(len(tiempos) / (tiempos.sum() / 1e6)),
+    }
+
+
+def medir_escenario(escenario, nombre, n_latencia=N_LATENCIA):
+    from ingesta import cargar_dataset
+
+    t0 = time.perf_counter()
+    df = cargar_dataset(ESCENARIOS[escenario]).a_dataframe()
+    carga_s = time.perf_counter() - t0
+
+    detector = crear_detector(nombre)
+    t0 = time.perf_counter()
+    detector.cargar_historico(df)
+    ajuste_s = time.perf_counter() - t0
+
+    t0 = time.perf_counter()
+    df_res = detector.procesar_lote(df)
+    lote_s = time.perf_counter() - t0
+
+    res = {
+        "caso": f"escenario/{escenario}",
+        "detector": nombre,
+        "puntos": len(df),
+        "carga_s": carga_s,
+        "ajuste_s": ajuste_s,
+        "lote_s": lote_s,
+        "lote_puntos_s": len(df) / lote_s if lote_s > 0 else None,
+        "anomalias": int(df_res["es_anomalia"].sum()),
+    }
+
+    detector = crear_detector(nombre)
+    detector.cargar_historico(df)
+    res.update(_latencias(detector, df, n_latencia))
+    res["rss_pico_mb"] = _rss_pico_mb()
+    return res
+
+
+def medir_sintetico(n_puntos, nombre, tam_bloque=TAM_BLOQUE, n_latencia=N_LATENCIA):
+    """Un sensor: histórico de la ventana del detector y luego `n_puntos` por bloques."""
+    from generador import bloques_sinteticos, generar_serie
+
+    detector = crear_detector(nombre)
+    dias = getattr(detector, "window_days", 42)
+    historico = generar_serie(dias * 1440, semilla=0)
+
+    t0 = time.perf_counter()
+    detector.cargar_historico(historico)
+    ajuste_s = time.perf_counter() - t0
+
+    inicio = historico["timestamp"].iloc[-1] + pd.Timedelta(minutes=1)
+    lote_s = 0.0
+    anomalias = 0
+    procesados = 0
+    primero = None
+    for bloque in bloques_sinteticos(n_puntos, tam_bloque, inicio=inicio, semilla=1):
+        if primero is None:
+            primero = bloque.iloc[:n_latencia]
+        t0 = time.perf_counter()
+        df_res = detector.procesar_lote(bloque)
+        lote_s += time.perf_counter() - t0
+        anomalias += int(df_res["es_anomalia"].sum())
+        procesados += len(bloque)
+
+    res = {
+        "caso": f"sintetico/{n_puntos}",
+        "detector": nombre,
+        "puntos": procesados,
+        "ajuste_s": ajuste_s,
+        "lote_s": lote_s,
+        "lote_puntos_s": procesados / lote_s if lote_s > 0 else None,
+        "anomalias": anomalias,
+    }
+    if primero is not None:
+        res.update(_latencias(detector, primero, n_latencia))
+    res["rss_pico_mb"] = _rss_pico_mb()
+    return res
+
+
+def medir_flota(
+    n_sensores, window_days=None, minutos=60, minutos_historico=120, minutos_por_lote=1
+):
+    """
+    Flota de `n_sensores`: histórico corto y lotes de un minuto para todos.
+
+    La ventana es la del detector (`window_days=None`, 42 días): el estado
+    sensor × minuto de la ventana ocupa `estado_mb` aunque el histórico sea
+    corto, y el pico de RSS lo incluye.
+    """
+    from detectores import TrafficAnomalyDetectorFlota
+    from generador import bloques_sinteticos
+
+    bloques = bloques_sinteticos(
+        (minutos_historico + minutos) * n_sensores,
+        tam_bloque=minutos_por_lote * n_sensores,
+        semilla=0,
+        n_sensores=n_sensores,
+        con_sensor_id=True,
+    )
+    historico = pd.concat(
+        [next(bloques) for _ in range(max(1, minutos_historico // minutos_por_lote))],
+        ignore_index=True,
+    )
+
+    params = {} if window_days is None else {"window_days": window_days}
+    detector = TrafficAnomalyDetectorFlota(**params)
+    t0 = time.perf_counter()
+    detector.cargar_historico(historico)
+    ajuste_s = time.perf_counter() - t0
+
+    tiempos = []
+    procesados = 0
+    for bloque in bloques:
+        t0 = time.perf_counter()
+        detector.procesar_lote(bloque)
+        tiempos.append(time.perf_counter() - t0)
+        procesados += len(bloque)
+
+    tiempos = np.asarray(tiempos)
+    lote_s = float(tiempos.sum())
+    return {
+        "caso": f"flota/{n_sensores}",
+        "detector": "flota",
+        "puntos": procesados,
+        "sensores": n_sensores,
+        "window_days": detector.window_days,
+        "estado_mb": detector._valores.nbytes / 2**20,
+        "ajuste_s": ajuste_s,
+        "lote_s": lote_s,
+        "lote_puntos_s": procesados / lote_s if lote_s > 0 else None,
+        "lote_p50_ms": float(np.percentile(tiempos, 50) * 1000) if len(tiempos) else None,
+        "lote_p99_ms": float(np.percentile(tiempos, 99) * 1000) if len(tiempos) else None,
+        "anomalias": int(detector.get_estadisticas()["total_anomalias"]),
+        "rss_pico_mb": _rss_pico_mb(),
+    }
+
+
+def _importtime(stderr):
+    """{módulo: segundos acumulados} de la salida de `python -X importtime`."""
+    tiempos = {}
+    for linea in stderr.splitlines():
+        if not linea.startswith("import time:"):
+            continue
+        _, acumulado, modulo = linea[len("import time:") :].split("|")
+        try:
+            tiempos[modulo.strip()] = int(acumulado) / 1e6
+        except ValueError:  # cabecera
+            continue
+    return tiempos
+
+
+def medir_arranque(caso, repeticiones=REPETICIONES_ARRANQUE):
+    """
+    Arranque en frío en un intérprete nuevo, `repeticiones` veces.
+
+    `caso` es `import/<módulo>` o `cli/mad` (`main.py` sobre el escenario
+    normal con MAD, salida a un directorio temporal).
+    """
+    raiz = os.path.dirname(os.path.abspath(__file__))
+    tipo, objetivo = caso.split("/", 1)
+    salida = None
+    if tipo == "import":
+        comando = ["-c", f"import {objetivo}"]
+    elif caso == "cli/mad":
+        salida = tempfile.mkdtemp(prefix="arranque_")
+        comando = [
+            os.path.join(raiz, "main.py"),
+            ESCENARIOS["normal"],
+            "--algoritmo",
+            "mad",
+            "--salida",
+            salida,
+        ]
+    else:
+        raise ValueError(f"Caso de arranque desconocido: {caso}")
+
+    tiempos = []
+    modulos = {}
+    for _ in range(repeticiones):
+        t0 = time.perf_counter()
+        proceso = subprocess.run(
+            [sys.executable, "-X", "importtime", *comando],
+            cwd=raiz,
+            capture_output=True,
+            text=True,
+            check=True,
+        )
+        tiempos.append(time.perf_counter() - t0)
+        modulos = _importtime(proceso.stderr)
+    if salida is not None:
+        shutil.rmtree(salida, ignore_errors=True)
+
+    return {
+        "caso": f"arranque/{caso}",
+        "detector": objetivo if tipo == "cli" else "-",
+        "arranque_s": float(np.median(tiempos)),
+        "arranque_min_s": float(np.min(tiempos)),
+        "importacion_s": modulos.get(objetivo) if tipo == "import" else None,
+        "pesados": [m for m in MODULOS_PESADOS if m in modulos],
+    }
+
+
+# ============================================================================
+# EJECUCIÓN Y RESULTADOS
+# ============================================================================
+
+
+def _en_proceso_nuevo(funcion, *args):
+    contexto = multiprocessing.get_context("spawn")
+    with ProcessPoolExecutor(max_workers=1, mp_context=contexto) as pool:
+        return pool.submit(funcion, *args).result()
+
+
+def _entorno():
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+
+    import sklearn
+
+    return {
+        "fecha": pd.Timestamp.now().isoformat(timespec="seconds"),
+        "commit": commit,
+        "python": platform.python_version(),
+        "numpy": np.__version__,
+        "pandas": pd.__version__,
+        "sklearn": sklearn.__version__,
+        "plataforma": platform.platform(),
+        "cpus": os.cpu_count(),
+    }
+
+
+def ejecutar(casos, aislar=True):
+    """Ejecuta `casos` (lista de (función, args)) y devuelve sus resultados."""
+    resultados = []
+    for funcion, args in casos:
+        t0 = time.perf_counter()
+        try:
+            if aislar:
+                res = _en_proceso_nuevo(funcion, *args)
+            else:
+                res = funcion(*args)
+        except Exception as e:
+            res = {"caso": f"{funcion.__name__}{args}", "error": str(e)}
+        resultados.append(res)
+        print(
+            f"{res.get('caso', '?'):<28} {res.get('detector', ''):<18} "
+            f"{_fmt(res.get('lote_puntos_s'))} pts/s  "
+            f"p99={_fmt(res.get('latencia_p99_us'))} us  "
+            f"rss={_fmt(res.get('rss_pico_mb'))} MB  "
+            + (f"arranque={res['arranque_s']:.2f} s  " if "arranque_s" in res else "")
+            + (
+                f"estado={_fmt(res['estado_mb'])} MB  lote_p99={_fmt(res['lote_p99_ms'])} ms  "
+                if "estado_mb" in res
+                else ""
+            )
+            + f"({time.perf_counter() - t0:.1f} s)"
+            + (f"  ❌ {res['error']}" if "error" in res else ""),
+            flush=True,
+        )
+    return resultados
+
+
+def _fmt(valor):
+    if valor is None:
+        return "-"
+    return f"{valor:,.0f}" if valor >= 100 else f"{valor:.2f}"
+
+
+def guardar(resultados, ruta=None):
+    entorno = _entorno()
+    if ruta is None:
+        os.makedirs(DIRECTORIO, exist_ok=True)
+        marca = entorno["fecha"].replace(":", "").replace("-", "")
+        ruta = os.path.join(DIRECTORIO, f"{marca}_{entorno['commit'] or 'local'}.json")
+    with open(ruta, "w") as f:
+        json.dump({"entorno": entorno, "resultados": resultados}, f, indent=2)
+    return ruta
+
+
+def comparar(ruta_antes, ruta_despues):
+    """Tabla con el cociente después/antes de las métricas principales por caso."""
+    with open(ruta_antes) as f:
+        antes = pd.DataFrame(json.load(f)["resultados"])
+    with open(ruta_despues) as f:
+        despues = pd.DataFrame(json.load(f)["resultados"])
+
+    claves = ["caso", "detector"]
+    metricas = [
+        m
+        for m in ("lote_puntos_s", "latencia_p99_us", "ajuste_s", "rss_pico_mb", "arranque_s")
+        if m in antes.columns and m in despues.columns
+    ]
+    tabla = antes[claves + metricas].merge(
+        despues[claves + metricas], on=claves, suffixes=("_antes", "_despues")
+    )
+    for m in metricas:
+        tabla[f"{m}_ratio"] = tabla[f"{m}_despues"] / tabla[f"{m}_antes"]
+    return tabla[claves + [f"{m}_ratio" for m in metricas]]
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Benchmarks de los detectores.")
+    parser.add_argument("--detectores", nargs="+", choices=DETECTORES, default=list(DETECTORES))
+    parser.add_argument(
+        "--escenarios", nargs="*", choices=list(ESCENARIOS), default=list(ESCENARIOS)
+    )
+    parser.add_argument(
+        "--puntos",
+        nargs="*",
+        type=float,
+        default=[1e6],
+        help="tamaños de serie sintética de un sensor (p. ej. 1e6 1e7 1e8)",
+    )
+    parser.add_argument(
+        "--sensores",
+        nargs="*",
+        type=int,
+        default=[1000],
+        help="tamaños de flota sintética (p. ej. 1000 10000)",
+    )
+    parser.add_argument(
+        "--dias-flota",
+        type=int,
+        default=None,
+        help="ventana de las flotas en días (por defecto la del detector, 42)",
+    )
+    parser.add_argument("--n-latencia", type=int, default=N_LATENCIA)
+    parser.add_argument("--repeticiones-arranque", type=int, default=REPETICIONES_ARRANQUE)
+    parser.add_argument(
+        "--solo-arranque",
+        action="store_true",
+        help="medir solo el arranque en frío (imports y CLI con MAD)",
+    )
+    parser.add_argument("--salida", default=None, help="JSON de salida")
+    parser.add_argument(
+        "--sin-aislar",
+        action="store_true",
+        help="ejecutar todo en este proceso (el pico de RSS se acumula)",
+    )
+    parser.add_argument(
+        "--comparar", nargs=2, metavar=("ANTES", "DESPUES"), help="comparar dos JSON"
+    )
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+
+    if args.comparar:
+        with pd.option_context("display.width", 200, "display.max_rows", None):
+            print(comparar(*args.comparar).to_string(index=False, float_format="%.2f"))
+        return 0
+
+    # el arranque va primero y sin aislar: ya lanza sus propios intérpretes
+    arranque = [
+        (medir_arranque, (caso, args.repeticiones_arranque))
+        for caso in [f"import/{m}" for m in MODULOS_ARRANQUE] + ["cli/mad"]
+    ]
+    casos = []
+    if not args.solo_arranque:
+        casos += [
+            (medir_escenario, (esc, det, args.n_latencia))
+            for esc in args.escenarios
+            for det in args.detectores
+        ]
+        casos += [
+            (medir_sintetico, (int(n), det, TAM_BLOQUE, args.n_latencia))
+            for n in args.puntos
+            for det in args.detectores
+            if det in DETECTORES_SINTETICOS
+        ]
+        casos += [(medir_flota, (n, args.dias_flota)) for n in args.sensores]
+
+    resultados = ejecutar(arranque, aislar=False)
+    resultados += ejecutar(casos, aislar=not args.sin_aislar)
+    print(f"Resultados en {guardar(resultados, args.salida)}")
+    return 1 if any("error" in r for r in resultados) else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,111 @@
+"""
+Features derivadas para los detectores multivariantes.
+
+`calcular_caracteristicas` construye, de forma vectorizada, una columna por
+feature a partir de `timestamp`, `intensity` y (si está) `occupancy`:
+
+- `intensity`, `occupancy`: valores en bruto.
+- `ratio`: intensity / occupancy (occupancy acotada por abajo).
+- `diff_<col>`: primera diferencia (0 en la primera fila).
+- `media_<col>`, `std_<col>`: media y desviación móviles de `ventana` filas.
+- `hora_sin`, `hora_cos`: minuto del día codificado en el círculo.
+
+`caracteristicas_cacheadas` memoriza el resultado por contenido del
+DataFrame, así que MAD e Isolation Forest reutilizan el mismo cálculo para
+un mismo dataset.
+"""
+
+import hashlib
+import threading
+from collections import OrderedDict
+
+import numpy as np
+import pandas as pd
+
+VENTANA_MOVIL = 15  # filas (minutos en los datasets incluidos)
+OCUPACION_MIN = 0.01  # evita ratios infinitos con occupancy = 0
+MAX_ENTRADAS_CACHE = 8
+
+_cache = OrderedDict()
+_lock = threading.Lock()
+
+
+def caracteristicas_disponibles(columnas):
+    """Nombres de features que se pueden calcular con las columnas dadas."""
+    base = [c for c in ("intensity", "occupancy") if c in columnas]
+    nombres = list(base)
+    if "occupancy" in base:
+        nombres.append("ratio")
+    nombres += [f"diff_{c}" for c in base]
+    nombres += [f"media_{c}" for c in base] + [f"std_{c}" for c in base]
+    nombres += ["hora_sin", "hora_cos"]
+    return nombres
+
+
+def calcular_caracteristicas(df: pd.DataFrame, ventana=VENTANA_MOVIL) -> pd.DataFrame:
+    """
+    Features de cada fila de `df`, con el mismo índice.
+
+    `df` debe venir ordenado por `timestamp`: diferencias y estadísticos
+    móviles se calculan en el orden de las filas.
+    """
+    ts = pd.DatetimeIndex(pd.to_datetime(df["timestamp"]))
+    base = [c for c in ("intensity", "occupancy") if c in df.columns]
+    valores = {c: df[c].to_numpy(dtype=float) for c in base}
+
+    feats = dict(valores)
+    if "occupancy" in valores:
+        feats["ratio"] = valores["intensity"] / np.maximum(
+            valores["occupancy"], OCUPACION_MIN
+        )
+
+    for c, v in valores.items():
+        feats[f"diff_{c}"] = np.diff(v, prepend=v[:1]) if len(v) else v
+
+    for c in base:
+        movil = df[c].astype(float).rolling(ventana, min_periods=1)
+        feats[f"media_{c}"] = movil.mean().to_numpy()
+        feats[f"std_{c}"] = movil.std(ddof=0).to_numpy()
+
+    minuto_dia = (ts.hour * 60 + ts.minute).to_numpy(dtype=float)
+    angulo = 2 * np.pi * minuto_dia / 1440
+    feats["hora_sin"] = np.sin(angulo)
+    feats["hora_cos"] = np.cos(angulo)
+
+    return pd.DataFrame(feats, index=df.index)[caracteristicas_disponibles(base)]
+
+
+def _firma(df, ventana):
+    h = hashlib.sha1(str(ventana).encode())
+    ts = pd.DatetimeIndex(pd.to_datetime(df["timestamp"])).as_unit("ns").asi8
+    h.update(np.ascontiguousarray(ts).tobytes())
+    for c in ("intensity", "occupancy"):
+        if c in df.columns:
+            h.update(c.encode())
+            h.update(np.ascontiguousarray(df[c].to_numpy(dtype=float)).tobytes())
+    return h.hexdigest()
+
+
+def caracteristicas_cacheadas(df: pd.DataFrame, ventana=VENTANA_MOVIL) -> pd.DataFrame:
+    """
+    `calcular_caracteristicas` con caché LRU por contenido de `df`.
+
+    La clave es un hash de timestamps y valores, así que dos copias del mismo
+    dataset comparten entrada. El DataFrame devuelto es compartido: no se
+    debe modificar.
+    """
+    clave = _firma(df, ventana)
+    with _lock:
+        feats = _cache.get(clave)
+        if feats is not None:
+            _cache.move_to_end(clave)
+    if feats is None:
+        feats = calcular_caracteristicas(df, ventana)
+        with _lock:
+            _cache[clave] = feats
+            while len(_cache) > MAX_ENTRADAS_CACHE:
+                _cache.popitem(last=False)
+    # alineado con el índice de quien pregunta
+    if not feats.index.equals(df.index):
+        feats = feats.set_axis(df.index)
+    return feats
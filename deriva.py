@@ -0,0 +1,158 @@
+"""
+Detección online de cambios de régimen (deriva) con Page-Hinkley.
+
+El test acumula las desviaciones de cada residuo respecto a la media de lo
+visto desde el último reinicio, menos una tolerancia `delta`. Cuando lo
+acumulado se aleja más de `umbral` de su mínimo (subida) o de su máximo
+(bajada), hay un cambio confirmado. El estado son unos pocos escalares:
+O(1) por punto, y un lote se procesa entero con sumas acumuladas de NumPy
+dando exactamente lo mismo que punto a punto.
+
+Los residuos se recortan a ±`recorte` para que un incidente corto, por
+intenso que sea, no cuente como cambio de régimen: hace falta un
+desplazamiento sostenido.
+"""
+
+import numpy as np
+
+# residuos en MADs: con el perfil diario de tráfico, lo acumulado dentro de
+# un día normal se queda por debajo de ~1000; una deriva del 20-30 % lo
+# supera en un día o dos
+DELTA_DERIVA = 0.25
+UMBRAL_DERIVA = 1500.0
+RECORTE_DERIVA = 3.0
+MIN_PUNTOS_DERIVA = 1440  # un día: no se confirma nada antes
+
+
+class PageHinkley:
+    """Test de Page-Hinkley bilateral sobre una serie de residuos."""
+
+    def __init__(
+        self,
+        delta=DELTA_DERIVA,
+        umbral=UMBRAL_DERIVA,
+        min_puntos=MIN_PUNTOS_DERIVA,
+        recorte=RECORTE_DERIVA,
+    ):
+        self.delta = delta
+        self.umbral = umbral
+        self.min_puntos = min_puntos
+        self.recorte = recorte
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.n = 0
+        self.suma = 0.0
+        # acumulados para subidas (con su mínimo) y bajadas (con su máximo),
+        # y puntos transcurridos desde ese mínimo / máximo
+        self.sube = 0.0
+        self.min_sube = 0.0
+        self.desde_min = 0
+        self.baja = 0.0
+        self.max_baja = 0.0
+        self.desde_max = 0
+
+    def params(self):
+        return {
+            "delta": self.delta,
+            "umbral": self.umbral,
+            "min_puntos": self.min_puntos,
+            "recorte": self.recorte,
+        }
+
+    def estado(self):
+        return {
+            "n": self.n,
+            "suma": self.suma,
+            "sube": self.sube,
+            "min_sube": self.min_sube,
+            "desde_min": self.desde_min,
+            "baja": self.baja,
+            "max_baja": self.max_baja,
+            "desde_max": self.desde_max,
+        }
+
+    def restaurar(self, estado):
+        for clave, valor in estado.items():
+            setattr(self, clave, valor)
+
+    def actualizar(self, residuo):
+        """
+        Mete un residuo. Devuelve `(direccion, atras)`: +1/-1 si confirma
+        una subida/bajada (0 si no) y cuántos puntos hace que empezó.
+        """
+        x = min(max(residuo, -self.recorte), self.recorte)
+        self.n += 1
+        self.suma += x
+        media = self.suma / self.n
+
+        self.sube += x - media - self.delta
+        if self.sube < self.min_sube:
+            self.min_sube = self.sube
+            self.desde_min = 0
+        else:
+            self.desde_min += 1
+
+        self.baja += x - media + self.delta
+        if self.baja > self.max_baja:
+            self.max_baja = self.baja
+            self.desde_max = 0
+        else:
+            self.desde_max += 1
+
+        if self.n < self.min_puntos:
+            return 0, 0
+        if self.sube - self.min_sube > self.umbral:
+            return 1, self.desde_min
+        if self.max_baja - self.baja > self.umbral:
+            return -1, self.desde_max
+        return 0, 0
+
+    def actualizar_lote(self, residuos):
+        """
+        Mete residuos hasta el primer cambio confirmado, vectorizado.
+
+        Devuelve `(k, direccion, atras)`: el índice del punto que lo
+        confirma (el estado queda justo tras él) o `(None, 0, 0)` si no hay
+        cambio en todo el lote.
+        """
+        x = np.clip(np.asarray(residuos, dtype=float), -self.recorte, self.recorte)
+        m = len(x)
+        if m == 0:
+            return None, 0, 0
+
+        # mismas operaciones y en el mismo orden que `actualizar`
+        n = self.n + np.arange(1, m + 1)
+        suma = np.cumsum(np.r_[self.suma, x])[1:]
+        media = suma / n
+        sube = np.cumsum(np.r_[self.sube, x - media - self.delta])[1:]
+        min_sube = np.minimum.accumulate(np.r_[self.min_sube, sube])[1:]
+        baja = np.cumsum(np.r_[self.baja, x - media + self.delta])[1:]
+        max_baja = np.maximum.accumulate(np.r_[self.max_baja, baja])[1:]
+
+        alarma_sube = sube - min_sube > self.umbral
+        alarma_baja = max_baja - baja > self.umbral
+        alarma = (n >= self.min_puntos) & (alarma_sube | alarma_baja)
+        k = int(np.argmax(alarma)) if alarma.any() else m - 1
+
+        desde_min = _desde_extremo(sube[: k + 1], min_sube[k], self.min_sube, self.desde_min)
+        desde_max = _desde_extremo(baja[: k + 1], max_baja[k], self.max_baja, self.desde_max)
+
+        self.n = int(n[k])
+        self.suma = float(suma[k])
+        self.sube, self.min_sube, self.desde_min = float(sube[k]), float(min_sube[k]), desde_min
+        self.baja, self.max_baja, self.desde_max = float(baja[k]), float(max_baja[k]), desde_max
+
+        if not alarma[k]:
+            return None, 0, 0
+        if alarma_sube[k]:
+            return k, 1, desde_min
+        return k, -1, desde_max
+
+
+def _desde_extremo(acumulado, extremo, extremo_previo, desde_previo):
+    """Puntos desde la primera vez que `acumulado` alcanzó `extremo`."""
+    if extremo == extremo_previo:
+        # el extremo viene de antes del lote
+        return desde_previo + len(acumulado)
+    return len(acumulado) - 1 - int(np.flatnonzero(acumulado == extremo)[0])
@@ -0,0 +1,2163 @@
+"""
+Detectores de anomalías de tráfico.
+
+Módulo importable sin Streamlit: lo usan la app (`app_streamlit.py`), la
+CLI (`main.py`) y la ingesta en streaming (`ingesta.py`).
+"""
+
+import bisect
+import json
+import os
+import shutil
+import tempfile
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+from datetime import datetime
+
+import numpy as np
+import pandas as pd
+
+# sklearn y joblib se importan dentro de los detectores Isolation Forest: solo
+# sklearn cuesta más de un segundo y un trabajo solo con MAD no lo necesita
+
+from deriva import MIN_PUNTOS_DERIVA, PageHinkley
+from caracteristicas import (
+    VENTANA_MOVIL,
+    calcular_caracteristicas,
+    caracteristicas_cacheadas,
+)
+from historial import (
+    MAX_ANOMALIAS_HISTORIAL,
+    RETENCION_HISTORIAL,
+    HistorialResultados,
+)
+from incidentes import IndiceIncidentes
+from instrumentacion import Cronometro
+
+MAX_EVENTOS_DERIVA = 1000
+
+COLUMNAS_RESULTADO = [
+    "timestamp",
+    "intensity",
+    "expected",
+    "score",
+    "es_anomalia",
+    "confianza",
+]
+
+# ============================================================================
+# ESTRUCTURA AUXILIAR: LISTA ORDENADA POR BLOQUES
+# ============================================================================
+
+
+def mediana_ordenada(seq):
+    """Mediana (como np.median) de una secuencia ya ordenada con acceso por índice."""
+    n = len(seq)
+    if n % 2:
+        return seq[n // 2]
+    return (seq[n // 2 - 1] + seq[n // 2]) / 2
+
+
+def mad_ordenado(seq, centro, p):
+    """
+    Mediana de |x - centro| de una secuencia ordenada, sin materializar las
+    desviaciones. `p` es la posición de `centro` (bisect_left).
+
+    Las desviaciones a la izquierda y a la derecha de `centro` forman dos
+    secuencias ordenadas; su k-ésimo elemento conjunto se obtiene con una
+    búsqueda binaria sobre el acceso posicional, en O(log n) accesos.
+    """
+    n = len(seq)
+    if n % 2:
+        return _kesima_desviacion(seq, centro, p, n // 2)
+    return (
+        _kesima_desviacion(seq, centro, p, n // 2 - 1)
+        + _kesima_desviacion(seq, centro, p, n // 2)
+    ) / 2
+
+
+def _kesima_desviacion(seq, centro, p, k):
+    n_izq = p
+    n_der = len(seq) - p
+
+    def izq(i):
+        return centro - seq[p - 1 - i]
+
+    def der(j):
+        return seq[p + j] - centro
+
+    lo = max(0, k + 1 - n_der)
+    hi = min(k + 1, n_izq)
+    while lo < hi:
+        i = (lo + hi) // 2
+        j = k + 1 - i
+        if j > 0 and izq(i) < der(j - 1):
+            lo = i + 1
+        else:
+            hi = i
+
+    i = lo
+    j = k + 1 - i
+    candidatos = []
+    if i > 0:
+        candidatos.append(izq(i - 1))
+    if j > 0:
+        candidatos.append(der(j - 1))
+    return max(candidatos)
+
+
+class _ListaOrdenada:
+    """
+    Lista ordenada por bloques con acceso posicional en O(log n).
+
+    Los valores se guardan en bloques ordenados de tamaño acotado y un árbol
+    de Fenwick sobre las longitudes de los bloques permite localizar el
+    k-ésimo elemento sin recorrer la lista. Inserción y borrado solo tocan
+    un bloque, así que la ventana nunca se reordena entera.
+    """
+
+    def __init__(self, valores=(), carga=512):
+        self._carga = carga
+        ordenados = sorted(valores)
+        self._bloques = [
+            ordenados[i : i + carga] for i in range(0, len(ordenados), carga)
+        ]
+        self._maximos = [b[-1] for b in self._bloques]
+        self._len = len(ordenados)
+        self._fenwick = None
+
+    def __len__(self):
+        return self._len
+
+    # --- índice posicional (Fenwick sobre longitudes de bloque) ---
+
+    def _construir_indice(self):
+        arbol = [len(b) for b in self._bloques]
+        for i in range(len(arbol)):
+            padre = i | (i + 1)
+            if padre < len(arbol):
+                arbol[padre] += arbol[i]
+        self._fenwick = arbol
+
+    def _actualizar_indice(self, pos, delta):
+        arbol = self._fenwick
+        if arbol is None:
+            return
+        while pos < len(arbol):
+            arbol[pos] += delta
+            pos |= pos + 1
+
+    def _prefijo(self, pos):
+        """Número de elementos en los bloques [0, pos)."""
+        if self._fenwick is None:
+            self._construir_indice()
+        arbol = self._fenwick
+        total = 0
+        while pos > 0:
+            total += arbol[pos - 1]
+            pos &= pos - 1
+        return total
+
+    def _localizar(self, idx):
+        """Devuelve (bloque, posición dentro del bloque) del elemento idx."""
+        if self._fenwick is None:
+            self._construir_indice()
+        arbol = self._fenwick
+        pos = 0
+        paso = 1 << (len(arbol).bit_length() - 1) if arbol else 0
+        while paso:
+            sig = pos + paso
+            if sig <= len(arbol) and arbol[sig - 1] <= idx:
+                idx -= arbol[sig - 1]
+                pos = sig
+            paso >>= 1
+        return pos, idx
+
+    # --- operaciones públicas ---
+
+    def add(self, valor):
+        if not self._bloques:
+            self._bloques.append([valor])
+            self._maximos.append(valor)
+            self._len = 1
+            self._fenwick = None
+            return
+
+        i = bisect.bisect_left(self._maximos, valor)
+        if i == len(self._bloques):
+            i -= 1
+        bloque = self._bloques[i]
+        bisect.insort(bloque, valor)
+        self._maximos[i] = bloque[-1]
+        self._len += 1
+
+        if len(bloque) > 2 * self._carga:
+            self._bloques[i : i + 1] = [bloque[: self._carga], bloque[self._carga :]]
+            self._maximos[i : i + 1] = [bloque[self._carga - 1], bloque[-1]]
+            self._fenwick = None
+        else:
+            self._actualizar_indice(i, 1)
+
+    def remove(self, valor):
+        i = bisect.bisect_left(self._maximos, valor)
+        if i == len(self._bloques):
+            raise ValueError(f"{valor!r} no está en la lista")
+        bloque = self._bloques[i]
+        j = bisect.bisect_left(bloque, valor)
+        if j == len(bloque) or bloque[j] != valor:
+            raise ValueError(f"{valor!r} no está en la lista")
+
+        del bloque[j]
+        self._len -= 1
+        if bloque:
+            self._maximos[i] = bloque[-1]
+            self._actualizar_indice(i, -1)
+        else:
+            del self._bloques[i]
+            del self._maximos[i]
+            self._fenwick = None
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self._len
+        if not 0 <= idx < self._len:
+            raise IndexError("índice fuera de rango")
+        b, j = self._localizar(idx)
+        return self._bloques[b][j]
+
+    def bisect_left(self, valor):
+        i = bisect.bisect_left(self._maximos, valor)
+        if i == len(self._bloques):
+            return self._len
+        return self._prefijo(i) + bisect.bisect_left(self._bloques[i], valor)
+
+    def mediana(self):
+        return mediana_ordenada(self)
+
+    def mad(self, centro):
+        return mad_ordenado(self, centro, self.bisect_left(centro))
+
+
+# ============================================================================
+# SNAPSHOTS EN DISCO
+# ============================================================================
+
+# Un snapshot es un directorio con `meta.json` (versión, clase, parámetros y
+# escalares) y un `.npy` por array de estado. Los arrays se abren con
+# mmap_mode="c": la carga no lee el fichero entero y las escrituras
+# posteriores quedan en memoria sin tocar el snapshot.
+
+VERSION_SNAPSHOT = 1
+
+
+def _escribir_snapshot(ruta, clase, meta, arrays, extra=None):
+    """Escribe el snapshot en un directorio temporal y lo mueve de forma atómica."""
+    ruta = os.path.abspath(ruta)
+    os.makedirs(os.path.dirname(ruta), exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp_", dir=os.path.dirname(ruta))
+    try:
+        for nombre, arr in arrays.items():
+            np.save(os.path.join(tmp, f"{nombre}.npy"), arr)
+        if extra is not None:
+            extra(tmp)
+        meta = dict(meta, version=VERSION_SNAPSHOT, clase=clase, arrays=sorted(arrays))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f, default=str)
+        if os.path.exists(ruta):
+            shutil.rmtree(ruta)
+        os.replace(tmp, ruta)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def _leer_snapshot(ruta, clase):
+    with open(os.path.join(ruta, "meta.json")) as f:
+        meta = json.load(f)
+    if meta.get("version") != VERSION_SNAPSHOT:
+        raise ValueError(
+            f"Snapshot de versión {meta.get('version')}, se esperaba {VERSION_SNAPSHOT}"
+        )
+    if meta.get("clase") != clase:
+        raise ValueError(f"El snapshot es de {meta.get('clase')}, no de {clase}")
+    arrays = {
+        nombre: np.load(os.path.join(ruta, f"{nombre}.npy"), mmap_mode="c")
+        for nombre in meta["arrays"]
+    }
+    return meta, arrays
+
+
+def _ordenar_por_tiempo(df: pd.DataFrame) -> pd.DataFrame:
+    """Copia de `df` con `timestamp` parseado y filas en orden temporal."""
+    df = df.copy()
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    return df.sort_values("timestamp")
+
+
+def _caracteristicas_con_contexto(df, contexto, ventana):
+    """Features de `df` (ordenado) anteponiendo `contexto` si `df` continúa la serie."""
+    if contexto is not None and not contexto.empty and not df.empty:
+        if contexto["timestamp"].iloc[-1] < df["timestamp"].iloc[0]:
+            completo = pd.concat([contexto, df[contexto.columns]], ignore_index=True)
+            feats = calcular_caracteristicas(completo, ventana)
+            return feats.iloc[len(contexto) :].set_axis(df.index)
+    return caracteristicas_cacheadas(df, ventana)
+
+
+def _contexto_features(df, ventana, contexto=None):
+    """
+    Últimas `ventana` filas crudas de la serie para continuar sus features.
+
+    Si `df` continúa `contexto` (el del lote anterior), se toman de los dos:
+    con lotes de menos de `ventana` filas las móviles siguen viendo las
+    filas previas.
+    """
+    columnas = [c for c in ("timestamp", "intensity", "occupancy") if c in df.columns]
+    cola = df[columnas]
+    if contexto is not None and not contexto.empty:
+        if df.empty or contexto["timestamp"].iloc[-1] < df["timestamp"].iloc[0]:
+            cola = pd.concat([contexto, cola], ignore_index=True)
+    return cola.iloc[-ventana:].reset_index(drop=True)
+
+
+def _contexto_a_arrays(contexto):
+    """Arrays de snapshot del contexto de features (vacío si no hay)."""
+    if contexto is None:
+        return {}
+    arrays = {"contexto_ts": pd.DatetimeIndex(contexto["timestamp"]).as_unit("ns").asi8}
+    for c in contexto.columns[1:]:
+        arrays[f"contexto_{c}"] = contexto[c].to_numpy(dtype=float)
+    return arrays
+
+
+def _contexto_desde_arrays(arrays):
+    if "contexto_ts" not in arrays:
+        return None
+    contexto = {"timestamp": pd.to_datetime(np.asarray(arrays["contexto_ts"]))}
+    for c in ("intensity", "occupancy"):
+        if f"contexto_{c}" in arrays:
+            contexto[c] = np.asarray(arrays[f"contexto_{c}"])
+    return pd.DataFrame(contexto)
+
+
+def _a_timestamp(valor):
+    return None if valor is None else pd.Timestamp(valor)
+
+
+def _a_float(valor):
+    return None if valor is None else float(valor)
+
+
+def _historiales(retencion):
+    """Históricos acotados de anomalías y de resultados de un detector."""
+    return (
+        HistorialResultados(min(retencion, MAX_ANOMALIAS_HISTORIAL)),
+        HistorialResultados(retencion),
+    )
+
+
+# ============================================================================
+# CLASE 1: DETECTOR MAD (VENTANA DESLIZANTE)
+# ============================================================================
+
+
+class TrafficAnomalyDetectorMAD:
+    """
+    Detector de anomalías basado en:
+    - Baseline = mediana de intensidad
+    - MAD = mediana(|x - mediana|)
+    - Score = |x - baseline| / MAD
+    - Anomalía si score > threshold
+
+    Usa solo los últimos `window_days` días del dataset para calcular baseline.[web:29][web:121]
+
+    Con `ventana_movil=True` la mediana y el MAD se actualizan con cada punto
+    que entra (y el más antiguo que sale de la ventana), apoyándose en una
+    lista ordenada por bloques en lugar de reordenar el buffer.
+
+    `score_history` y `anomalias_detectadas` guardan solo los últimos
+    `retencion_historial` resultados (ver `historial.py`); `incidentes`
+    agrupa las anomalías consecutivas (ver `incidentes.py`). Si se asigna
+    `almacen` (un `AlmacenResultados` de `almacen.py`), cada resultado se
+    escribe además ahí, particionado por día y sin límite de retención.
+
+    `cronometro` mide cada etapa (ventana, baseline, puntuación, ensamblado)
+    si se activa (ver `instrumentacion.py`); `get_estadisticas()` lo
+    incluye en `rendimiento`.
+
+    Con `deriva=True` un test de Page-Hinkley (ver `deriva.py`) sigue los
+    residuos en MADs. Cuando confirma un cambio de régimen (p. ej. una obra
+    que sube o baja el nivel poco a poco) el baseline se rehace solo con los
+    puntos desde que empezó el cambio (al menos `min_puntos_deriva`) y se
+    anota el evento en `eventos_deriva`. Sin cambio confirmado el baseline
+    no se toca.
+    """
+
+    def __init__(
+        self,
+        window_days=42,
+        threshold=3.5,
+        ventana_movil=False,
+        retencion_historial=RETENCION_HISTORIAL,
+        deriva=False,
+        min_puntos_deriva=MIN_PUNTOS_DERIVA,
+    ):
+        if deriva and ventana_movil:
+            raise ValueError("deriva y ventana_movil son excluyentes")
+
+        self.window_days = window_days
+        self.window_minutos = window_days * 1440
+        self.threshold = threshold
+        self.ventana_movil = ventana_movil
+        self.retencion_historial = retencion_historial
+        self.min_puntos_deriva = min_puntos_deriva
+        self.deriva = PageHinkley() if deriva else None
+        self.eventos_deriva = deque(maxlen=MAX_EVENTOS_DERIVA)
+
+        self.buffer = deque(maxlen=self.window_minutos)
+        self._ordenada = None
+        self.baseline_med = None
+        self.baseline_mad = None
+        self.baseline_ts = None
+
+        self.anomalias_detectadas, self.score_history = _historiales(retencion_historial)
+        self.incidentes = IndiceIncidentes()
+        # AlmacenResultados opcional donde se escribe cada lote puntuado
+        self.almacen = None
+        self.cronometro = Cronometro()
+
+    def _filtrar_ventana(self, df: pd.DataFrame) -> pd.DataFrame:
+        return self._recortar_ventana(_ordenar_por_tiempo(df))
+
+    def _recortar_ventana(self, df: pd.DataFrame) -> pd.DataFrame:
+        """Últimos `window_days` días de `df`, ya ordenado."""
+        if df.empty:
+            return df
+
+        t_max = df["timestamp"].max()
+        t_min = t_max - pd.Timedelta(days=self.window_days)
+        df_win = df[df["timestamp"] >= t_min]
+
+        if len(df_win) < 100:
+            df_win = df
+
+        return df_win
+
+    def cargar_historico(self, df: pd.DataFrame):
+        with self.cronometro.etapa("ventana"):
+            df_win = self._filtrar_ventana(df)
+        with self.cronometro.etapa("baseline"):
+            return self._cargar_ventana(df_win)
+
+    def _ajustar_preparado(self, df, feats=None):
+        """`cargar_historico` sobre `df` ya ordenado (`feats` no se usa)."""
+        return self._cargar_ventana(self._recortar_ventana(df))
+
+    def _cargar_ventana(self, df_win: pd.DataFrame):
+        intensity = df_win["intensity"].values
+
+        if len(intensity) == 0:
+            self.baseline_med = None
+            self.baseline_mad = None
+            self.baseline_ts = None
+            return {"mediana": np.nan, "mad": np.nan, "puntos": 0}
+
+        self.baseline_med = np.median(intensity)
+        desviaciones = np.abs(intensity - self.baseline_med)
+        mad_val = np.median(desviaciones)
+        self.baseline_mad = mad_val if mad_val > 0 else np.std(intensity)
+
+        self.baseline_ts = df_win["timestamp"].max()
+        self.buffer = deque(intensity, maxlen=self.window_minutos)
+        if self.deriva is not None:
+            self.deriva.reiniciar()
+
+        if self.ventana_movil:
+            self._ordenada = _ListaOrdenada(self.buffer)
+            self._actualizar_baseline_movil()
+
+        return {
+            "mediana": self.baseline_med,
+            "mad": self.baseline_mad,
+            "puntos": len(intensity),
+        }
+
+    def procesar_punto(self, timestamp, intensity, threshold=None):
+        if (
+            self.baseline_med is None
+            or self.baseline_mad is None
+            or self.baseline_mad == 0
+        ):
+            return None
+
+        th = threshold if threshold is not None else self.threshold
+        expected = self.baseline_med
+        residuo = (intensity - self.baseline_med) / self.baseline_mad
+        score = abs(residuo)
+        es_anomalia = score > th
+
+        if self.ventana_movil:
+            self._deslizar(timestamp, intensity)
+        else:
+            self.buffer.append(intensity)
+
+        if self.deriva is not None:
+            direccion, atras = self.deriva.actualizar(residuo)
+            if direccion:
+                recientes = np.fromiter(self.buffer, dtype=float, count=len(self.buffer))
+                self._confirmar_deriva(timestamp, direccion, atras, recientes)
+
+        res = {
+            "timestamp": timestamp,
+            "intensity": intensity,
+            "expected": expected,
+            "score": score,
+            "es_anomalia": es_anomalia,
+            "confianza": min(score / th, 1.0) if th > 0 else 0.0,
+        }
+
+        self.score_history.append(res)
+        if es_anomalia:
+            self.anomalias_detectadas.append(res)
+            self.incidentes.agregar_punto(timestamp, score, intensity)
+        if self.almacen is not None:
+            self.almacen.agregar_punto(res)
+
+        return res
+
+    def _deslizar(self, timestamp, intensity):
+        """Mete un punto en la ventana, saca el más antiguo y actualiza el baseline."""
+        if len(self.buffer) == self.buffer.maxlen:
+            self._ordenada.remove(self.buffer[0])
+        self.buffer.append(intensity)
+        self._ordenada.add(intensity)
+        self._actualizar_baseline_movil()
+        self.baseline_ts = timestamp
+
+    def _actualizar_baseline_movil(self):
+        self.baseline_med = self._ordenada.mediana()
+        mad_val = self._ordenada.mad(self.baseline_med)
+        self.baseline_mad = mad_val if mad_val > 0 else np.std(self.buffer)
+
+    def procesar_lote(self, df: pd.DataFrame, threshold=None) -> pd.DataFrame:
+        """
+        Versión vectorizada de `procesar_punto` para un lote completo.
+
+        Puntúa toda la columna `intensity` de una vez con NumPy y devuelve un
+        DataFrame columnar con las mismas columnas que los dicts por punto.
+        """
+        th = threshold if threshold is not None else self.threshold
+
+        if (
+            self.baseline_med is None
+            or self.baseline_mad is None
+            or self.baseline_mad == 0
+            or df.empty
+        ):
+            return pd.DataFrame(columns=COLUMNAS_RESULTADO)
+
+        if self.ventana_movil:
+            # el baseline cambia en cada punto: no se puede vectorizar
+            resultados = []
+            with self.cronometro.etapa("puntuacion"):
+                for ts, x in zip(df["timestamp"], df["intensity"].to_numpy(dtype=float)):
+                    r = self.procesar_punto(ts, x, threshold=th)
+                    if r is not None:
+                        resultados.append(r)
+            self.cronometro.contar("puntos", len(resultados))
+            return pd.DataFrame(resultados, columns=COLUMNAS_RESULTADO)
+
+        with self.cronometro.etapa("puntuacion"):
+            intensity, expected, score = self._puntuar_preparado(df)
+
+        return self._ensamblar_lote(df, intensity, expected, score, th)
+
+    def _puntuar_preparado(self, df, feats=None):
+        """
+        `(intensity, expected, score)` de un lote ordenado, sin ensamblar.
+
+        Avanza el estado (ventana, deriva) como `procesar_lote`; `feats` son
+        las features de `df` si ya están calculadas.
+        """
+        intensity = df["intensity"].to_numpy(dtype=float)
+        if self.deriva is not None:
+            expected, score = self._puntuar_con_deriva(df["timestamp"], intensity)
+        else:
+            score = np.abs((intensity - self.baseline_med) / self.baseline_mad)
+            expected = np.full_like(score, self.baseline_med)
+        self.buffer.extend(intensity)
+        return intensity, expected, score
+
+    def _puntuar_con_deriva(self, timestamps, intensity):
+        """
+        Puntúa el lote por tramos: cada tramo acaba donde Page-Hinkley
+        confirma un cambio, y el siguiente se puntúa con el baseline rehecho.
+        """
+        n = len(intensity)
+        expected = np.empty(n)
+        score = np.empty(n)
+        previos = None
+
+        ini = 0
+        while ini < n:
+            residuo = (intensity[ini:] - self.baseline_med) / self.baseline_mad
+            k, direccion, atras = self.deriva.actualizar_lote(residuo)
+            fin = n if k is None else ini + k + 1
+            expected[ini:fin] = self.baseline_med
+            score[ini:fin] = np.abs(residuo[: fin - ini])
+
+            if k is not None:
+                largo = max(atras, self.min_puntos_deriva)
+                if previos is None:
+                    previos = np.fromiter(self.buffer, dtype=float, count=len(self.buffer))
+                recientes = np.concatenate([previos[-largo:], intensity[:fin]])
+                self._confirmar_deriva(timestamps.iloc[fin - 1], direccion, atras, recientes)
+            ini = fin
+
+        return expected, score
+
+    def _confirmar_deriva(self, timestamp, direccion, atras, recientes):
+        """Rehace mediana y MAD con los puntos desde el inicio del cambio."""
+        # como mucho la ventana: lo que cabe en `buffer` punto a punto
+        largo = min(max(atras, self.min_puntos_deriva), self.window_minutos)
+        tramo = recientes[-largo:]
+        anterior = self.baseline_med
+        self.baseline_med = float(np.median(tramo))
+        mad_val = float(np.median(np.abs(tramo - self.baseline_med)))
+        self.baseline_mad = mad_val if mad_val > 0 else float(np.std(tramo))
+        self.baseline_ts = pd.Timestamp(timestamp)
+        self.deriva.reiniciar()
+
+        self.eventos_deriva.append(
+            {
+                "timestamp": self.baseline_ts,
+                # estimado con un punto por minuto
+                "inicio": self.baseline_ts - pd.Timedelta(minutes=atras),
+                "direccion": "subida" if direccion > 0 else "bajada",
+                "mediana_anterior": float(anterior),
+                "mediana_nueva": self.baseline_med,
+                "mad_nuevo": self.baseline_mad,
+            }
+        )
+
+    def _ensamblar_lote(self, df, intensity, expected, score, th):
+        """Construye el DataFrame de resultados de un lote ya puntuado."""
+        with self.cronometro.etapa("ensamblado"):
+            return self._ensamblar(df, intensity, expected, score, th)
+
+    def _ensamblar(self, df, intensity, expected, score, th):
+        self.cronometro.contar("puntos", len(score))
+        es_anomalia = score > th
+        if th > 0:
+            confianza = np.minimum(score / th, 1.0)
+        else:
+            confianza = np.zeros_like(score)
+
+        df_res = pd.DataFrame(
+            {
+                "timestamp": df["timestamp"].to_numpy(),
+                "intensity": intensity,
+                "expected": expected,
+                "score": score,
+                "es_anomalia": es_anomalia,
+                "confianza": confianza,
+            }
+        )
+
+        # histórico, anomalías e incidentes a partir de máscaras, sin append por punto
+        anomalias = df_res[es_anomalia]
+        self.score_history.extend(df_res)
+        self.anomalias_detectadas.extend(anomalias)
+        self.incidentes.agregar_resultados(anomalias)
+        if self.almacen is not None:
+            self.almacen.agregar(df_res)
+
+        return df_res
+
+    # --- snapshots ---
+
+    def _params_snapshot(self):
+        return {
+            "window_days": self.window_days,
+            "threshold": self.threshold,
+            "ventana_movil": self.ventana_movil,
+            "retencion_historial": self.retencion_historial,
+            "deriva": self.deriva is not None,
+            "min_puntos_deriva": self.min_puntos_deriva,
+        }
+
+    def _estado_snapshot(self):
+        meta = {
+            "baseline_med": _a_float(self.baseline_med),
+            "baseline_mad": _a_float(self.baseline_mad),
+            "baseline_ts": self.baseline_ts,
+        }
+        if self.deriva is not None:
+            meta["deriva"] = {"params": self.deriva.params(), "estado": self.deriva.estado()}
+        arrays = {"buffer": np.fromiter(self.buffer, dtype=float, count=len(self.buffer))}
+        return meta, arrays
+
+    def _restaurar_snapshot(self, meta, arrays):
+        self.baseline_med = meta["baseline_med"]
+        self.baseline_mad = meta["baseline_mad"]
+        self.baseline_ts = _a_timestamp(meta["baseline_ts"])
+        self.buffer = deque(arrays["buffer"].tolist(), maxlen=self.window_minutos)
+        if self.ventana_movil:
+            self._ordenada = _ListaOrdenada(self.buffer)
+        if meta.get("deriva") is not None:
+            self.deriva = PageHinkley(**meta["deriva"]["params"])
+            self.deriva.restaurar(meta["deriva"]["estado"])
+
+    def guardar_snapshot(self, ruta):
+        """Guarda baseline y ventana en `ruta` (directorio) para reanudar después."""
+        meta, arrays = self._estado_snapshot()
+        meta["params"] = self._params_snapshot()
+        _escribir_snapshot(ruta, type(self).__name__, meta, arrays)
+
+    @classmethod
+    def desde_snapshot(cls, ruta):
+        """Detector listo para puntuar a partir de un snapshot de `guardar_snapshot`."""
+        meta, arrays = _leer_snapshot(ruta, cls.__name__)
+        detector = cls(**meta["params"])
+        detector._restaurar_snapshot(meta, arrays)
+        return detector
+
+    def get_estadisticas(self):
+        return {
+            "total_anomalias": self.anomalias_detectadas.total,
+            "total_incidentes": self.incidentes.total,
+            "baseline_mediana": self.baseline_med,
+            "baseline_mad": self.baseline_mad,
+            "buffer_tamaño": len(self.buffer),
+            "baseline_edad_horas": (
+                (datetime.now() - self.baseline_ts).total_seconds() / 3600
+                if self.baseline_ts is not None
+                else None
+            ),
+            "ultima_anomalia": (
+                self.anomalias_detectadas[-1]["timestamp"]
+                if self.anomalias_detectadas
+                else None
+            ),
+            "eventos_deriva": len(self.eventos_deriva),
+            "ultima_deriva": (
+                self.eventos_deriva[-1]["timestamp"] if self.eventos_deriva else None
+            ),
+            "rendimiento": self.cronometro.resumen(),
+        }
+
+
+# ============================================================================
+# CLASE 1b: DETECTOR MAD ESTACIONAL (PERFIL POR FRANJA)
+# ============================================================================
+
+
+class TrafficAnomalyDetectorMADEstacional(TrafficAnomalyDetectorMAD):
+    """
+    Variante estacional del detector MAD.
+
+    En lugar de una única mediana para toda la ventana calcula mediana y MAD
+    por franja horaria (`bucket_minutos` dentro de la semana, o del día si
+    `semanal=False`). Las tablas son arrays NumPy de `n_slots` posiciones,
+    así que el baseline de un punto es un acceso por índice.
+
+    Cada franja guarda en un anillo sus últimas muestras de la ventana. Los
+    puntos posteriores al histórico cargado entran en su anillo y, al
+    cambiar de día, solo se recalculan las franjas que han recibido datos.
+    Las franjas sin datos usan el baseline global.
+    """
+
+    def __init__(
+        self,
+        window_days=42,
+        threshold=3.5,
+        bucket_minutos=15,
+        semanal=True,
+        retencion_historial=RETENCION_HISTORIAL,
+    ):
+        super().__init__(
+            window_days=window_days,
+            threshold=threshold,
+            retencion_historial=retencion_historial,
+        )
+
+        periodo = 7 * 1440 if semanal else 1440
+        if bucket_minutos <= 0 or periodo % bucket_minutos:
+            raise ValueError(
+                f"bucket_minutos={bucket_minutos} no divide un periodo de {periodo} minutos"
+            )
+
+        self.bucket_minutos = bucket_minutos
+        self.semanal = semanal
+        self.n_slots = periodo // bucket_minutos
+        self.capacidad_slot = max(1, -(-self.window_minutos // self.n_slots))
+
+        self._reiniciar_tablas()
+
+    def _reiniciar_tablas(self):
+        self._muestras = np.full(
+            (self.n_slots, self.capacidad_slot), np.nan, dtype=np.float32
+        )
+        self._escritos = np.zeros(self.n_slots, dtype=np.int64)
+        self._sucios = np.zeros(self.n_slots, dtype=bool)
+        self.tabla_med = np.full(self.n_slots, np.nan, dtype=np.float32)
+        self.tabla_mad = np.full(self.n_slots, np.nan, dtype=np.float32)
+        self._dia_actual = None
+
+    def _slot(self, ts):
+        """Franja de un Timestamp o de un DatetimeIndex."""
+        minuto = ts.hour * 60 + ts.minute
+        if self.semanal:
+            minuto = minuto + ts.dayofweek * 1440
+        return np.asarray(minuto // self.bucket_minutos, dtype=np.int64)
+
+    def _meter(self, slots, valores):
+        """Escribe valores en los anillos de sus franjas, en orden de llegada."""
+        cap = self.capacidad_slot
+        orden = np.argsort(slots, kind="stable")
+        s = slots[orden]
+        v = valores[orden]
+
+        cuenta = np.bincount(s, minlength=self.n_slots)
+        rango = np.arange(len(s)) - np.searchsorted(s, s, side="left")
+        # si una franja recibe más valores que su capacidad, solo cuentan los últimos
+        keep = rango >= cuenta[s] - cap
+        col = (self._escritos[s] + rango) % cap
+
+        self._muestras[s[keep], col[keep]] = v[keep]
+        self._escritos += cuenta
+        self._sucios |= cuenta > 0
+
+    def _refrescar(self):
+        """Recalcula mediana/MAD solo de las franjas con datos nuevos."""
+        idx = np.flatnonzero(self._sucios)
+        if idx.size == 0:
+            return
+
+        filas = self._muestras[idx]
+        med = np.nanmedian(filas, axis=1)
+        mad = np.nanmedian(np.abs(filas - med[:, None]), axis=1)
+        mad = np.where(mad > 0, mad, np.nanstd(filas, axis=1))
+
+        self.tabla_med[idx] = med
+        self.tabla_mad[idx] = mad
+        self._sucios[idx] = False
+
+    def _avanzar_dia(self, ts):
+        dia = ts.normalize()
+        if self._dia_actual is None or dia > self._dia_actual:
+            self._refrescar()
+            self._dia_actual = dia
+
+    def _baseline_slots(self, slots):
+        med = self.tabla_med[slots].astype(float)
+        mad = self.tabla_mad[slots].astype(float)
+        sin_datos = ~(mad > 0)
+        med[sin_datos] = self.baseline_med
+        mad[sin_datos] = self.baseline_mad
+        return med, mad
+
+    def _cargar_ventana(self, df_win: pd.DataFrame):
+        stats = super()._cargar_ventana(df_win)
+        self._reiniciar_tablas()
+        if stats["puntos"] == 0:
+            return stats
+
+        ts = pd.DatetimeIndex(df_win["timestamp"])
+        self._meter(self._slot(ts), df_win["intensity"].to_numpy(dtype=np.float32))
+        self._refrescar()
+        self._dia_actual = ts.max().normalize()
+
+        stats["slots"] = int(np.count_nonzero(self.tabla_mad > 0))
+        return stats
+
+    def procesar_punto(self, timestamp, intensity, threshold=None):
+        if (
+            self.baseline_med is None
+            or self.baseline_mad is None
+            or self.baseline_mad == 0
+        ):
+            return None
+
+        th = threshold if threshold is not None else self.threshold
+        ts = pd.Timestamp(timestamp)
+        self._avanzar_dia(ts)
+
+        slot = int(self._slot(ts))
+        med = float(self.tabla_med[slot])
+        mad = float(self.tabla_mad[slot])
+        if not mad > 0:
+            med, mad = self.baseline_med, self.baseline_mad
+
+        score = abs((intensity - med) / mad)
+        es_anomalia = score > th
+
+        # solo aprendemos de datos posteriores a lo ya cargado
+        if self.baseline_ts is None or ts > self.baseline_ts:
+            self._meter(np.array([slot]), np.array([intensity], dtype=np.float32))
+            self.baseline_ts = ts
+        self.buffer.append(intensity)
+
+        res = {
+            "timestamp": timestamp,
+            "intensity": intensity,
+            "expected": med,
+            "score": score,
+            "es_anomalia": es_anomalia,
+            "confianza": min(score / th, 1.0) if th > 0 else 0.0,
+        }
+
+        self.score_history.append(res)
+        if es_anomalia:
+            self.anomalias_detectadas.append(res)
+            self.incidentes.agregar_punto(timestamp, score, intensity)
+        if self.almacen is not None:
+            self.almacen.agregar_punto(res)
+
+        return res
+
+    def procesar_lote(self, df: pd.DataFrame, threshold=None) -> pd.DataFrame:
+        """
+        Puntúa el lote día a día con las tablas vigentes en cada día.
+
+        Dentro de un día todo es vectorizado; entre días se refrescan las
+        franjas tocadas, igual que haría `procesar_punto`.
+        """
+        th = threshold if threshold is not None else self.threshold
+
+        if (
+            self.baseline_med is None
+            or self.baseline_mad is None
+            or self.baseline_mad == 0
+            or df.empty
+        ):
+            return pd.DataFrame(columns=COLUMNAS_RESULTADO)
+
+        with self.cronometro.etapa("ventana"):
+            ts = pd.DatetimeIndex(pd.to_datetime(df["timestamp"]))
+            intensity = df["intensity"].to_numpy(dtype=float)
+            slots = self._slot(ts)
+            n = len(intensity)
+
+            # un punto se aprende si es posterior a todo lo visto antes que él
+            t_ns = ts.as_unit("ns").asi8
+            visto = np.maximum.accumulate(np.r_[np.iinfo(np.int64).min, t_ns[:-1]])
+            if self.baseline_ts is not None:
+                visto = np.maximum(visto, pd.Timestamp(self.baseline_ts).value)
+            nuevos = t_ns > visto
+
+            dias = ts.normalize()
+            cortes = np.flatnonzero(dias[1:] != dias[:-1]) + 1
+            expected = np.empty(n)
+            mad = np.empty(n)
+
+        # el refresco de franjas al cambiar de día va dentro de la puntuación
+        with self.cronometro.etapa("puntuacion"):
+            for ini, fin in zip(np.r_[0, cortes], np.r_[cortes, n]):
+                self._avanzar_dia(dias[ini])
+                expected[ini:fin], mad[ini:fin] = self._baseline_slots(slots[ini:fin])
+
+                m = nuevos[ini:fin]
+                if m.any():
+                    self._meter(slots[ini:fin][m], intensity[ini:fin][m].astype(np.float32))
+                    self.baseline_ts = ts[ini:fin][m][-1]
+
+            score = np.abs((intensity - expected) / mad)
+            self.buffer.extend(intensity)
+        return self._ensamblar_lote(df, intensity, expected, score, th)
+
+    def _params_snapshot(self):
+        return {
+            "window_days": self.window_days,
+            "threshold": self.threshold,
+            "bucket_minutos": self.bucket_minutos,
+            "semanal": self.semanal,
+            "retencion_historial": self.retencion_historial,
+        }
+
+    def _estado_snapshot(self):
+        meta, arrays = super()._estado_snapshot()
+        meta["dia_actual"] = self._dia_actual
+        arrays.update(
+            muestras=self._muestras,
+            escritos=self._escritos,
+            sucios=self._sucios,
+            tabla_med=self.tabla_med,
+            tabla_mad=self.tabla_mad,
+        )
+        return meta, arrays
+
+    def _restaurar_snapshot(self, meta, arrays):
+        super()._restaurar_snapshot(meta, arrays)
+        self._dia_actual = _a_timestamp(meta["dia_actual"])
+        self._muestras = arrays["muestras"]
+        self._escritos = arrays["escritos"]
+        self._sucios = arrays["sucios"]
+        self.tabla_med = arrays["tabla_med"]
+        self.tabla_mad = arrays["tabla_mad"]
+
+    def get_estadisticas(self):
+        stats = super().get_estadisticas()
+        stats["slots"] = self.n_slots
+        stats["slots_con_datos"] = int(np.count_nonzero(self.tabla_mad > 0))
+        return stats
+
+
+# ============================================================================
+# CLASE 1c: DETECTOR MAD MULTIVARIANTE (FEATURES)
+# ============================================================================
+
+
+class TrafficAnomalyDetectorMADMultivariante(TrafficAnomalyDetectorMAD):
+    """
+    MAD aplicado a varias features a la vez (ver `caracteristicas.py`).
+
+    Cada feature tiene su mediana y su MAD sobre la ventana; el score de un
+    punto es el mayor |x - mediana| / MAD de sus features, así que el
+    threshold sigue midiéndose en MADs. `expected` es la mediana de
+    intensity, como en el detector univariante.
+
+    Las features se calculan una vez por dataset (caché compartida con
+    Isolation Forest). Para que diferencias y medias móviles de un
+    micro-lote no empiecen de cero, se guardan las últimas filas crudas y se
+    anteponen al siguiente lote cuando es posterior.
+    """
+
+    def __init__(
+        self,
+        window_days=42,
+        threshold=3.5,
+        features=("intensity", "occupancy"),
+        ventana_features=VENTANA_MOVIL,
+        retencion_historial=RETENCION_HISTORIAL,
+    ):
+        super().__init__(
+            window_days=window_days,
+            threshold=threshold,
+            retencion_historial=retencion_historial,
+        )
+        self.features = list(features)
+        self.ventana_features = ventana_features
+        self.medianas = None
+        self.mads = None
+        self._contexto = None
+
+    def _caracteristicas(self, df):
+        return _caracteristicas_con_contexto(df, self._contexto, self.ventana_features)
+
+    def _guardar_contexto(self, df):
+        self._contexto = _contexto_features(df, self.ventana_features, self._contexto)
+
+    def cargar_historico(self, df: pd.DataFrame):
+        with self.cronometro.etapa("ventana"):
+            df = _ordenar_por_tiempo(df)
+        # features sobre toda la serie: las móviles del inicio de la ventana
+        # ven las filas anteriores
+        with self.cronometro.etapa("features"):
+            feats = caracteristicas_cacheadas(df, self.ventana_features)
+        with self.cronometro.etapa("baseline"):
+            return self._ajustar_preparado(df, feats)
+
+    def _ajustar_preparado(self, df, feats=None):
+        """`cargar_historico` sobre `df` ya ordenado y sus features."""
+        if feats is None:
+            feats = caracteristicas_cacheadas(df, self.ventana_features)
+        df_win = self._recortar_ventana(df)
+        stats = self._cargar_ventana(df_win)
+        self._contexto = None
+        self._guardar_contexto(df)
+        if df_win.empty:
+            self.medianas = None
+            self.mads = None
+            return stats
+
+        X = feats[self.features].loc[df_win.index].to_numpy(dtype=float)
+        self.medianas = np.median(X, axis=0)
+        mads = np.median(np.abs(X - self.medianas), axis=0)
+        mads = np.where(mads > 0, mads, np.std(X, axis=0))
+        # una feature constante no puede marcar nada
+        self.mads = np.where(mads > 0, mads, np.inf)
+        return stats
+
+    def procesar_punto(self, timestamp, intensity, threshold=None, occupancy=np.nan):
+        fila = {"timestamp": [timestamp], "intensity": [intensity]}
+        if self._contexto is not None and "occupancy" in self._contexto.columns:
+            fila["occupancy"] = [occupancy]
+        res = self.procesar_lote(pd.DataFrame(fila), threshold=threshold)
+        if res.empty:
+            return None
+        return res.iloc[0].to_dict()
+
+    def procesar_lote(self, df: pd.DataFrame, threshold=None) -> pd.DataFrame:
+        th = threshold if threshold is not None else self.threshold
+        if self.medianas is None or df.empty:
+            return pd.DataFrame(columns=COLUMNAS_RESULTADO)
+
+        with self.cronometro.etapa("ventana"):
+            df = _ordenar_por_tiempo(df)
+
+        with self.cronometro.etapa("features"):
+            feats = self._caracteristicas(df)
+        with self.cronometro.etapa("puntuacion"):
+            intensity, expected, score = self._puntuar_preparado(df, feats)
+
+        return self._ensamblar_lote(df, intensity, expected, score, th)
+
+    def _puntuar_preparado(self, df, feats=None):
+        if feats is None:
+            feats = self._caracteristicas(df)
+        X = feats[self.features].to_numpy(dtype=float)
+        score = np.abs((X - self.medianas) / self.mads).max(axis=1)
+        intensity = df["intensity"].to_numpy(dtype=float)
+        expected = np.full_like(score, self.baseline_med)
+        self.buffer.extend(intensity)
+        self._guardar_contexto(df)
+        return intensity, expected, score
+
+    def _params_snapshot(self):
+        return {
+            "window_days": self.window_days,
+            "threshold": self.threshold,
+            "features": self.features,
+            "ventana_features": self.ventana_features,
+            "retencion_historial": self.retencion_historial,
+        }
+
+    def _estado_snapshot(self):
+        meta, arrays = super()._estado_snapshot()
+        arrays.update(medianas=self.medianas, mads=self.mads)
+        arrays.update(_contexto_a_arrays(self._contexto))
+        return meta, arrays
+
+    def _restaurar_snapshot(self, meta, arrays):
+        super()._restaurar_snapshot(meta, arrays)
+        self.medianas = np.asarray(arrays["medianas"])
+        self.mads = np.asarray(arrays["mads"])
+        self._contexto = _contexto_desde_arrays(arrays)
+
+    def get_estadisticas(self):
+        stats = super().get_estadisticas()
+        stats["features"] = list(self.features)
+        return stats
+
+
+# ============================================================================
+# CLASE 2: DETECTOR ISOLATION FOREST
+# ============================================================================
+
+_modelo_worker = None
+
+
+def _iniciar_worker_iforest(modelo):
+    """Deja el modelo cargado una vez por proceso del pool."""
+    global _modelo_worker
+    _modelo_worker = modelo
+
+
+def _puntuar_bloque(modelo, X):
+    modelo = modelo if modelo is not None else _modelo_worker
+    return modelo.score_samples(X)
+
+
+def _normalizar_score(scores, score_min, score_max):
+    """score_samples a [0, 1] (0 normal, 1 muy raro) con los límites de calibración."""
+    denom = score_max - score_min
+    if not denom > 0:
+        denom = 1.0
+    return np.clip(1.0 - (scores - score_min) / denom, 0.0, 1.0)
+
+
+class TrafficAnomalyDetectorIForest:
+    """
+    Detector de anomalías basado en Isolation Forest (sklearn).[web:140][web:143]
+
+    - Entrena un bosque de árboles que aíslan puntos "raros".
+    - Devuelve score (cuanto más negativo, más anómalo) y etiqueta.
+
+    `n_estimators`, `max_samples` y `n_jobs` se pasan al IsolationForest para
+    equilibrar precisión y tiempo de entrenamiento. Al puntuar, la entrada se
+    parte en bloques de `tamano_bloque` filas que se reparten entre `n_jobs`
+    hilos (o procesos con `usar_procesos=True`).
+
+    `features` elige las columnas de `caracteristicas.py` que ve el bosque;
+    por defecto solo intensity. Las últimas filas de cada lote se guardan
+    (también en el snapshot) para que las features móviles del siguiente
+    continúen la serie.
+
+    El score normalizado usa el mínimo y máximo de `score_samples` sobre todo
+    el histórico (`score_min`/`score_max`, se guardan en los snapshots), así
+    que es comparable entre lotes y ningún punto del histórico se recorta;
+    solo los puntos nuevos más allá de esos límites quedan en 0 o 1.
+
+    Como en los detectores MAD, cada lote puntuado se añade a
+    `score_history`, `anomalias_detectadas`, `incidentes` y, si se asigna,
+    `almacen`: puntuar dos veces el mismo tramo lo registra dos veces en
+    todos. Para empezar de cero hay que crear otro detector.
+    """
+
+    def __init__(
+        self,
+        contamination=0.01,
+        random_state=42,
+        n_estimators=100,
+        max_samples="auto",
+        n_jobs=None,
+        tamano_bloque=65536,
+        usar_procesos=False,
+        features=("intensity",),
+        ventana_features=VENTANA_MOVIL,
+        retencion_historial=RETENCION_HISTORIAL,
+    ):
+        self.contamination = contamination
+        self.random_state = random_state
+        self.n_estimators = n_estimators
+        self.max_samples = max_samples
+        self.n_jobs = n_jobs
+        self.tamano_bloque = tamano_bloque
+        self.usar_procesos = usar_procesos
+        self.features = list(features)
+        self.ventana_features = ventana_features
+        self.retencion_historial = retencion_historial
+
+        self.modelo = None
+        self.fitted = False
+        self._contexto = None
+        # límites de normalización, calibrados al entrenar
+        self.score_min = None
+        self.score_max = None
+
+        self.anomalias_detectadas, self.score_history = _historiales(retencion_historial)
+        self.incidentes = IndiceIncidentes()
+        # AlmacenResultados opcional donde se escribe cada lote puntuado
+        self.almacen = None
+        self.cronometro = Cronometro()
+
+    def cargar_historico(self, df: pd.DataFrame):
+        """
+        Entrena el IsolationForest sobre las features elegidas en `features`.[web:17][web:146]
+        """
+        with self.cronometro.etapa("ventana"):
+            df = _ordenar_por_tiempo(df)
+
+        with self.cronometro.etapa("features"):
+            X = self._matriz(df)
+            self._contexto = None
+            self._guardar_contexto(df)
+
+        with self.cronometro.etapa("entrenamiento"):
+            self._entrenar(X)
+
+        return {"puntos": len(df)}
+
+    def _ajustar_preparado(self, df, feats=None):
+        """`cargar_historico` sobre `df` ya ordenado y sus features."""
+        self._entrenar(self._matriz(df, feats))
+        return {"puntos": len(df)}
+
+    def _entrenar(self, X):
+        """Ajusta el bosque y calibra la normalización; devuelve los scores del histórico."""
+        from sklearn.ensemble import IsolationForest  # Isolation Forest[web:143]
+
+        self.modelo = IsolationForest(
+            contamination=self.contamination,
+            random_state=self.random_state,
+            n_estimators=self.n_estimators,
+            max_samples=self.max_samples,
+            n_jobs=self.n_jobs,
+        )
+        self.modelo.fit(X)
+        self.fitted = True
+
+        scores = self._puntuar(X)
+        self.score_min = float(scores.min())
+        self.score_max = float(scores.max())
+        return scores
+
+    def _caracteristicas(self, df):
+        if self.features == ["intensity"]:
+            return None
+        return _caracteristicas_con_contexto(df, self._contexto, self.ventana_features)
+
+    def _guardar_contexto(self, df):
+        if self.features != ["intensity"]:
+            self._contexto = _contexto_features(df, self.ventana_features, self._contexto)
+
+    def _matriz(self, df, feats=None):
+        """Matriz de features de `df` (ya ordenado) en el orden de `features`."""
+        if self.features == ["intensity"]:
+            return df[["intensity"]].values
+        if feats is None:
+            feats = caracteristicas_cacheadas(df, self.ventana_features)
+        return feats[self.features].to_numpy(dtype=float)
+
+    def _puntuar(self, X):
+        """
+        score_samples por bloques, en paralelo si hay varios workers.
+
+        El resultado es idéntico al de una sola llamada.
+        """
+        from joblib import effective_n_jobs
+
+        n = len(X)
+        paso = max(1, self.tamano_bloque)
+        bloques = [(ini, min(ini + paso, n)) for ini in range(0, n, paso)]
+        n_workers = min(effective_n_jobs(self.n_jobs), len(bloques))
+
+        scores = np.empty(n)
+
+        if n_workers <= 1:
+            for ini, fin in bloques:
+                scores[ini:fin] = _puntuar_bloque(self.modelo, X[ini:fin])
+        else:
+            # el paralelismo lo ponemos nosotros: el modelo puntúa cada bloque en serie
+            n_jobs_modelo = self.modelo.n_jobs
+            self.modelo.n_jobs = 1
+            try:
+                if self.usar_procesos:
+                    pool = ProcessPoolExecutor(
+                        max_workers=n_workers,
+                        initializer=_iniciar_worker_iforest,
+                        initargs=(self.modelo,),
+                    )
+                    tareas = [(None, X[ini:fin]) for ini, fin in bloques]
+                else:
+                    pool = ThreadPoolExecutor(max_workers=n_workers)
+                    tareas = [(self.modelo, X[ini:fin]) for ini, fin in bloques]
+
+                with pool:
+                    for (ini, fin), sc in zip(bloques, pool.map(_puntuar_bloque, *zip(*tareas))):
+                        scores[ini:fin] = sc
+            finally:
+                self.modelo.n_jobs = n_jobs_modelo
+
+        return scores
+
+    def _puntuar_matriz(self, X):
+        """`(scores, es_anomalia, score_norm)` de una matriz de features."""
+        # un solo recorrido del bosque: predict() es score_samples() - offset_ < 0
+        # mayor = más normal, más bajo = más raro[web:140]
+        scores = self._puntuar(X)
+        es_anomalia = scores - self.modelo.offset_ < 0
+
+        # normalizamos el score a algo positivo para compararlo visualmente
+        score_norm = _normalizar_score(scores, self.score_min, self.score_max)
+        return scores, es_anomalia, score_norm
+
+    def procesar_lote(self, df: pd.DataFrame) -> pd.DataFrame:
+        if not self.fitted or self.modelo is None:
+            return pd.DataFrame(columns=COLUMNAS_RESULTADO)
+
+        with self.cronometro.etapa("ventana"):
+            df = _ordenar_por_tiempo(df)
+
+        with self.cronometro.etapa("features"):
+            X = self._matriz(df, self._caracteristicas(df))
+            self._guardar_contexto(df)
+
+        with self.cronometro.etapa("puntuacion"):
+            _, es_anomalia, score_norm = self._puntuar_matriz(X)
+
+        with self.cronometro.etapa("ensamblado"):
+            df_res = pd.DataFrame(
+                {
+                    "timestamp": df["timestamp"].to_numpy(),
+                    "intensity": df["intensity"].to_numpy(),
+                    "expected": np.nan,  # IF no da baseline explícito
+                    "score": score_norm,
+                    "es_anomalia": es_anomalia,
+                    "confianza": score_norm,
+                }
+            )
+
+            self.score_history.extend(df_res)
+            anomalias = df_res[es_anomalia]
+            self.anomalias_detectadas.extend(anomalias)
+            self.incidentes.agregar_resultados(anomalias)
+            if self.almacen is not None:
+                self.almacen.agregar(df_res)
+        self.cronometro.contar("puntos", len(df_res))
+
+        return df_res
+
+    # --- snapshots ---
+
+    def guardar_snapshot(self, ruta):
+        """Guarda el bosque entrenado (joblib) y los límites de normalización."""
+        import joblib
+
+        if not self.fitted or self.modelo is None:
+            raise ValueError("El detector no está entrenado")
+        meta = {
+            "params": {
+                "contamination": self.contamination,
+                "random_state": self.random_state,
+                "n_estimators": self.n_estimators,
+                "max_samples": self.max_samples,
+                "n_jobs": self.n_jobs,
+                "tamano_bloque": self.tamano_bloque,
+                "usar_procesos": self.usar_procesos,
+                "features": self.features,
+                "ventana_features": self.ventana_features,
+                "retencion_historial": self.retencion_historial,
+            },
+            "score_min": self.score_min,
+            "score_max": self.score_max,
+        }
+        _escribir_snapshot(
+            ruta,
+            type(self).__name__,
+            meta,
+            _contexto_a_arrays(self._contexto),
+            extra=lambda d: joblib.dump(self.modelo, os.path.join(d, "modelo.joblib")),
+        )
+
+    @classmethod
+    def desde_snapshot(cls, ruta):
+        """Detector entrenado a partir de un snapshot, con los arrays del bosque mapeados."""
+        import joblib
+
+        meta, arrays = _leer_snapshot(ruta, cls.__name__)
+        detector = cls(**meta["params"])
+        detector._contexto = _contexto_desde_arrays(arrays)
+        detector.modelo = joblib.load(os.path.join(ruta, "modelo.joblib"), mmap_mode="r")
+        detector.fitted = True
+        detector.score_min = meta["score_min"]
+        detector.score_max = meta["score_max"]
+        return detector
+
+    def get_estadisticas(self):
+        return {
+            "total_anomalias": self.anomalias_detectadas.total,
+            "total_incidentes": self.incidentes.total,
+            "baseline_mediana": np.nan,
+            "baseline_mad": np.nan,
+            "buffer_tamaño": len(self.score_history),
+            "baseline_edad_horas": None,
+            "ultima_anomalia": (
+                self.anomalias_detectadas[-1]["timestamp"]
+                if self.anomalias_detectadas
+                else None
+            ),
+            "rendimiento": self.cronometro.resumen(),
+        }
+
+
+# ============================================================================
+# CLASE 2b: ISOLATION FOREST ONLINE (ROTACIÓN DE ÁRBOLES)
+# ============================================================================
+
+
+class TrafficAnomalyDetectorIForestOnline:
+    """
+    Isolation Forest sobre una ventana deslizante que se renueva por tandas.
+
+    El bosque son `n_estimators // arboles_por_rotacion` cohortes de
+    `arboles_por_rotacion` árboles. Cada `rotar_cada` puntos se entrena una
+    cohorte nueva con los últimos `ventana_puntos` valores y sustituye a la
+    más antigua, así que el coste de entrenar se reparte a lo largo del
+    stream en lugar de reentrenar todo el bosque.
+
+    El score combinado es el de un único bosque con todos los árboles: la
+    media de longitudes de camino de las cohortes, que equivale a la media
+    geométrica de sus `score_samples`. Umbral (percentil `contamination`) y
+    límites de normalización se recalculan en cada rotación sobre una
+    muestra de la ventana.
+    """
+
+    def __init__(
+        self,
+        contamination=0.01,
+        random_state=42,
+        n_estimators=100,
+        arboles_por_rotacion=10,
+        ventana_puntos=7 * 1440,
+        rotar_cada=60,
+        max_samples=256,
+        muestra_umbral=2048,
+        retencion_historial=RETENCION_HISTORIAL,
+    ):
+        if n_estimators < arboles_por_rotacion:
+            raise ValueError("n_estimators debe ser >= arboles_por_rotacion")
+
+        self.contamination = contamination
+        self.random_state = random_state
+        self.n_estimators = n_estimators
+        self.arboles_por_rotacion = arboles_por_rotacion
+        self.ventana_puntos = ventana_puntos
+        self.rotar_cada = rotar_cada
+        self.max_samples = max_samples
+        self.muestra_umbral = muestra_umbral
+        self.retencion_historial = retencion_historial
+
+        self.n_cohortes = n_estimators // arboles_por_rotacion
+        self._cohortes = deque(maxlen=self.n_cohortes)
+        self._rng = np.random.RandomState(random_state)
+        self.buffer = deque(maxlen=ventana_puntos)
+        self._desde_rotacion = 0
+        self.rotaciones = 0
+
+        self.offset_ = None
+        self.score_min = None
+        self.score_max = None
+        self.fitted = False
+
+        self.anomalias_detectadas, self.score_history = _historiales(retencion_historial)
+        self.incidentes = IndiceIncidentes()
+        # AlmacenResultados opcional donde se escribe cada lote puntuado
+        self.almacen = None
+        self.cronometro = Cronometro()
+
+    def _nueva_cohorte(self):
+        from sklearn.ensemble import IsolationForest
+
+        X = np.fromiter(self.buffer, dtype=float, count=len(self.buffer))[:, None]
+        modelo = IsolationForest(
+            n_estimators=self.arboles_por_rotacion,
+            max_samples=min(self.max_samples, len(X)),
+            random_state=self._rng.randint(np.iinfo(np.int32).max),
+        )
+        modelo.fit(X)
+        self._cohortes.append(modelo)
+
+    def _score(self, X):
+        """score_samples del bosque completo (más bajo = más raro)."""
+        log_h = np.zeros(len(X))
+        for modelo in self._cohortes:
+            log_h += np.log2(-modelo.score_samples(X))
+        return -np.exp2(log_h / len(self._cohortes))
+
+    def _recalibrar(self):
+        X = np.fromiter(self.buffer, dtype=float, count=len(self.buffer))
+        if len(X) > self.muestra_umbral:
+            X = X[self._rng.choice(len(X), self.muestra_umbral, replace=False)]
+        scores = self._score(X[:, None])
+        self.offset_ = float(np.percentile(scores, 100.0 * self.contamination))
+        self.score_min = float(scores.min())
+        self.score_max = float(scores.max())
+
+    def _rotar(self):
+        with self.cronometro.etapa("rotacion"):
+            self._nueva_cohorte()
+            self._recalibrar()
+        self._desde_rotacion = 0
+        self.rotaciones += 1
+
+    def cargar_historico(self, df: pd.DataFrame):
+        """Llena la ventana con el final del histórico y entrena todas las cohortes."""
+        df = df.copy()
+        df["timestamp"] = pd.to_datetime(df["timestamp"])
+        df = df.sort_values("timestamp")
+
+        self.buffer = deque(
+            df["intensity"].to_numpy(dtype=float)[-self.ventana_puntos :],
+            maxlen=self.ventana_puntos,
+        )
+        self._cohortes.clear()
+        if self.buffer:
+            with self.cronometro.etapa("entrenamiento"):
+                for _ in range(self.n_cohortes):
+                    self._nueva_cohorte()
+                self._recalibrar()
+            self.fitted = True
+        self._desde_rotacion = 0
+
+        return {"puntos": len(self.buffer), "cohortes": len(self._cohortes)}
+
+    def _normalizar(self, scores):
+        return _normalizar_score(scores, self.score_min, self.score_max)
+
+    def procesar_punto(self, timestamp, intensity):
+        if not self.fitted:
+            return None
+        res = self.procesar_lote(
+            pd.DataFrame({"timestamp": [timestamp], "intensity": [intensity]})
+        )
+        return res.iloc[0].to_dict()
+
+    def procesar_lote(self, df: pd.DataFrame) -> pd.DataFrame:
+        """
+        Puntúa un micro-lote en orden, rotando cohortes donde toque.
+
+        El lote se parte en tramos que acaban en cada rotación; cada tramo se
+        puntúa vectorizado con el bosque vigente, igual que punto a punto.
+        """
+        if not self.fitted or df.empty:
+            return pd.DataFrame(columns=COLUMNAS_RESULTADO)
+
+        intensity = df["intensity"].to_numpy(dtype=float)
+        n = len(intensity)
+        scores = np.empty(n)
+        score_norm = np.empty(n)
+        es_anomalia = np.empty(n, dtype=bool)
+
+        ini = 0
+        while ini < n:
+            fin = min(n, ini + self.rotar_cada - self._desde_rotacion)
+            with self.cronometro.etapa("puntuacion"):
+                s = self._score(intensity[ini:fin, None])
+                scores[ini:fin] = s
+                es_anomalia[ini:fin] = s < self.offset_
+                score_norm[ini:fin] = self._normalizar(s)
+
+            self.buffer.extend(intensity[ini:fin])
+            self._desde_rotacion += fin - ini
+            if self._desde_rotacion >= self.rotar_cada:
+                self._rotar()
+            ini = fin
+
+        with self.cronometro.etapa("ensamblado"):
+            df_res = pd.DataFrame(
+                {
+                    "timestamp": df["timestamp"].to_numpy(),
+                    "intensity": intensity,
+                    "expected": np.nan,
+                    "score": score_norm,
+                    "es_anomalia": es_anomalia,
+                    "confianza": score_norm,
+                }
+            )
+
+            anomalias = df_res[es_anomalia]
+            self.score_history.extend(df_res)
+            self.anomalias_detectadas.extend(anomalias)
+            self.incidentes.agregar_resultados(anomalias)
+            if self.almacen is not None:
+                self.almacen.agregar(df_res)
+        self.cronometro.contar("puntos", n)
+
+        return df_res
+
+    def get_estadisticas(self):
+        return {
+            "total_anomalias": self.anomalias_detectadas.total,
+            "total_incidentes": self.incidentes.total,
+            "baseline_mediana": np.nan,
+            "baseline_mad": np.nan,
+            "buffer_tamaño": len(self.buffer),
+            "baseline_edad_horas": None,
+            "ultima_anomalia": (
+                self.anomalias_detectadas[-1]["timestamp"]
+                if self.anomalias_detectadas
+                else None
+            ),
+            "rotaciones": self.rotaciones,
+            "rendimiento": self.cronometro.resumen(),
+        }
+
+
+# ============================================================================
+# CLASE 2c: ENSEMBLE MAD + ISOLATION FOREST
+# ============================================================================
+
+MODOS_ENSEMBLE = ("ponderado", "cualquiera", "todos")
+
+
+class TrafficAnomalyDetectorEnsemble:
+    """
+    MAD e Isolation Forest sobre un único recorrido de los datos.
+
+    Ordenar por tiempo y calcular las features se hace una vez por lote y
+    los dos modelos entrenan y puntúan a la vez en un pool de hilos. Con
+    `features` distinto de solo intensity el MAD es el multivariante, que
+    no detecta derivas: `deriva=True` solo vale con intensity.
+
+    Los scores se llevan a una escala común en la que 0 es lo típico y 1 el
+    umbral de decisión de cada modelo: score MAD / `threshold` para el MAD,
+    y (mediana - s) / (mediana - offset_) para Isolation Forest, con la
+    mediana de `score_samples` sobre una muestra del histórico. `modo`:
+
+    - `"ponderado"`: anomalía si la media ponderada (`pesos`) de los scores
+      calibrados supera `umbral`.
+    - `"cualquiera"` / `"todos"`: anomalía si uno / los dos superan 1.
+
+    El `score` del resultado es siempre la media ponderada; `score_mad` y
+    `score_iforest` llevan los calibrados de cada modelo. `cronometro`
+    separa las etapas compartidas de las de cada modelo (`puntuacion.mad`,
+    `puntuacion.iforest`, ...).
+    """
+
+    def __init__(
+        self,
+        window_days=42,
+        threshold=3.5,
+        contamination=0.01,
+        n_estimators=100,
+        random_state=42,
+        features=("intensity",),
+        deriva=False,
+        modo="ponderado",
+        pesos=None,
+        umbral=1.0,
+        paralelo=True,
+        ventana_features=VENTANA_MOVIL,
+        retencion_historial=RETENCION_HISTORIAL,
+    ):
+        if modo not in MODOS_ENSEMBLE:
+            raise ValueError(f"modo debe ser uno de {MODOS_ENSEMBLE}")
+        if deriva and list(features) != ["intensity"]:
+            raise ValueError("deriva solo se admite con features=['intensity']")
+
+        self.window_days = window_days
+        self.threshold = threshold
+        self.contamination = contamination
+        self.features = list(features)
+        self.modo = modo
+        self.pesos = dict(pesos or {"mad": 1.0, "iforest": 1.0})
+        self.umbral = umbral
+        self.paralelo = paralelo
+        self.ventana_features = ventana_features
+        self.retencion_historial = retencion_historial
+
+        if self.features == ["intensity"]:
+            mad = TrafficAnomalyDetectorMAD(
+                window_days=window_days, threshold=threshold, deriva=deriva
+            )
+        else:
+            mad = TrafficAnomalyDetectorMADMultivariante(
+                window_days=window_days,
+                threshold=threshold,
+                features=self.features,
+                ventana_features=ventana_features,
+            )
+        iforest = TrafficAnomalyDetectorIForest(
+            contamination=contamination,
+            n_estimators=n_estimators,
+            random_state=random_state,
+            features=self.features,
+            ventana_features=ventana_features,
+        )
+        self.componentes = {"mad": mad, "iforest": iforest}
+        # calibración del bosque: mediana de score_samples en el histórico
+        self.mediana_iforest = None
+        self._contexto = None
+        self.anomalias_componente = {nombre: 0 for nombre in self.componentes}
+
+        self.anomalias_detectadas, self.score_history = _historiales(retencion_historial)
+        self.incidentes = IndiceIncidentes()
+        # AlmacenResultados opcional donde se escribe cada lote puntuado
+        self.almacen = None
+        self.cronometro = Cronometro()
+
+    @property
+    def fitted(self):
+        return self.componentes["iforest"].fitted and self.mediana_iforest is not None
+
+    def _features(self, df):
+        if self.features == ["intensity"]:
+            return None
+        return _caracteristicas_con_contexto(df, self._contexto, self.ventana_features)
+
+    def _en_paralelo(self, etapa, tareas):
+        """Ejecuta {nombre: función} (a la vez si `paralelo`) y mide cada una."""
+
+        def medir(nombre):
+            with self.cronometro.etapa(f"{etapa}.{nombre}"):
+                return tareas[nombre]()
+
+        if not self.paralelo:
+            return {nombre: medir(nombre) for nombre in tareas}
+        with ThreadPoolExecutor(max_workers=len(tareas)) as pool:
+            futuros = {nombre: pool.submit(medir, nombre) for nombre in tareas}
+            return {nombre: fut.result() for nombre, fut in futuros.items()}
+
+    def cargar_historico(self, df: pd.DataFrame):
+        with self.cronometro.etapa("ventana"):
+            df = _ordenar_por_tiempo(df)
+        with self.cronometro.etapa("features"):
+            feats = self._features(df)
+
+        mad = self.componentes["mad"]
+        stats = self._en_paralelo(
+            "entrenamiento",
+            {
+                "mad": lambda: mad._ajustar_preparado(df, feats),
+                "iforest": lambda: self._entrenar_iforest(df, feats),
+            },
+        )
+        if not df.empty:
+            self._contexto = _contexto_features(df, self.ventana_features)
+        return dict(stats["mad"], puntos=len(df))
+
+    def _entrenar_iforest(self, df, feats):
+        iforest = self.componentes["iforest"]
+        if df.empty:
+            return {"puntos": 0}
+        # los scores con los que el bosque calibra su normalización dan la mediana
+        self.mediana_iforest = float(np.median(iforest._entrenar(iforest._matriz(df, feats))))
+        return {"puntos": len(df)}
+
+    def _puntuar_mad(self, df, feats, th):
+        mad = self.componentes["mad"]
+        _, expected, score = mad._puntuar_preparado(df, feats)
+        return expected, score / th if th > 0 else np.zeros_like(score)
+
+    def _puntuar_iforest(self, df, feats):
+        iforest = self.componentes["iforest"]
+        scores, _, _ = iforest._puntuar_matriz(iforest._matriz(df, feats))
+        denom = self.mediana_iforest - iforest.modelo.offset_
+        if not denom > 0:
+            denom = 1.0
+        return (self.mediana_iforest - scores) / denom
+
+    def procesar_lote(self, df: pd.DataFrame, threshold=None) -> pd.DataFrame:
+        th = threshold if threshold is not None else self.threshold
+        mad = self.componentes["mad"]
+        if not self.fitted or mad.baseline_mad is None or df.empty:
+            return pd.DataFrame(columns=COLUMNAS_RESULTADO)
+
+        with self.cronometro.etapa("ventana"):
+            df = _ordenar_por_tiempo(df)
+        with self.cronometro.etapa("features"):
+            feats = self._features(df)
+
+        calibrados = self._en_paralelo(
+            "puntuacion",
+            {
+                "mad": lambda: self._puntuar_mad(df, feats, th),
+                "iforest": lambda: self._puntuar_iforest(df, feats),
+            },
+        )
+        expected, score_mad = calibrados["mad"]
+        score_iforest = calibrados["iforest"]
+        self._contexto = _contexto_features(df, self.ventana_features, self._contexto)
+
+        with self.cronometro.etapa("combinacion"):
+            w_mad, w_if = self.pesos.get("mad", 0.0), self.pesos.get("iforest", 0.0)
+            total = w_mad + w_if if w_mad + w_if > 0 else 1.0
+            # lo muy normal no compensa: por debajo de 0 cuenta como 0
+            score = (
+                w_mad * np.maximum(score_mad, 0.0) + w_if * np.maximum(score_iforest, 0.0)
+            ) / total
+            voto_mad, voto_if = score_mad > 1.0, score_iforest > 1.0
+            if self.modo == "ponderado":
+                es_anomalia = score > self.umbral
+            elif self.modo == "cualquiera":
+                es_anomalia = voto_mad | voto_if
+            else:
+                es_anomalia = voto_mad & voto_if
+            self.anomalias_componente["mad"] += int(voto_mad.sum())
+            self.anomalias_componente["iforest"] += int(voto_if.sum())
+
+        with self.cronometro.etapa("ensamblado"):
+            df_res = pd.DataFrame(
+                {
+                    "timestamp": df["timestamp"].to_numpy(),
+                    "intensity": df["intensity"].to_numpy(dtype=float),
+                    "expected": expected,
+                    "score": score,
+                    "es_anomalia": es_anomalia,
+                    "confianza": np.minimum(score / self.umbral, 1.0)
+                    if self.umbral > 0
+                    else np.zeros_like(score),
+                    "score_mad": score_mad,
+                    "score_iforest": score_iforest,
+                }
+            )
+
+            anomalias = df_res[es_anomalia]
+            self.score_history.extend(df_res)
+            self.anomalias_detectadas.extend(anomalias)
+            self.incidentes.agregar_resultados(anomalias)
+            if self.almacen is not None:
+                self.almacen.agregar(df_res)
+        self.cronometro.contar("puntos", len(df_res))
+
+        return df_res
+
+    def get_estadisticas(self):
+        mad = self.componentes["mad"]
+        return {
+            "total_anomalias": self.anomalias_detectadas.total,
+            "total_incidentes": self.incidentes.total,
+            "baseline_mediana": mad.baseline_med,
+            "baseline_mad": mad.baseline_mad,
+            "buffer_tamaño": len(mad.buffer),
+            "baseline_edad_horas": None,
+            "ultima_anomalia": (
+                self.anomalias_detectadas[-1]["timestamp"]
+                if self.anomalias_detectadas
+                else None
+            ),
+            "anomalias_por_componente": dict(self.anomalias_componente),
+            "rendimiento": self.cronometro.resumen(),
+        }
+
+
+# ============================================================================
+# CLASE 3: DETECTOR MAD MULTISENSOR (FLOTA)
+# ============================================================================
+
+_SIN_MINUTO = np.iinfo(np.int64).min
+# huecos de hasta tantos minutos se vacían con un índice por celda, todos a la vez
+_HUECO_VECTORIZADO = 64
+
+
+class TrafficAnomalyDetectorFlota:
+    """
+    Detector MAD para muchos sensores a la vez.
+
+    En lugar de un detector por sensor, el estado de todos vive en arrays
+    compartidos: `_valores` es una matriz sensor × franja de la ventana
+    (minuto epoch módulo `window_minutos`) y mediana/MAD son vectores con
+    una posición por sensor. Un lote intercalado de
+    (sensor_id, timestamp, intensity) se puntúa en un único paso vectorizado.
+
+    El baseline de cada sensor se recalcula cuando han pasado al menos
+    `refresco_minutos` de datos desde el último cálculo, y solo si tiene
+    `min_puntos` valores en su ventana.
+    """
+
+    def __init__(
+        self,
+        window_days=42,
+        threshold=3.5,
+        refresco_minutos=60,
+        min_puntos=100,
+        sensores_por_bloque=256,
+    ):
+        self.window_days = window_days
+        self.window_minutos = window_days * 1440
+        self.threshold = threshold
+        self.refresco_minutos = refresco_minutos
+        self.min_puntos = min_puntos
+        self.sensores_por_bloque = sensores_por_bloque
+
+        self.sensor_ids = pd.Index([])
+        self._capacidad = 0
+        self._valores = np.empty((0, self.window_minutos), dtype=np.float32)
+        self.baseline_med = np.empty(0)
+        self.baseline_mad = np.empty(0)
+        self._ultimo_minuto = np.empty(0, dtype=np.int64)
+        self._minuto_refresco = np.empty(0, dtype=np.int64)
+        self._ultimo_score = np.empty(0)
+        self._en_anomalia = np.empty(0, dtype=bool)
+        self._total_anomalias = np.empty(0, dtype=np.int64)
+        self._ultima_anomalia = np.empty(0, dtype=np.int64)
+        self._reservar(16)
+        self.cronometro = Cronometro()
+
+    @property
+    def n_sensores(self):
+        return len(self.sensor_ids)
+
+    def _reservar(self, capacidad):
+        """Amplía los arrays por sensor (duplicando) para `capacidad` sensores."""
+        if capacidad <= self._capacidad:
+            return
+        extra = max(capacidad, 2 * self._capacidad) - self._capacidad
+
+        def crecer(arr, relleno):
+            pad = np.full((extra, *arr.shape[1:]), relleno, dtype=arr.dtype)
+            return np.concatenate([arr, pad])
+
+        self._valores = crecer(self._valores, np.nan)
+        self.baseline_med = crecer(self.baseline_med, np.nan)
+        self.baseline_mad = crecer(self.baseline_mad, np.nan)
+        self._ultimo_minuto = crecer(self._ultimo_minuto, _SIN_MINUTO)
+        self._minuto_refresco = crecer(self._minuto_refresco, _SIN_MINUTO)
+        self._ultimo_score = crecer(self._ultimo_score, np.nan)
+        self._en_anomalia = crecer(self._en_anomalia, False)
+        self._total_anomalias = crecer(self._total_anomalias, 0)
+        self._ultima_anomalia = crecer(self._ultima_anomalia, _SIN_MINUTO)
+        self._capacidad += extra
+
+    def _filas(self, ids):
+        """Fila de cada sensor_id, dando de alta los que no se han visto."""
+        filas = self.sensor_ids.get_indexer(ids)
+        nuevos = filas < 0
+        if nuevos.any():
+            self.sensor_ids = self.sensor_ids.append(pd.Index(pd.unique(ids[nuevos])))
+            self._reservar(self.n_sensores)
+            filas[nuevos] = self.sensor_ids.get_indexer(ids[nuevos])
+        return filas
+
+    @staticmethod
+    def _minutos(timestamps):
+        ts = pd.DatetimeIndex(pd.to_datetime(timestamps))
+        return ts.as_unit("ns").asi8 // 60_000_000_000
+
+    def _escribir(self, filas, minutos, valores):
+        """
+        Guarda los valores en la ventana de cada sensor.
+
+        Antes se vacían las franjas entre el último minuto visto y el nuevo,
+        para que un hueco en los datos no deje valores de hace una ventana.
+        Los sensores nuevos no se tocan: su fila ya es NaN.
+        """
+        W = self.window_minutos
+        tocados = np.unique(filas)
+
+        t_max = np.full(self._capacidad, _SIN_MINUTO, dtype=np.int64)
+        np.maximum.at(t_max, filas, minutos)
+        vistos = tocados[self._ultimo_minuto[tocados] != _SIN_MINUTO]
+        desde = np.maximum(self._ultimo_minuto[vistos], t_max[vistos] - W)
+        largo = np.maximum(t_max[vistos] - desde, 0)
+
+        # lo normal en streaming: pocos minutos por sensor, en una asignación
+        cortos = (largo > 0) & (largo <= _HUECO_VECTORIZADO)
+        if cortos.any():
+            n = largo[cortos]
+            inicio = np.repeat(np.cumsum(n) - n, n)
+            offset = np.arange(int(n.sum())) - inicio
+            cols = (np.repeat(desde[cortos], n) + 1 + offset) % W
+            self._valores[np.repeat(vistos[cortos], n), cols] = np.nan
+        # huecos largos: como mucho dos cortes del anillo por sensor
+        for fila, d, n in zip(
+            vistos[largo > _HUECO_VECTORIZADO],
+            desde[largo > _HUECO_VECTORIZADO],
+            largo[largo > _HUECO_VECTORIZADO],
+        ):
+            ini = int((d + 1) % W)
+            fin = ini + int(n)
+            self._valores[fila, ini : min(fin, W)] = np.nan
+            if fin > W:
+                self._valores[fila, : fin - W] = np.nan
+
+        self._ultimo_minuto[tocados] = np.maximum(
+            self._ultimo_minuto[tocados], t_max[tocados]
+        )
+
+        # los que llegan tarde solo entran si siguen dentro de la ventana
+        dentro = minutos > self._ultimo_minuto[filas] - W
+        self._valores[filas[dentro], minutos[dentro] % W] = valores[dentro]
+
+        return tocados
+
+    def _refrescar(self, filas):
+        """Recalcula mediana/MAD de los sensores indicados, por bloques."""
+        for ini in range(0, len(filas), self.sensores_por_bloque):
+            idx = filas[ini : ini + self.sensores_por_bloque]
+            bloque = self._valores[idx]
+            n_validos = np.count_nonzero(~np.isnan(bloque), axis=1)
+
+            ok = n_validos >= self.min_puntos
+            med = np.full(len(idx), np.nan)
+            mad = np.full(len(idx), np.nan)
+            if ok.any():
+                b = bloque[ok]
+                med[ok] = np.nanmedian(b, axis=1)
+                m = np.nanmedian(np.abs(b - med[ok, None]), axis=1)
+                mad[ok] = np.where(m > 0, m, np.nanstd(b, axis=1))
+
+            self.baseline_med[idx] = med
+            self.baseline_mad[idx] = mad
+            self._minuto_refresco[idx] = self._ultimo_minuto[idx]
+
+    def cargar_historico(self, df: pd.DataFrame):
+        """
+        Llena la ventana de cada sensor con su histórico y calcula baselines.
+
+        `df` lleva columnas sensor_id, timestamp e intensity, intercaladas en
+        cualquier orden. Cada sensor conserva sus últimos `window_days` días.
+        """
+        if df.empty:
+            return {"sensores": self.n_sensores, "puntos": 0}
+
+        with self.cronometro.etapa("ventana"):
+            filas = self._filas(df["sensor_id"].to_numpy())
+            minutos = self._minutos(df["timestamp"])
+            valores = df["intensity"].to_numpy(dtype=np.float32)
+            tocados = self._escribir(filas, minutos, valores)
+        with self.cronometro.etapa("baseline"):
+            self._refrescar(tocados)
+
+        return {
+            "sensores": len(tocados),
+            "puntos": len(df),
+            "con_baseline": int(np.count_nonzero(self.baseline_mad[tocados] > 0)),
+        }
+
+    def procesar_lote(self, df: pd.DataFrame, threshold=None) -> pd.DataFrame:
+        """
+        Puntúa un lote intercalado de varios sensores en un paso.
+
+        Cada punto se compara con el baseline de su sensor vigente al inicio
+        del lote; después se escriben los valores y se refrescan los sensores
+        a los que les toca. Los sensores sin baseline dan score NaN.
+        """
+        th = threshold if threshold is not None else self.threshold
+        if df.empty:
+            return pd.DataFrame(columns=["sensor_id", *COLUMNAS_RESULTADO])
+
+        ids = df["sensor_id"].to_numpy()
+        with self.cronometro.etapa("ventana"):
+            filas = self._filas(ids)
+            minutos = self._minutos(df["timestamp"])
+            intensity = df["intensity"].to_numpy(dtype=float)
+
+        with self.cronometro.etapa("puntuacion"):
+            expected = self.baseline_med[filas]
+            mad = self.baseline_mad[filas]
+            with np.errstate(invalid="ignore", divide="ignore"):
+                score = np.where(mad > 0, np.abs(intensity - expected) / mad, np.nan)
+            es_anomalia = score > th
+            if th > 0:
+                confianza = np.minimum(score / th, 1.0)
+            else:
+                confianza = np.zeros_like(score)
+
+            # estado por sensor: el último punto (en tiempo) de cada uno en el lote
+            orden = np.lexsort((minutos, filas))
+            ultimos = orden[np.r_[filas[orden][1:] != filas[orden][:-1], True]]
+            self._ultimo_score[filas[ultimos]] = score[ultimos]
+            self._en_anomalia[filas[ultimos]] = es_anomalia[ultimos]
+            self._total_anomalias += np.bincount(
+                filas[es_anomalia], minlength=self._capacidad
+            )
+            np.maximum.at(self._ultima_anomalia, filas[es_anomalia], minutos[es_anomalia])
+
+        with self.cronometro.etapa("baseline"):
+            tocados = self._escribir(filas, minutos, intensity.astype(np.float32))
+            toca = tocados[
+                self._ultimo_minuto[tocados]
+                >= self._minuto_refresco[tocados] + self.refresco_minutos
+            ]
+            if toca.size:
+                self._refrescar(toca)
+
+        with self.cronometro.etapa("ensamblado"):
+            df_res = pd.DataFrame(
+                {
+                    "sensor_id": ids,
+                    "timestamp": df["timestamp"].to_numpy(),
+                    "intensity": intensity,
+                    "expected": expected,
+                    "score": score,
+                    "es_anomalia": es_anomalia,
+                    "confianza": confianza,
+                }
+            )
+        self.cronometro.contar("puntos", len(df_res))
+        return df_res
+
+    def estado_sensores(self) -> pd.DataFrame:
+        """Estado de anomalía por sensor, una fila por sensor."""
+        n = self.n_sensores
+
+        def a_timestamp(minutos):
+            # el centinela _SIN_MINUTO es justo NaT en datetime64
+            return pd.to_datetime(minutos.astype("datetime64[m]"))
+
+        return pd.DataFrame(
+            {
+                "sensor_id": self.sensor_ids,
+                "baseline_mediana": self.baseline_med[:n],
+                "baseline_mad": self.baseline_mad[:n],
+                "ultimo_timestamp": a_timestamp(self._ultimo_minuto[:n]),
+                "ultimo_score": self._ultimo_score[:n],
+                "en_anomalia": self._en_anomalia[:n],
+                "total_anomalias": self._total_anomalias[:n],
+                "ultima_anomalia": a_timestamp(self._ultima_anomalia[:n]),
+            }
+        )
+
+    def get_estadisticas(self):
+        n = self.n_sensores
+        return {
+            "sensores": n,
+            "sensores_en_anomalia": int(self._en_anomalia[:n].sum()),
+            "total_anomalias": int(self._total_anomalias[:n].sum()),
+            "buffer_tamaño": int(np.count_nonzero(~np.isnan(self._valores[:n]))),
+            "memoria_ventanas_mb": self._valores.nbytes / 2**20,
+            "rendimiento": self.cronometro.resumen(),
+        }
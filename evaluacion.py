@@ -0,0 +1,296 @@
+"""
+Evaluación de calidad y velocidad de configuraciones de detectores.
+
+Cada configuración se entrena con los primeros `DIAS_LIMPIOS` días de cada
+escenario etiquetado (ver `generador.py`) y puntúa el resto de una vez. Se
+compara con la verdad de campo por eventos:
+
+- `recall`: fracción de intervalos etiquetados con al menos una alarma.
+- `precision`: fracción de episodios de alarma (incidentes: anomalías
+  consecutivas con huecos de hasta `HUECO_INCIDENTE` minutos, ver
+  `incidentes.py`) que tocan un intervalo etiquetado.
+- `f1` de las dos anteriores.
+- `retardo_min`: minutos desde el inicio de cada intervalo detectado hasta
+  su primera alarma (media).
+- `falsas_dia`: episodios sin etiqueta por día puntuado.
+
+junto a `segundos` (entrenar + puntuar) y `rss_pico_mb`. Cada caso corre en
+un proceso nuevo, en paralelo, así que el pico de RSS es el suyo.
+
+Uso:
+    python evaluacion.py --generar escenarios_etiquetados/
+    python evaluacion.py --configs mis_configs.json --f1-min 0.8
+"""
+
+import argparse
+import itertools
+import json
+import os
+import resource
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import numpy as np
+import pandas as pd
+
+from generador import DIAS_LIMPIOS, TIPOS_ESCENARIO, generar_escenarios, leer_etiquetas
+from incidentes import HUECO_INCIDENTE, IndiceIncidentes
+
+DIRECTORIO = "escenarios_etiquetados"
+
+# rejilla por defecto: {"detector": nombre, **parámetros del constructor}
+CONFIGS_DEFECTO = (
+    [
+        {"detector": "mad", "window_days": w, "threshold": th}
+        for w, th in itertools.product((7, 14), (3.0, 3.5, 4.0, 5.0))
+    ]
+    + [
+        {"detector": "mad", "window_days": 7, "threshold": th, "deriva": True}
+        for th in (3.5, 4.0)
+    ]
+    + [
+        {"detector": "mad-estacional", "window_days": 7, "threshold": th}
+        for th in (3.5, 4.0, 5.0)
+    ]
+    + [
+        {"detector": "mad-multivariante", "window_days": 7, "threshold": th}
+        for th in (4.0, 5.0)
+    ]
+    + [{"detector": "iforest", "contamination": c} for c in (0.005, 0.01)]
+    + [
+        {"detector": "ensemble", "window_days": 7, "threshold": 3.5, "modo": modo}
+        for modo in ("ponderado", "todos")
+    ]
+)
+
+
+def crear_detector(config):
+    from detectores import (
+        TrafficAnomalyDetectorEnsemble,
+        TrafficAnomalyDetectorIForest,
+        TrafficAnomalyDetectorIForestOnline,
+        TrafficAnomalyDetectorMAD,
+        TrafficAnomalyDetectorMADEstacional,
+        TrafficAnomalyDetectorMADMultivariante,
+    )
+
+    clases = {
+        "mad": TrafficAnomalyDetectorMAD,
+        "mad-estacional": TrafficAnomalyDetectorMADEstacional,
+        "mad-multivariante": TrafficAnomalyDetectorMADMultivariante,
+        "iforest": TrafficAnomalyDetectorIForest,
+        "iforest-online": TrafficAnomalyDetectorIForestOnline,
+        "ensemble": TrafficAnomalyDetectorEnsemble,
+    }
+    params = {k: v for k, v in config.items() if k != "detector"}
+    return clases[config["detector"]](**params)
+
+
+def nombre_config(config):
+    params = ",".join(f"{k}={v}" for k, v in config.items() if k != "detector")
+    return f"{config['detector']}({params})"
+
+
+# ============================================================================
+# MÉTRICAS
+# ============================================================================
+
+
+def episodios(timestamps, es_anomalia, hueco=HUECO_INCIDENTE):
+    """Intervalos [inicio, fin] de anomalías consecutivas (huecos ≤ `hueco` min)."""
+    ts = pd.DatetimeIndex(timestamps)[np.asarray(es_anomalia, dtype=bool)]
+    indice = IndiceIncidentes(hueco_minutos=hueco, max_incidentes=None)
+    indice.agregar(ts, np.zeros(len(ts)), np.zeros(len(ts)))
+    return indice.inicio, indice.fin
+
+
+def metricas_eventos(timestamps, es_anomalia, etiquetas, dias_puntuados):
+    """Precision/recall/F1 por eventos, retardo de detección y falsas alarmas."""
+    ep_ini, ep_fin = episodios(timestamps, es_anomalia)
+    et_ini = etiquetas["inicio"].to_numpy(dtype="M8[ns]")
+    et_fin = etiquetas["fin"].to_numpy(dtype="M8[ns]")
+
+    # solape episodio × etiqueta, todo con broadcasting (pocas filas de cada)
+    solape = (ep_ini[:, None] <= et_fin[None, :]) & (ep_fin[:, None] >= et_ini[None, :])
+    episodio_ok = solape.any(axis=1)
+    detectada = solape.any(axis=0)
+
+    # primera alarma dentro de cada intervalo etiquetado
+    ts = pd.DatetimeIndex(timestamps).as_unit("ns").asi8
+    alarmas = ts[np.asarray(es_anomalia, dtype=bool)]
+    retardos = []
+    for ini, fin in zip(et_ini.astype(np.int64), et_fin.astype(np.int64)):
+        i = np.searchsorted(alarmas, ini)
+        if i < len(alarmas) and alarmas[i] <= fin:
+            retardos.append((alarmas[i] - ini) / 60_000_000_000)
+
+    n_ep = len(ep_ini)
+    n_et = len(et_ini)
+    precision = float(episodio_ok.mean()) if n_ep else (1.0 if n_et == 0 else 0.0)
+    recall = float(detectada.mean()) if n_et else np.nan
+    f1 = (
+        2 * precision * recall / (precision + recall)
+        if n_et and precision + recall > 0
+        else (0.0 if n_et else np.nan)
+    )
+    return {
+        "precision": precision,
+        "recall": recall,
+        "f1": f1,
+        "retardo_min": float(np.mean(retardos)) if retardos else np.nan,
+        "episodios": n_ep,
+        "falsas_dia": float((~episodio_ok).sum() / dias_puntuados) if dias_puntuados else np.nan,
+    }
+
+
+# ============================================================================
+# EJECUCIÓN
+# ============================================================================
+
+
+def evaluar_caso(config, escenario, ruta_csv, ruta_etiquetas):
+    """Entrena, puntúa y mide un caso. Se ejecuta en un proceso del pool."""
+    df = pd.read_csv(ruta_csv)
+    df["timestamp"] = pd.to_datetime(df["timestamp"])
+    etiquetas = leer_etiquetas(ruta_etiquetas)
+
+    corte = df["timestamp"].iloc[0] + pd.Timedelta(days=DIAS_LIMPIOS)
+    historico = df[df["timestamp"] < corte]
+    resto = df[df["timestamp"] >= corte].reset_index(drop=True)
+
+    detector = crear_detector(config)
+    t0 = time.perf_counter()
+    detector.cargar_historico(historico)
+    ajuste_s = time.perf_counter() - t0
+    df_res = detector.procesar_lote(resto)
+    segundos = time.perf_counter() - t0
+
+    res = {
+        "config": nombre_config(config),
+        "detector": config["detector"],
+        "escenario": escenario,
+        "puntos": len(resto),
+        "ajuste_s": ajuste_s,
+        "segundos": segundos,
+        "puntos_s": len(resto) / segundos if segundos > 0 else np.nan,
+        "anomalias": int(df_res["es_anomalia"].sum()),
+    }
+    res.update(
+        metricas_eventos(
+            df_res["timestamp"], df_res["es_anomalia"], etiquetas, len(resto) / 1440
+        )
+    )
+    # ru_maxrss en KB (Linux); el proceso es solo de este caso
+    res["rss_pico_mb"] = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+    return res
+
+
+def evaluar(configs, escenarios, workers=None):
+    """
+    Evalúa todas las combinaciones configuración × escenario en paralelo.
+
+    `escenarios` es {nombre: (csv, csv_etiquetas)}. Devuelve un DataFrame
+    con una fila por caso.
+    """
+    casos = [
+        (config, esc, rutas[0], rutas[1])
+        for config in configs
+        for esc, rutas in escenarios.items()
+    ]
+    filas = []
+    # un proceso por caso: el pico de RSS no se mezcla entre casos
+    with ProcessPoolExecutor(max_workers=workers, max_tasks_per_child=1) as pool:
+        futuros = {pool.submit(evaluar_caso, *caso): caso for caso in casos}
+        for fut in as_completed(futuros):
+            config, esc = futuros[fut][:2]
+            try:
+                filas.append(fut.result())
+            except Exception as e:
+                print(f"❌ {nombre_config(config)} / {esc}: {e}", file=sys.stderr)
+    return pd.DataFrame(filas).sort_values(["config", "escenario"], ignore_index=True)
+
+
+def resumir(resultados):
+    """
+    Una fila por configuración.
+
+    `f1`, `recall` y `retardo_min` promedian los escenarios con etiquetas;
+    `falsas_dia` promedia los que no tienen (normal, ruido alto); tiempo y
+    memoria son el total y el máximo de todos los escenarios.
+    """
+    con = resultados[resultados["recall"].notna()]
+    sin = resultados[resultados["recall"].isna()]
+    resumen = pd.DataFrame(
+        {
+            "detector": resultados.groupby("config")["detector"].first(),
+            "f1": con.groupby("config")["f1"].mean(),
+            "recall": con.groupby("config")["recall"].mean(),
+            "precision": con.groupby("config")["precision"].mean(),
+            "retardo_min": con.groupby("config")["retardo_min"].mean(),
+            "falsas_dia": sin.groupby("config")["falsas_dia"].mean(),
+            "segundos": resultados.groupby("config")["segundos"].sum(),
+            "rss_pico_mb": resultados.groupby("config")["rss_pico_mb"].max(),
+        }
+    )
+    return resumen.sort_values(["f1", "segundos"], ascending=[False, True])
+
+
+def mejor_configuracion(resumen, f1_min=0.8, recall_min=1.0):
+    """La configuración más rápida con `f1 >= f1_min` y `recall >= recall_min`."""
+    validas = resumen[(resumen["f1"] >= f1_min) & (resumen["recall"] >= recall_min)]
+    if validas.empty:
+        return None
+    return validas["segundos"].idxmin()
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Evaluación de detectores con verdad de campo.")
+    parser.add_argument("--directorio", default=DIRECTORIO, help="escenarios etiquetados")
+    parser.add_argument(
+        "--generar", action="store_true", help="(re)generar los escenarios antes de evaluar"
+    )
+    parser.add_argument("--semilla", type=int, default=0)
+    parser.add_argument("--configs", help="JSON con una lista de configuraciones")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--f1-min", type=float, default=0.8)
+    parser.add_argument("--salida", help="CSV con los resultados por caso")
+    return parser
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+
+    rutas = {
+        tipo: (
+            os.path.join(args.directorio, f"trafico_{tipo}.csv"),
+            os.path.join(args.directorio, f"trafico_{tipo}_etiquetas.csv"),
+        )
+        for tipo in TIPOS_ESCENARIO
+    }
+    if args.generar or not all(os.path.exists(r[1]) for r in rutas.values()):
+        rutas = generar_escenarios(args.directorio, semilla=args.semilla)
+
+    configs = CONFIGS_DEFECTO
+    if args.configs:
+        with open(args.configs) as f:
+            configs = json.load(f)
+
+    resultados = evaluar(configs, rutas, workers=args.workers)
+    if args.salida:
+        resultados.to_csv(args.salida, index=False)
+
+    resumen = resumir(resultados)
+    with pd.option_context("display.width", 200, "display.max_rows", None):
+        print(resumen.to_string(float_format="%.3f"))
+
+    mejor = mejor_configuracion(resumen, f1_min=args.f1_min)
+    if mejor is None:
+        print(f"\nNinguna configuración llega a F1 ≥ {args.f1_min} detectando todo.")
+        return 1
+    print(f"\nMás rápida con F1 ≥ {args.f1_min} y recall 1: {mejor}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,218 @@
+"""
+Series de tráfico sintéticas con el mismo perfil que `datos_trafico`.
+
+Perfil laborable por franja horaria de los CSV incluidos (noche ~30 veh/min,
+punta de mañana ~151, mediodía ~81, punta de tarde ~141), un 30 % menos en
+fin de semana, ruido proporcional al nivel y occupancy ≈ 0.0047 · intensity. Todo
+vectorizado, así que se pueden generar decenas de millones de puntos por
+bloques sin bucles por fila.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+
+PERFIL_HORARIO = np.array(
+    [30.1] * 6 + [150.9] * 4 + [80.7] * 6 + [141.1] * 4 + [30.1] * 4
+)
+FACTOR_FIN_DE_SEMANA = 0.7
+RUIDO_BASE = 3.0
+RUIDO_RELATIVO = 0.085
+OCUPACION_POR_VEHICULO = 0.0047
+INICIO = "2025-01-01"
+
+
+def nivel_esperado(minutos_epoch):
+    """Intensidad media del perfil para cada minuto epoch (sin ruido)."""
+    minutos_epoch = np.asarray(minutos_epoch, dtype=np.int64)
+    hora = (minutos_epoch // 60) % 24
+    # 1970-01-01 fue jueves: día de la semana con lunes = 0
+    dia_semana = (minutos_epoch // 1440 + 3) % 7
+    nivel = PERFIL_HORARIO[hora]
+    return np.where(dia_semana >= 5, nivel * FACTOR_FIN_DE_SEMANA, nivel)
+
+
+def valores_sinteticos(minutos_epoch, rng, escala=1.0, factor_ruido=1.0):
+    """Intensity y occupancy con ruido para los minutos dados."""
+    nivel = nivel_esperado(minutos_epoch) * escala
+    intensity = nivel + rng.standard_normal(len(nivel)) * factor_ruido * (
+        RUIDO_BASE + RUIDO_RELATIVO * nivel
+    )
+    intensity = np.maximum(intensity, 0.0)
+    occupancy = intensity * OCUPACION_POR_VEHICULO + rng.standard_normal(len(nivel)) * 0.01
+    return intensity, np.clip(occupancy, 0.0, 1.0)
+
+
+def _minuto_inicio(inicio):
+    return pd.Timestamp(inicio).as_unit("ns").value // 60_000_000_000
+
+
+def generar_serie(n_minutos, inicio=INICIO, semilla=None, n_sensores=1) -> pd.DataFrame:
+    """
+    DataFrame `timestamp,intensity,occupancy` de `n_minutos` minutos.
+
+    Con `n_sensores > 1` añade `sensor_id` (0..n-1) y las filas van
+    intercaladas por minuto; cada sensor tiene su propia escala de tráfico.
+    """
+    bloques = bloques_sinteticos(n_minutos * n_sensores, None, inicio, semilla, n_sensores)
+    return next(bloques, pd.DataFrame(columns=["timestamp", "intensity", "occupancy"]))
+
+
+def bloques_sinteticos(
+    n_puntos, tam_bloque=1_000_000, inicio=INICIO, semilla=None, n_sensores=1, con_sensor_id=None
+):
+    """
+    Genera `n_puntos` filas sintéticas en DataFrames de hasta `tam_bloque` filas.
+
+    Los bloques son consecutivos en el tiempo (minutos completos: todas las
+    filas de un minuto van en el mismo bloque). `sensor_id` se añade con
+    `n_sensores > 1` o si `con_sensor_id` lo pide (flotas de un sensor).
+    """
+    if con_sensor_id is None:
+        con_sensor_id = n_sensores > 1
+    rng = np.random.default_rng(semilla)
+    escalas = rng.lognormal(0.0, 0.3, n_sensores) if n_sensores > 1 else np.ones(1)
+    minutos_por_bloque = max(1, (tam_bloque or n_puntos) // n_sensores)
+    minuto = _minuto_inicio(inicio)
+    restantes = n_puntos // n_sensores
+
+    while restantes > 0:
+        m = min(minutos_por_bloque, restantes)
+        minutos = np.repeat(np.arange(minuto, minuto + m, dtype=np.int64), n_sensores)
+        sensor = np.tile(np.arange(n_sensores), m)
+        intensity, occupancy = valores_sinteticos(minutos, rng, escalas[sensor])
+
+        datos = {}
+        if con_sensor_id:
+            datos["sensor_id"] = sensor
+        datos["timestamp"] = pd.to_datetime(minutos.astype("datetime64[m]"))
+        datos["intensity"] = intensity
+        datos["occupancy"] = occupancy
+        yield pd.DataFrame(datos)
+
+        minuto += m
+        restantes -= m
+
+
+# ============================================================================
+# ESCENARIOS ETIQUETADOS
+# ============================================================================
+
+# Réplicas de los cinco CSV de `datos_trafico` con la verdad de campo de lo
+# que se inyecta: intervalos [inicio, fin] con su tipo. Los incidentes no
+# caen en los primeros `DIAS_LIMPIOS` días, que se usan para entrenar.
+
+TIPOS_ESCENARIO = ("normal", "incidencias", "cambio_gradual", "ruido_alto", "ultimas_24h")
+DIAS_LIMPIOS = 7
+FACTOR_RUIDO_ALTO = 2.5
+PROB_CAIDA_SENSOR = 0.08  # lecturas a 0 en el escenario de ruido alto
+DERIVA_FINAL = 0.4  # +40 % al final del cambio gradual
+DERIVA_ETIQUETA = 0.2  # desde aquí la deriva cuenta como anomalía
+COLUMNAS_ETIQUETAS = ["inicio", "fin", "tipo", "factor"]
+
+
+def _inyectar_incidentes(df, rng, n, desde, duracion=(30, 120), factor=(1.8, 2.6)):
+    """Multiplica la intensidad en `n` intervalos sin solape; devuelve sus etiquetas."""
+    ts = df["timestamp"]
+    etiquetas = []
+    ocupado = np.zeros(len(df), dtype=bool)
+    intentos = 0
+    while len(etiquetas) < n and intentos < 100 * n:
+        intentos += 1
+        dur = int(rng.integers(duracion[0], duracion[1] + 1))
+        ini = int(rng.integers(desde, max(desde + 1, len(df) - dur)))
+        fin = min(len(df), ini + dur)
+        # margen de un día entre incidentes para no encadenarlos
+        if ocupado[max(0, ini - 1440) : fin + 1440].any():
+            continue
+        ocupado[ini:fin] = True
+        f = float(rng.uniform(*factor))
+        df.loc[df.index[ini:fin], "intensity"] *= f
+        if "occupancy" in df.columns:
+            df.loc[df.index[ini:fin], "occupancy"] = np.clip(
+                df["occupancy"].iloc[ini:fin] * f, 0.0, 1.0
+            )
+        etiquetas.append((ts.iloc[ini], ts.iloc[fin - 1], "incidencia", f))
+    etiquetas.sort()
+    return etiquetas
+
+
+def generar_escenario(tipo, dias=30, inicio=INICIO, semilla=None, n_incidentes=3):
+    """
+    Serie sintética de un escenario y su verdad de campo.
+
+    Devuelve `(df, etiquetas)`: `df` con `timestamp,intensity,occupancy` y
+    `etiquetas` con `inicio, fin, tipo, factor` (ambos extremos incluidos).
+
+    - `normal`: sin anomalías.
+    - `incidencias`: `n_incidentes` subidas ×1.8–2.6 de 30–120 minutos.
+    - `cambio_gradual`: deriva lineal hasta +40 %; se etiqueta el tramo
+      donde supera el +20 %.
+    - `ruido_alto`: ruido ×2.5 y caídas del sensor a 0; sin anomalías.
+    - `ultimas_24h`: un incidente en el último día (`dias` incluye el
+      histórico previo).
+    """
+    if tipo not in TIPOS_ESCENARIO:
+        raise ValueError(f"Escenario desconocido: {tipo}")
+    rng = np.random.default_rng(semilla)
+    n = dias * 1440
+    minutos = _minuto_inicio(inicio) + np.arange(n, dtype=np.int64)
+
+    factor_ruido = FACTOR_RUIDO_ALTO if tipo == "ruido_alto" else 1.0
+    intensity, occupancy = valores_sinteticos(minutos, rng, factor_ruido=factor_ruido)
+    df = pd.DataFrame(
+        {
+            "timestamp": pd.to_datetime(minutos.astype("datetime64[m]")),
+            "intensity": intensity,
+            "occupancy": occupancy,
+        }
+    )
+
+    etiquetas = []
+    desde = min(DIAS_LIMPIOS, max(0, dias - 1)) * 1440
+    if tipo == "incidencias":
+        etiquetas = _inyectar_incidentes(df, rng, n_incidentes, desde)
+    elif tipo == "ultimas_24h":
+        etiquetas = _inyectar_incidentes(df, rng, 1, max(desde, n - 1440))
+    elif tipo == "cambio_gradual":
+        factor = 1.0 + DERIVA_FINAL * np.arange(n) / max(1, n - 1)
+        df["intensity"] *= factor
+        df["occupancy"] = np.clip(df["occupancy"] * factor, 0.0, 1.0)
+        ini = int(np.searchsorted(factor, 1.0 + DERIVA_ETIQUETA))
+        if ini < n:
+            etiquetas = [
+                (df["timestamp"].iloc[ini], df["timestamp"].iloc[-1], "deriva", DERIVA_FINAL)
+            ]
+    elif tipo == "ruido_alto":
+        caidas = rng.random(n) < PROB_CAIDA_SENSOR
+        df.loc[caidas, ["intensity", "occupancy"]] = 0.0
+
+    return df, pd.DataFrame(etiquetas, columns=COLUMNAS_ETIQUETAS)
+
+
+def escribir_escenario(df, etiquetas, directorio, nombre):
+    """Escribe `<nombre>.csv` y `<nombre>_etiquetas.csv` en `directorio`."""
+    os.makedirs(directorio, exist_ok=True)
+    ruta = os.path.join(directorio, f"{nombre}.csv")
+    ruta_etiquetas = os.path.join(directorio, f"{nombre}_etiquetas.csv")
+    df.to_csv(ruta, index=False)
+    etiquetas.to_csv(ruta_etiquetas, index=False)
+    return ruta, ruta_etiquetas
+
+
+def leer_etiquetas(ruta_etiquetas) -> pd.DataFrame:
+    etiquetas = pd.read_csv(ruta_etiquetas)
+    etiquetas["inicio"] = pd.to_datetime(etiquetas["inicio"])
+    etiquetas["fin"] = pd.to_datetime(etiquetas["fin"])
+    return etiquetas
+
+
+def generar_escenarios(directorio, semilla=0, dias=30):
+    """Genera los cinco escenarios etiquetados; devuelve {tipo: (csv, etiquetas)}."""
+    rutas = {}
+    for i, tipo in enumerate(TIPOS_ESCENARIO):
+        dias_tipo = DIAS_LIMPIOS + 1 if tipo == "ultimas_24h" else dias
+        df, etiquetas = generar_escenario(tipo, dias=dias_tipo, semilla=semilla + i)
+        rutas[tipo] = escribir_escenario(df, etiquetas, directorio, f"trafico_{tipo}")
+    return rutas
@@ -0,0 +1,132 @@
+"""
+Histórico acotado de resultados de los detectores.
+
+Un buffer circular sobre un array estructurado de NumPy preasignado: cada
+resultado ocupa ~41 bytes en lugar de un dict de seis claves, y al llenarse
+se sobrescriben los más antiguos. Se accede como a la lista de dicts que
+sustituye (`len`, `h[-1]["timestamp"]`, iteración), y `a_dataframe()`
+devuelve el contenido en orden sin pasar por dicts.
+"""
+
+import numpy as np
+import pandas as pd
+
+RETENCION_HISTORIAL = 7 * 1440  # puntos (una semana a un punto por minuto)
+MAX_ANOMALIAS_HISTORIAL = 10_000
+
+DTYPE_RESULTADO = np.dtype(
+    [
+        ("timestamp", "M8[ns]"),
+        ("intensity", "f8"),
+        ("expected", "f8"),
+        ("score", "f8"),
+        ("es_anomalia", "?"),
+        ("confianza", "f8"),
+    ]
+)
+
+
+class HistorialResultados:
+    """
+    Últimos `capacidad` resultados en un buffer circular.
+
+    `total` cuenta todos los resultados añadidos desde el último `clear()`,
+    incluidos los que ya se han descartado.
+    """
+
+    def __init__(self, capacidad=RETENCION_HISTORIAL):
+        self.capacidad = max(0, int(capacidad))
+        self._datos = np.zeros(self.capacidad, dtype=DTYPE_RESULTADO)
+        self._inicio = 0
+        self._n = 0
+        self.total = 0
+
+    def __len__(self):
+        return self._n
+
+    @property
+    def nbytes(self):
+        return self._datos.nbytes
+
+    def clear(self):
+        self._inicio = 0
+        self._n = 0
+        self.total = 0
+
+    def append(self, res):
+        """Añade un resultado (dict con las columnas de `DTYPE_RESULTADO`)."""
+        self.total += 1
+        if self.capacidad == 0:
+            return
+        i = (self._inicio + self._n) % self.capacidad
+        self._datos[i] = (
+            pd.Timestamp(res["timestamp"]).as_unit("ns").to_datetime64(),
+            res["intensity"],
+            res["expected"],
+            res["score"],
+            res["es_anomalia"],
+            res["confianza"],
+        )
+        if self._n == self.capacidad:
+            self._inicio = (self._inicio + 1) % self.capacidad
+        else:
+            self._n += 1
+
+    def extend(self, df_res: pd.DataFrame):
+        """Añade un lote de resultados (DataFrame columnar) de una vez."""
+        m = len(df_res)
+        self.total += m
+        if m == 0 or self.capacidad == 0:
+            return
+
+        # del lote solo sobreviven las últimas `capacidad` filas
+        desde = max(0, m - self.capacidad)
+        nuevos = np.empty(m - desde, dtype=DTYPE_RESULTADO)
+        ts = pd.DatetimeIndex(df_res["timestamp"].iloc[desde:]).as_unit("ns")
+        nuevos["timestamp"] = ts.to_numpy()
+        for campo in DTYPE_RESULTADO.names[1:]:
+            nuevos[campo] = df_res[campo].to_numpy()[desde:]
+
+        k = len(nuevos)
+        ini = (self._inicio + self._n) % self.capacidad
+        primero = min(k, self.capacidad - ini)
+        self._datos[ini : ini + primero] = nuevos[:primero]
+        self._datos[: k - primero] = nuevos[primero:]
+
+        sobra = max(0, self._n + k - self.capacidad)
+        self._n = min(self.capacidad, self._n + k)
+        self._inicio = (self._inicio + sobra) % self.capacidad
+
+    def _ordenados(self):
+        fin = self._inicio + self._n
+        if fin <= self.capacidad:
+            return self._datos[self._inicio : fin]
+        return np.concatenate(
+            [self._datos[self._inicio :], self._datos[: fin - self.capacidad]]
+        )
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self._n
+        if not 0 <= idx < self._n:
+            raise IndexError("índice fuera del histórico")
+        return _a_dict(self._datos[(self._inicio + idx) % self.capacidad])
+
+    def __iter__(self):
+        for fila in self._ordenados():
+            yield _a_dict(fila)
+
+    def a_dataframe(self) -> pd.DataFrame:
+        datos = self._ordenados()
+        return pd.DataFrame({campo: datos[campo] for campo in DTYPE_RESULTADO.names})
+
+
+def _a_dict(fila):
+    return {
+        "timestamp": pd.Timestamp(fila["timestamp"]),
+        "intensity": float(fila["intensity"]),
+        "expected": float(fila["expected"]),
+        "score": float(fila["score"]),
+        "es_anomalia": bool(fila["es_anomalia"]),
+        "confianza": float(fila["confianza"]),
+    }
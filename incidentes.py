@@ -0,0 +1,237 @@
+"""
+Agregación de anomalías en incidentes con un índice de intervalos.
+
+Los minutos anómalos separados por huecos de hasta `hueco_minutos` forman
+un incidente con inicio, fin, puntos, score máximo y el instante e
+intensidad de su pico. Los incidentes se guardan ordenados y sin solape en
+arrays de NumPy, así que inicios y fines están ambos ordenados y "qué
+incidentes tocan [desde, hasta]" son dos búsquedas binarias: O(log n) más
+los k resultados.
+
+Los lotes se agregan vectorizados y el último incidente sigue abierto: si
+el lote siguiente empieza dentro del hueco, se prolonga.
+"""
+
+import numpy as np
+import pandas as pd
+
+HUECO_INCIDENTE = 5  # minutos
+MAX_INCIDENTES = 10_000
+
+_NS_MINUTO = 60_000_000_000
+
+_CAMPOS = (
+    ("inicio", np.int64),
+    ("fin", np.int64),
+    ("puntos", np.int64),
+    ("score_max", np.float64),
+    ("pico", np.int64),
+    ("intensity_pico", np.float64),
+)
+
+
+def _a_ns(timestamps):
+    return pd.DatetimeIndex(timestamps).as_unit("ns").asi8
+
+
+class IndiceIncidentes:
+    """
+    Incidentes ordenados y disjuntos con consultas por rango.
+
+    Con más de `max_incidentes` se descartan los más antiguos (hasta dejar
+    tres cuartos), como los históricos de `historial.py`; `total` cuenta
+    todos. `max_incidentes=None` no limita.
+    """
+
+    def __init__(self, hueco_minutos=HUECO_INCIDENTE, max_incidentes=MAX_INCIDENTES):
+        self.hueco_minutos = hueco_minutos
+        self.max_incidentes = max_incidentes
+        self.clear()
+
+    def clear(self):
+        self._n = 0
+        self.total = 0
+        self._datos = {campo: np.empty(16, dtype=dtype) for campo, dtype in _CAMPOS}
+
+    def __len__(self):
+        return self._n
+
+    def _columna(self, campo):
+        return self._datos[campo][: self._n]
+
+    @property
+    def inicio(self):
+        return self._columna("inicio").astype("M8[ns]")
+
+    @property
+    def fin(self):
+        return self._columna("fin").astype("M8[ns]")
+
+    def _reservar(self, capacidad):
+        actual = len(self._datos["inicio"])
+        if capacidad <= actual:
+            return
+        nueva = max(capacidad, 2 * actual)
+        for campo, dtype in _CAMPOS:
+            arr = np.empty(nueva, dtype=dtype)
+            arr[: self._n] = self._datos[campo][: self._n]
+            self._datos[campo] = arr
+
+    def agregar_resultados(self, df_res: pd.DataFrame):
+        """Agrega las filas anómalas de un DataFrame de resultados."""
+        anom = df_res[df_res["es_anomalia"].to_numpy(dtype=bool)]
+        self.agregar(anom["timestamp"], anom["score"], anom["intensity"])
+
+    def agregar_punto(self, timestamp, score, intensity):
+        self.agregar([timestamp], [score], [intensity])
+
+    def agregar(self, timestamps, score, intensity):
+        """Agrega puntos anómalos (de un lote, en cualquier orden)."""
+        t = _a_ns(timestamps)
+        if len(t) == 0:
+            return
+        score = np.asarray(score, dtype=float)
+        intensity = np.asarray(intensity, dtype=float)
+        if len(t) > 1 and (np.diff(t) < 0).any():
+            orden = np.argsort(t, kind="stable")
+            t, score, intensity = t[orden], score[orden], intensity[orden]
+
+        nuevos = _agrupar(t, score, intensity, self.hueco_minutos * _NS_MINUTO)
+        self.total += len(nuevos["inicio"])
+
+        if self._n and nuevos["inicio"][0] <= self._datos["fin"][self._n - 1]:
+            # puntos anteriores al último incidente: se rehace el orden
+            self._refundir(nuevos)
+        else:
+            if self._n and (
+                nuevos["inicio"][0] - self._datos["fin"][self._n - 1]
+                <= self.hueco_minutos * _NS_MINUTO
+            ):
+                self._prolongar_ultimo(nuevos)
+                self.total -= 1
+                nuevos = {campo: v[1:] for campo, v in nuevos.items()}
+            k = len(nuevos["inicio"])
+            self._reservar(self._n + k)
+            for campo, _ in _CAMPOS:
+                self._datos[campo][self._n : self._n + k] = nuevos[campo]
+            self._n += k
+
+        self._recortar()
+
+    def _prolongar_ultimo(self, nuevos):
+        i = self._n - 1
+        d = self._datos
+        d["fin"][i] = nuevos["fin"][0]
+        d["puntos"][i] += nuevos["puntos"][0]
+        if nuevos["score_max"][0] > d["score_max"][i]:
+            d["score_max"][i] = nuevos["score_max"][0]
+            d["pico"][i] = nuevos["pico"][0]
+            d["intensity_pico"][i] = nuevos["intensity_pico"][0]
+
+    def _refundir(self, nuevos):
+        """Mezcla incidentes que no llegan en orden y funde los que se tocan."""
+        todos = {
+            campo: np.concatenate([self._columna(campo), nuevos[campo]]) for campo, _ in _CAMPOS
+        }
+        orden = np.argsort(todos["inicio"], kind="stable")
+        todos = {campo: v[orden] for campo, v in todos.items()}
+
+        # un incidente abre grupo si empieza tras el hueco del fin más tardío anterior
+        fin_previo = np.maximum.accumulate(todos["fin"])[:-1]
+        abre = np.r_[True, todos["inicio"][1:] - fin_previo > self.hueco_minutos * _NS_MINUTO]
+        grupos = np.cumsum(abre) - 1
+        starts = np.flatnonzero(abre)
+
+        fundidos = {
+            "inicio": todos["inicio"][starts],
+            "fin": np.maximum.reduceat(todos["fin"], starts),
+            "puntos": np.add.reduceat(todos["puntos"], starts),
+        }
+        pico = _primero_por_grupo(grupos, -todos["score_max"])
+        fundidos["score_max"] = todos["score_max"][pico]
+        fundidos["pico"] = todos["pico"][pico]
+        fundidos["intensity_pico"] = todos["intensity_pico"][pico]
+
+        self.total -= len(todos["inicio"]) - len(starts)
+        self._n = 0
+        self._reservar(len(starts))
+        for campo, _ in _CAMPOS:
+            self._datos[campo][: len(starts)] = fundidos[campo]
+        self._n = len(starts)
+
+    def _recortar(self):
+        if self.max_incidentes is None or self._n <= self.max_incidentes:
+            return
+        quedan = max(1, 3 * self.max_incidentes // 4)
+        for campo, _ in _CAMPOS:
+            arr = self._datos[campo]
+            arr[:quedan] = arr[self._n - quedan : self._n]
+        self._n = quedan
+
+    def _rango(self, desde, hasta):
+        """Posiciones [lo, hi) de los incidentes que tocan [desde, hasta]."""
+        desde = -np.inf if desde is None else _a_ns([desde])[0]
+        hasta = np.inf if hasta is None else _a_ns([hasta])[0]
+        lo = np.searchsorted(self._columna("fin"), desde, side="left")
+        hi = np.searchsorted(self._columna("inicio"), hasta, side="right")
+        return int(lo), int(max(lo, hi))
+
+    def contar(self, desde=None, hasta=None):
+        lo, hi = self._rango(desde, hasta)
+        return hi - lo
+
+    def solapados(self, desde=None, hasta=None) -> pd.DataFrame:
+        """Incidentes que se solapan con [desde, hasta] (extremos incluidos)."""
+        lo, hi = self._rango(desde, hasta)
+        return self._frame(lo, hi)
+
+    def a_dataframe(self) -> pd.DataFrame:
+        return self._frame(0, self._n)
+
+    def _frame(self, lo, hi):
+        d = {campo: self._datos[campo][lo:hi] for campo, _ in _CAMPOS}
+        inicio = d["inicio"].astype("M8[ns]")
+        fin = d["fin"].astype("M8[ns]")
+        return pd.DataFrame(
+            {
+                "inicio": inicio,
+                "fin": fin,
+                # con un punto por minuto: un incidente de un solo punto dura 1
+                "duracion_min": (d["fin"] - d["inicio"]) / _NS_MINUTO + 1,
+                "puntos": d["puntos"],
+                "score_max": d["score_max"],
+                "pico": d["pico"].astype("M8[ns]"),
+                "intensity_pico": d["intensity_pico"],
+            }
+        )
+
+
+def _primero_por_grupo(grupos, clave):
+    """Índice de la fila con menor `clave` de cada grupo (grupos consecutivos)."""
+    orden = np.lexsort((clave, grupos))
+    primeros = np.r_[True, grupos[orden][1:] != grupos[orden][:-1]]
+    return orden[primeros]
+
+
+def _agrupar(t, score, intensity, hueco_ns):
+    """Incidentes (arrays por campo) de puntos anómalos ordenados por tiempo."""
+    abre = np.r_[True, np.diff(t) > hueco_ns]
+    grupos = np.cumsum(abre) - 1
+    starts = np.flatnonzero(abre)
+    ends = np.r_[starts[1:], len(t)] - 1
+    pico = _primero_por_grupo(grupos, -score)
+    return {
+        "inicio": t[starts],
+        "fin": t[ends],
+        "puntos": np.diff(np.r_[starts, len(t)]),
+        "score_max": score[pico],
+        "pico": t[pico],
+        "intensity_pico": intensity[pico],
+    }
+
+
+def agrupar_incidentes(df_res: pd.DataFrame, hueco_minutos=HUECO_INCIDENTE) -> pd.DataFrame:
+    """Incidentes de un DataFrame de resultados, una fila por incidente."""
+    indice = IndiceIncidentes(hueco_minutos, max_incidentes=None)
+    indice.agregar_resultados(df_res)
+    return indice.a_dataframe()
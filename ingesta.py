@@ -0,0 +1,286 @@
+"""
+Caché binaria columnar para los CSV de `datos_trafico`.
+
+La primera vez que se carga un CSV se convierte a arrays NumPy (`.npy`):
+timestamps como nanosegundos epoch en int64 (sin redondear: hay CSV con
+segundos y microsegundos) e intensity/occupancy en float32.
+Las cargas siguientes abren esos arrays con `mmap_mode="r"` sin volver a
+parsear el texto, siempre que el CSV no haya cambiado (mtime y, si el mtime
+difiere, hash del contenido).
+
+Por defecto la caché va junto al CSV (`.cache_npy/`); con `directorio_cache`
+va donde se indique. Si no se puede escribir, el CSV se parsea sin caché.
+"""
+
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+import pandas as pd
+
+VERSION_CACHE = 2
+DIRECTORIO_CACHE = ".cache_npy"
+COLUMNAS_VALOR = ("intensity", "occupancy")
+NS_POR_DIA = 86_400 * 10**9
+
+
+def _hash_fichero(ruta, bloque=1 << 20):
+    h = hashlib.sha256()
+    with open(ruta, "rb") as f:
+        while chunk := f.read(bloque):
+            h.update(chunk)
+    return h.hexdigest()
+
+
+def _ruta_cache(ruta_csv, directorio_cache=None):
+    nombre = os.path.splitext(os.path.basename(ruta_csv))[0]
+    if directorio_cache is None:
+        return os.path.join(os.path.dirname(ruta_csv), DIRECTORIO_CACHE, nombre)
+    # una caché compartida recibe CSV de varios directorios: el nombre no basta
+    ruta = hashlib.sha1(os.path.abspath(ruta_csv).encode()).hexdigest()[:10]
+    return os.path.join(directorio_cache, f"{nombre}-{ruta}")
+
+
+class DatasetTrafico:
+    """
+    Serie de tráfico en formato columnar.
+
+    `timestamp` son nanosegundos epoch (int64) ordenados; el resto de columnas
+    son float32. Los arrays pueden ser memmaps de solo lectura: `ventana`
+    devuelve vistas sin copiar.
+    """
+
+    def __init__(self, timestamp, columnas, origen=None):
+        self.timestamp = timestamp
+        self.columnas = columnas
+        self.origen = origen
+
+    def __len__(self):
+        return len(self.timestamp)
+
+    def __getitem__(self, nombre):
+        if nombre == "timestamp":
+            return self.timestamp
+        return self.columnas[nombre]
+
+    def ventana(self, desde=None, hasta=None):
+        """
+        Sub-serie con `desde <= timestamp < hasta`, sin copiar datos.
+
+        Los límites aceptan cualquier cosa que entienda `pd.Timestamp`; la
+        búsqueda es binaria sobre los timestamps ordenados.
+        """
+        ini = 0 if desde is None else int(np.searchsorted(self.timestamp, _a_epoch(desde)))
+        fin = (
+            len(self.timestamp)
+            if hasta is None
+            else int(np.searchsorted(self.timestamp, _a_epoch(hasta)))
+        )
+        return DatasetTrafico(
+            self.timestamp[ini:fin],
+            {k: v[ini:fin] for k, v in self.columnas.items()},
+            origen=self.origen,
+        )
+
+    def ultimos_dias(self, dias):
+        if len(self.timestamp) == 0:
+            return self
+        return self.ventana(desde=_de_epoch(self.timestamp[-1] - dias * NS_POR_DIA))
+
+    def a_dataframe(self) -> pd.DataFrame:
+        """DataFrame con el formato que esperan los detectores."""
+        datos = {"timestamp": pd.to_datetime(self.timestamp.astype("datetime64[ns]"))}
+        for k, v in self.columnas.items():
+            datos[k] = np.asarray(v, dtype=float)
+        return pd.DataFrame(datos)
+
+
+def _a_epoch(valor):
+    return pd.Timestamp(valor).as_unit("ns").value
+
+
+def _de_epoch(ns):
+    return pd.Timestamp(int(ns), unit="ns")
+
+
+def _leer_csv(ruta_csv, chunksize=500_000):
+    """Parsea el CSV por bloques: (timestamps ordenados, {columna: valores})."""
+    partes_ts = []
+    partes = {c: [] for c in COLUMNAS_VALOR}
+    presentes = None
+
+    for chunk in pd.read_csv(ruta_csv, chunksize=chunksize):
+        if presentes is None:
+            presentes = [c for c in COLUMNAS_VALOR if c in chunk.columns]
+        ts = pd.DatetimeIndex(pd.to_datetime(chunk["timestamp"]))
+        partes_ts.append(ts.as_unit("ns").asi8)
+        for c in presentes:
+            partes[c].append(chunk[c].to_numpy(dtype=np.float32))
+
+    presentes = presentes or []
+    timestamp = np.concatenate(partes_ts) if partes_ts else np.empty(0, np.int64)
+    columnas = {
+        c: np.concatenate(partes[c]) if partes[c] else np.empty(0, np.float32)
+        for c in presentes
+    }
+
+    if not np.all(timestamp[1:] >= timestamp[:-1]):
+        orden = np.argsort(timestamp, kind="stable")
+        timestamp = timestamp[orden]
+        columnas = {c: v[orden] for c, v in columnas.items()}
+    return timestamp, columnas
+
+
+def _convertir(ruta_csv, destino, meta):
+    """Parsea el CSV y escribe los .npy de forma atómica."""
+    timestamp, columnas = _leer_csv(ruta_csv)
+    presentes = list(columnas)
+
+    os.makedirs(os.path.dirname(destino), exist_ok=True)
+    tmp = tempfile.mkdtemp(prefix=".tmp_", dir=os.path.dirname(destino))
+    try:
+        np.save(os.path.join(tmp, "timestamp.npy"), timestamp)
+        for c, v in columnas.items():
+            np.save(os.path.join(tmp, f"{c}.npy"), v)
+        meta = dict(meta, columnas=presentes, filas=int(len(timestamp)))
+        with open(os.path.join(tmp, "meta.json"), "w") as f:
+            json.dump(meta, f)
+        if os.path.exists(destino):
+            shutil.rmtree(destino)
+        os.replace(tmp, destino)
+    except BaseException:
+        shutil.rmtree(tmp, ignore_errors=True)
+        raise
+
+
+def _abrir(destino, meta):
+    timestamp = np.load(os.path.join(destino, "timestamp.npy"), mmap_mode="r")
+    columnas = {
+        c: np.load(os.path.join(destino, f"{c}.npy"), mmap_mode="r")
+        for c in meta["columnas"]
+    }
+    return timestamp, columnas
+
+
+def cargar_dataset(ruta_csv, directorio_cache=None) -> DatasetTrafico:
+    """
+    Carga un CSV `timestamp,intensity[,occupancy]` vía la caché binaria.
+
+    Si la caché existe y el CSV tiene el mismo mtime se abre directamente.
+    Si el mtime ha cambiado se compara el hash del contenido: si coincide se
+    reutiliza (actualizando el mtime guardado); si no, se vuelve a convertir.
+    Si la caché no se puede escribir (directorio de solo lectura), se
+    devuelve el CSV parseado en memoria.
+    """
+    try:
+        timestamp, columnas = _cargar_con_cache(ruta_csv, directorio_cache)
+    except OSError:
+        if not os.path.isfile(ruta_csv):
+            raise
+        timestamp, columnas = _leer_csv(ruta_csv)
+    return DatasetTrafico(timestamp, columnas, origen=ruta_csv)
+
+
+def _cargar_con_cache(ruta_csv, directorio_cache):
+    destino = _ruta_cache(ruta_csv, directorio_cache)
+    ruta_meta = os.path.join(destino, "meta.json")
+    mtime = os.path.getmtime(ruta_csv)
+
+    meta = None
+    if os.path.exists(ruta_meta):
+        with open(ruta_meta) as f:
+            meta = json.load(f)
+        if meta.get("version") != VERSION_CACHE:
+            meta = None
+
+    if meta is not None and meta["mtime"] != mtime:
+        sha = _hash_fichero(ruta_csv)
+        if meta["sha256"] == sha:
+            meta["mtime"] = mtime
+            with open(ruta_meta, "w") as f:
+                json.dump(meta, f)
+        else:
+            meta = None
+
+    if meta is None:
+        meta = {
+            "version": VERSION_CACHE,
+            "origen": os.path.abspath(ruta_csv),
+            "mtime": mtime,
+            "sha256": _hash_fichero(ruta_csv),
+        }
+        _convertir(ruta_csv, destino, meta)
+        with open(ruta_meta) as f:
+            meta = json.load(f)
+
+    return _abrir(destino, meta)
+
+
+# ============================================================================
+# LECTURA EN STREAMING
+# ============================================================================
+
+
+def leer_csv_por_bloques(fuente, chunksize=50_000):
+    """Genera DataFrames de `chunksize` filas con `timestamp` ya parseado."""
+    for chunk in pd.read_csv(fuente, chunksize=chunksize):
+        chunk["timestamp"] = pd.to_datetime(chunk["timestamp"])
+        yield chunk
+
+
+def puntuar_csv_en_streaming(fuente, detector, dias_calentamiento=None, chunksize=50_000):
+    """
+    Puntúa un CSV bloque a bloque con memoria acotada.
+
+    Los primeros `dias_calentamiento` días (por defecto `detector.window_days`)
+    se acumulan y se pasan a `detector.cargar_historico`; a partir de ahí cada
+    bloque se puntúa con `detector.procesar_lote` y se devuelve en cuanto está
+    listo. Las filas del calentamiento no se puntúan.
+
+    `detector` es cualquiera de los de `detectores.py`. El `score_history`
+    del detector está acotado (`historial.py`), así que no crece con el
+    fichero.
+    """
+    if dias_calentamiento is None:
+        dias_calentamiento = getattr(detector, "window_days", None)
+    if dias_calentamiento is None:
+        raise ValueError("Indica dias_calentamiento para este detector")
+
+    calentamiento = []
+    t_fin = None
+    bloques = leer_csv_por_bloques(fuente, chunksize=chunksize)
+
+    for chunk in bloques:
+        if chunk.empty:
+            continue
+        if t_fin is None:
+            t_fin = chunk["timestamp"].iloc[0] + pd.Timedelta(days=dias_calentamiento)
+
+        dentro = chunk["timestamp"] < t_fin
+        calentamiento.append(chunk[dentro])
+        if dentro.all():
+            continue
+
+        detector.cargar_historico(pd.concat(calentamiento, ignore_index=True))
+        calentamiento = None
+        yield from _puntuar_bloques(detector, _encadenar(chunk[~dentro], bloques))
+        return
+
+    # el fichero entero cabe en el calentamiento: solo se entrena
+    if calentamiento:
+        detector.cargar_historico(pd.concat(calentamiento, ignore_index=True))
+
+
+def _encadenar(primero, resto):
+    if not primero.empty:
+        yield primero
+    yield from resto
+
+
+def _puntuar_bloques(detector, bloques):
+    for chunk in bloques:
+        if not chunk.empty:
+            yield detector.procesar_lote(chunk.reset_index(drop=True))
@@ -0,0 +1,148 @@
+"""
+Tiempos por etapa y perfilado puntual de detectores y app.
+
+Cada detector lleva un `Cronometro` (desactivado salvo que se active o que
+`ANOMALIAS_INSTRUMENTAR=1`). Desactivado, `etapa()` devuelve siempre el
+mismo context manager vacío, así que el coste en el camino caliente es una
+llamada y un `with` sin nada dentro. Activado, acumula llamadas, tiempo
+total y máximo por etapa, más contadores (p. ej. puntos puntuados).
+
+`perfilar()` ejecuta una función una vez bajo cProfile y tracemalloc para
+ver qué funciones y qué líneas se llevan el tiempo y la memoria.
+"""
+
+import cProfile
+import io
+import os
+import pstats
+import time
+import tracemalloc
+from contextlib import nullcontext
+
+import pandas as pd
+
+INSTRUMENTACION_POR_DEFECTO = os.environ.get("ANOMALIAS_INSTRUMENTAR", "") not in ("", "0")
+
+_SIN_MEDIR = nullcontext()
+
+
+class _Etapa:
+    __slots__ = ("cronometro", "nombre", "t0")
+
+    def __init__(self, cronometro, nombre):
+        self.cronometro = cronometro
+        self.nombre = nombre
+
+    def __enter__(self):
+        self.t0 = time.perf_counter()
+        return self
+
+    def __exit__(self, *exc):
+        self.cronometro.registrar(self.nombre, time.perf_counter() - self.t0)
+        return False
+
+
+class Cronometro:
+    """
+    Tiempos acumulados por etapa.
+
+    Uso:
+        with cronometro.etapa("puntuacion"):
+            ...
+        cronometro.contar("puntos", len(df))
+        cronometro.resumen()
+    """
+
+    def __init__(self, activo=None):
+        self.activo = INSTRUMENTACION_POR_DEFECTO if activo is None else activo
+        self.reiniciar()
+
+    def reiniciar(self):
+        # nombre -> [llamadas, total_s, max_s]
+        self._etapas = {}
+        self._contadores = {}
+
+    def etapa(self, nombre):
+        if not self.activo:
+            return _SIN_MEDIR
+        return _Etapa(self, nombre)
+
+    def registrar(self, nombre, segundos):
+        acum = self._etapas.get(nombre)
+        if acum is None:
+            self._etapas[nombre] = [1, segundos, segundos]
+        else:
+            acum[0] += 1
+            acum[1] += segundos
+            if segundos > acum[2]:
+                acum[2] = segundos
+
+    def contar(self, nombre, n=1):
+        if self.activo:
+            self._contadores[nombre] = self._contadores.get(nombre, 0) + n
+
+    def resumen(self):
+        """{"etapas": {nombre: {llamadas, total_ms, media_ms, max_ms}}, "contadores": {...}}"""
+        return {
+            "etapas": {
+                nombre: {
+                    "llamadas": llamadas,
+                    "total_ms": total * 1e3,
+                    "media_ms": total * 1e3 / llamadas,
+                    "max_ms": maximo * 1e3,
+                }
+                for nombre, (llamadas, total, maximo) in self._etapas.items()
+            },
+            "contadores": dict(self._contadores),
+        }
+
+    def a_dataframe(self) -> pd.DataFrame:
+        """Una fila por etapa, de más a menos tiempo total."""
+        etapas = self.resumen()["etapas"]
+        df = pd.DataFrame.from_dict(
+            etapas, orient="index", columns=["llamadas", "total_ms", "media_ms", "max_ms"]
+        )
+        return df.rename_axis("etapa").sort_values("total_ms", ascending=False)
+
+
+def perfilar(funcion, *args, top=25, memoria=True, **kwargs):
+    """
+    Ejecuta `funcion(*args, **kwargs)` una vez bajo cProfile (y tracemalloc).
+
+    Devuelve `(resultado, informe)`. El informe trae `segundos`, `perfil`
+    (texto de pstats con las `top` funciones por tiempo acumulado) y, con
+    `memoria=True`, `memoria_pico_mb` y `asignaciones`: las `top` líneas
+    que más memoria tenían reservada al terminar.
+    """
+    if memoria:
+        tracemalloc.start()
+    perfil = cProfile.Profile()
+    t0 = time.perf_counter()
+    try:
+        perfil.enable()
+        try:
+            resultado = funcion(*args, **kwargs)
+        finally:
+            perfil.disable()
+        segundos = time.perf_counter() - t0
+
+        informe = {"segundos": segundos}
+        if memoria:
+            _, pico = tracemalloc.get_traced_memory()
+            lineas = tracemalloc.take_snapshot().statistics("lineno")[:top]
+            informe["memoria_pico_mb"] = pico / 2**20
+            informe["asignaciones"] = pd.DataFrame(
+                {
+                    "linea": [str(s.traceback[0]) for s in lineas],
+                    "kb": [s.size / 1024 for s in lineas],
+                    "bloques": [s.count for s in lineas],
+                }
+            )
+    finally:
+        if memoria:
+            tracemalloc.stop()
+
+    texto = io.StringIO()
+    pstats.Stats(perfil, stream=texto).sort_stats("cumulative").print_stats(top)
+    informe["perfil"] = texto.getvalue()
+    return resultado, informe
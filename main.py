@@ -1,6 +1,234 @@
-def main():
-    print("Hello from anomalias!")
+"""
+CLI para puntuar CSVs de tráfico sin navegador.
+
+Ejemplo:
+    python main.py "datos_trafico/*.csv" --algoritmo mad --threshold 3.5 \\
+        --formato jsonl --salida reportes/
+"""
+
+import argparse
+import glob
+import os
+import sys
+import time
+from concurrent.futures import ProcessPoolExecutor, as_completed
+
+import pandas as pd
+
+from almacen import AlmacenResultados
+from detectores import (
+    MODOS_ENSEMBLE,
+    TrafficAnomalyDetectorEnsemble,
+    TrafficAnomalyDetectorIForest,
+    TrafficAnomalyDetectorIForestOnline,
+    TrafficAnomalyDetectorMAD,
+    TrafficAnomalyDetectorMADEstacional,
+    TrafficAnomalyDetectorMADMultivariante,
+)
+from ingesta import DIRECTORIO_CACHE, cargar_dataset
+
+ALGORITMOS = ("mad", "mad-estacional", "iforest", "iforest-online", "ensemble")
+# "almacen": directorio particionado por día (ver almacen.py) para la app
+FORMATOS = ("csv", "parquet", "jsonl", "almacen")
+# estos solo miran intensity
+SOLO_INTENSITY = ("mad-estacional", "iforest-online")
+# los que detectan cambios de régimen (con --features intensity)
+CON_DERIVA = ("mad", "ensemble")
+
+
+def crear_detector(algoritmo, params):
+    if algoritmo in SOLO_INTENSITY and params["features"] != ["intensity"]:
+        raise ValueError(f"{algoritmo} solo admite --features intensity")
+    if params["deriva"] and algoritmo not in CON_DERIVA:
+        raise ValueError(f"{algoritmo} no admite --deriva")
+    if algoritmo == "mad" and params["features"] != ["intensity"]:
+        if params["deriva"]:
+            raise ValueError("--deriva solo se admite con --features intensity")
+        return TrafficAnomalyDetectorMADMultivariante(
+            window_days=params["window_days"],
+            threshold=params["threshold"],
+            features=params["features"],
+        )
+    if algoritmo == "mad":
+        return TrafficAnomalyDetectorMAD(
+            window_days=params["window_days"],
+            threshold=params["threshold"],
+            deriva=params["deriva"],
+        )
+    if algoritmo == "mad-estacional":
+        return TrafficAnomalyDetectorMADEstacional(
+            window_days=params["window_days"],
+            threshold=params["threshold"],
+            bucket_minutos=params["bucket_minutos"],
+        )
+    if algoritmo == "ensemble":
+        return TrafficAnomalyDetectorEnsemble(
+            window_days=params["window_days"],
+            threshold=params["threshold"],
+            contamination=params["contamination"],
+            n_estimators=params["n_estimators"],
+            features=params["features"],
+            deriva=params["deriva"],
+            modo=params["modo"],
+        )
+    if algoritmo == "iforest-online":
+        return TrafficAnomalyDetectorIForestOnline(
+            contamination=params["contamination"],
+            n_estimators=params["n_estimators"],
+        )
+    return TrafficAnomalyDetectorIForest(
+        contamination=params["contamination"],
+        n_estimators=params["n_estimators"],
+        features=params["features"],
+    )
+
+
+def escribir_reporte(df_res, ruta, formato):
+    if formato == "csv":
+        df_res.to_csv(ruta, index=False)
+    elif formato == "parquet":
+        df_res.to_parquet(ruta, index=False)
+    elif formato == "almacen":
+        almacen = AlmacenResultados()
+        almacen.agregar(df_res)
+        almacen.guardar(ruta)
+    else:
+        df_res.to_json(ruta, orient="records", lines=True, date_format="iso")
+
+
+def procesar_fichero(
+    ruta_csv, algoritmo, params, salida, formato, solo_anomalias, directorio_cache=None
+):
+    """Entrena y puntúa un CSV y escribe su reporte. Se ejecuta en un worker."""
+    t0 = time.perf_counter()
+    df = cargar_dataset(ruta_csv, directorio_cache).a_dataframe()
+
+    detector = crear_detector(algoritmo, params)
+    detector.cargar_historico(df)
+    df_res = detector.procesar_lote(df)
+    if solo_anomalias:
+        df_res = df_res[df_res["es_anomalia"]]
+
+    nombre = os.path.splitext(os.path.basename(ruta_csv))[0]
+    ruta_salida = os.path.join(salida, f"{nombre}_{algoritmo}.{formato}")
+    escribir_reporte(df_res, ruta_salida, formato)
+
+    return {
+        "fichero": ruta_csv,
+        "puntos": len(df),
+        "anomalias": int(detector.get_estadisticas()["total_anomalias"]),
+        "reporte": ruta_salida,
+        "segundos": round(time.perf_counter() - t0, 3),
+    }
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(
+        description="Detección de anomalías de tráfico por lotes."
+    )
+    parser.add_argument("patron", nargs="+", help="CSV o glob de CSVs a procesar")
+    parser.add_argument("--algoritmo", choices=ALGORITMOS, default="mad")
+    parser.add_argument("--window-days", type=int, default=42)
+    parser.add_argument("--threshold", type=float, default=3.5)
+    parser.add_argument("--bucket-minutos", type=int, default=15)
+    parser.add_argument("--contamination", type=float, default=0.01)
+    parser.add_argument("--n-estimators", type=int, default=100)
+    parser.add_argument(
+        "--features",
+        nargs="+",
+        default=["intensity"],
+        help="features para mad, iforest y ensemble (ver caracteristicas.py)",
+    )
+    parser.add_argument(
+        "--deriva",
+        action="store_true",
+        help=(
+            "mad/ensemble: rehacer el baseline cuando se confirme un cambio de régimen"
+            " (solo con --features intensity)"
+        ),
+    )
+    parser.add_argument(
+        "--modo",
+        choices=MODOS_ENSEMBLE,
+        default="ponderado",
+        help="ensemble: cómo combinar MAD e Isolation Forest",
+    )
+    parser.add_argument("--formato", choices=FORMATOS, default="csv")
+    parser.add_argument("--salida", default="reportes")
+    parser.add_argument(
+        "--cache-dir",
+        default=None,
+        help="caché binaria de los CSV (por defecto, <salida>/.cache_npy)",
+    )
+    parser.add_argument(
+        "--solo-anomalias",
+        action="store_true",
+        help="escribir solo los puntos anómalos",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="procesos en paralelo (por defecto, uno por núcleo)",
+    )
+    return parser
+
+
+def main(argv=None):
+    parser = crear_parser()
+    args = parser.parse_args(argv)
+
+    ficheros = sorted({f for p in args.patron for f in glob.glob(p)})
+    if not ficheros:
+        print("No hay ficheros que coincidan.", file=sys.stderr)
+        return 1
+
+    params = {
+        "window_days": args.window_days,
+        "threshold": args.threshold,
+        "bucket_minutos": args.bucket_minutos,
+        "contamination": args.contamination,
+        "n_estimators": args.n_estimators,
+        "features": args.features,
+        "deriva": args.deriva,
+        "modo": args.modo,
+    }
+    # combinaciones no válidas: fallar antes de lanzar los workers
+    try:
+        crear_detector(args.algoritmo, params)
+    except ValueError as e:
+        parser.error(str(e))
+
+    os.makedirs(args.salida, exist_ok=True)
+    directorio_cache = args.cache_dir or os.path.join(args.salida, DIRECTORIO_CACHE)
+
+    resumen = []
+    errores = 0
+    with ProcessPoolExecutor(max_workers=args.workers) as pool:
+        futuros = {
+            pool.submit(
+                procesar_fichero,
+                f,
+                args.algoritmo,
+                params,
+                args.salida,
+                args.formato,
+                args.solo_anomalias,
+                directorio_cache,
+            ): f
+            for f in ficheros
+        }
+        for fut in as_completed(futuros):
+            try:
+                resumen.append(fut.result())
+            except Exception as e:
+                errores += 1
+                print(f"❌ {futuros[fut]}: {e}", file=sys.stderr)
+
+    if resumen:
+        print(pd.DataFrame(resumen).sort_values("fichero").to_string(index=False))
+    return 1 if errores else 0
 
 
 if __name__ == "__main__":
-    main()
+    sys.exit(main())
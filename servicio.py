@@ -0,0 +1,391 @@
+"""
+Servicio de ingesta en vivo (asyncio) para los detectores.
+
+Los puntos llegan por un socket TCP local, uno por línea en JSON:
+
+    {"timestamp": "2025-01-30 07:46:00", "intensity": 250.1, "occupancy": 0.8}
+
+Se agrupan en micro-lotes (por tamaño o por tiempo de espera) que se puntúan
+con `detector.procesar_lote` en un hilo aparte, para no bloquear el bucle.
+La cola de entrada está acotada: si la puntuación se queda atrás, los
+lectores esperan a que haya sitio y dejan de leer del socket, así que el
+cliente nota la contrapresión vía TCP. Las anomalías se publican en colas
+de suscriptor (`queue.Queue`) que el dashboard puede sondear desde su hilo.
+
+Uso:
+    python servicio.py servir --historico datos_trafico/trafico_normal.csv
+    python servicio.py reproducir datos_trafico/trafico_ultimas_24h.csv --velocidad 60
+"""
+
+import argparse
+import asyncio
+import json
+import queue
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import pandas as pd
+
+from ingesta import leer_csv_por_bloques
+
+HOST = "127.0.0.1"
+PUERTO = 8765
+
+
+class ServicioIngesta:
+    """
+    Recibe puntos, los puntúa por micro-lotes y publica las anomalías.
+
+    - `tamano_lote`: puntos máximos por lote.
+    - `max_espera`: segundos máximos desde el primer punto de un lote hasta
+      que se puntúa, aunque no esté lleno.
+    - `max_pendientes`: tamaño de la cola de entrada (contrapresión).
+    - `max_cola_suscriptor`: si un suscriptor no sondea, se descartan sus
+      anomalías más antiguas.
+
+    `detector` debe estar ya entrenado (`cargar_historico`).
+    """
+
+    def __init__(
+        self,
+        detector,
+        tamano_lote=500,
+        max_espera=1.0,
+        max_pendientes=10_000,
+        max_cola_suscriptor=10_000,
+    ):
+        self.detector = detector
+        self.tamano_lote = tamano_lote
+        self.max_espera = max_espera
+        self.max_pendientes = max_pendientes
+        self.max_cola_suscriptor = max_cola_suscriptor
+
+        self._entrada = None
+        self._servidor = None
+        self._tarea_lotes = None
+        self._loop = None
+        # un solo hilo: los lotes se puntúan en orden de llegada
+        self._ejecutor = ThreadPoolExecutor(max_workers=1)
+        self._suscriptores = []
+        self._lock = threading.Lock()
+
+        self.puntos_recibidos = 0
+        self.puntos_puntuados = 0
+        self.lotes = 0
+        self.anomalias = 0
+        self.errores = 0
+        self.esperas_contrapresion = 0
+        self.ultimo_lote_ms = None
+
+    # --- suscriptores ---
+
+    def suscribir(self) -> queue.Queue:
+        """Cola con las anomalías (dicts) que se detecten a partir de ahora."""
+        cola = queue.Queue(maxsize=self.max_cola_suscriptor)
+        with self._lock:
+            self._suscriptores.append(cola)
+        return cola
+
+    def cancelar_suscripcion(self, cola):
+        with self._lock:
+            if cola in self._suscriptores:
+                self._suscriptores.remove(cola)
+
+    def _publicar(self, anomalias):
+        with self._lock:
+            suscriptores = list(self._suscriptores)
+        for cola in suscriptores:
+            for a in anomalias:
+                while True:
+                    try:
+                        cola.put_nowait(a)
+                        break
+                    except queue.Full:
+                        try:
+                            cola.get_nowait()
+                        except queue.Empty:
+                            pass
+
+    # --- ciclo de vida ---
+
+    async def iniciar(self, host=HOST, puerto=PUERTO):
+        """Abre el socket y arranca el agrupador de lotes. Devuelve el puerto."""
+        self._loop = asyncio.get_running_loop()
+        self._entrada = asyncio.Queue(maxsize=self.max_pendientes)
+        self._tarea_lotes = asyncio.create_task(self._agrupar())
+        self._servidor = await asyncio.start_server(self._atender, host, puerto)
+        return self._servidor.sockets[0].getsockname()[1]
+
+    async def detener(self):
+        """Deja de aceptar conexiones, puntúa lo pendiente y termina."""
+        if self._servidor is not None:
+            self._servidor.close()
+            await self._servidor.wait_closed()
+        if self._tarea_lotes is not None:
+            await self._entrada.put(None)
+            await self._tarea_lotes
+        self._ejecutor.shutdown(wait=True)
+
+    async def vaciar(self):
+        """Espera a que todo lo recibido hasta ahora esté puntuado."""
+        while self.puntos_puntuados < self.puntos_recibidos:
+            await asyncio.sleep(0.01)
+
+    def estadisticas(self):
+        return {
+            "puntos_recibidos": self.puntos_recibidos,
+            "puntos_puntuados": self.puntos_puntuados,
+            "pendientes": self._entrada.qsize() if self._entrada is not None else 0,
+            "lotes": self.lotes,
+            "anomalias": self.anomalias,
+            "errores": self.errores,
+            "esperas_contrapresion": self.esperas_contrapresion,
+            "ultimo_lote_ms": self.ultimo_lote_ms,
+        }
+
+    # --- entrada ---
+
+    async def _atender(self, reader, writer):
+        try:
+            while line := await reader.readline():
+                line = line.strip()
+                if not line:
+                    continue
+                try:
+                    punto = json.loads(line)
+                except ValueError:
+                    punto = None
+                if not isinstance(punto, dict) or not {"timestamp", "intensity"} <= punto.keys():
+                    writer.write(b'{"error": "punto invalido"}\n')
+                    continue
+                await self.recibir(punto)
+        finally:
+            writer.close()
+
+    async def recibir(self, punto):
+        """Encola un punto; espera si la cola está llena (contrapresión)."""
+        if self._entrada.full():
+            self.esperas_contrapresion += 1
+        await self._entrada.put(punto)
+        self.puntos_recibidos += 1
+
+    # --- micro-lotes ---
+
+    async def _agrupar(self):
+        terminar = False
+        while not terminar:
+            primero = await self._entrada.get()
+            if primero is None:
+                break
+            lote = [primero]
+            limite = self._loop.time() + self.max_espera
+            while len(lote) < self.tamano_lote:
+                restante = limite - self._loop.time()
+                if restante <= 0:
+                    break
+                try:
+                    punto = await asyncio.wait_for(self._entrada.get(), restante)
+                except asyncio.TimeoutError:
+                    break
+                if punto is None:
+                    terminar = True
+                    break
+                lote.append(punto)
+            await self._puntuar(lote)
+
+    async def _puntuar(self, lote):
+        t0 = time.perf_counter()
+        try:
+            df = pd.DataFrame(lote)
+            df["timestamp"] = pd.to_datetime(df["timestamp"])
+            df_res = await self._loop.run_in_executor(
+                self._ejecutor, self.detector.procesar_lote, df
+            )
+        except Exception as e:
+            # un lote malo no debe parar el servicio
+            self.errores += 1
+            print(f"❌ lote descartado ({len(lote)} puntos): {e}", file=sys.stderr)
+            return
+        finally:
+            self.ultimo_lote_ms = (time.perf_counter() - t0) * 1000
+            self.lotes += 1
+            self.puntos_puntuados += len(lote)
+
+        anomalias = df_res[df_res["es_anomalia"].astype(bool)]
+        if not anomalias.empty:
+            self.anomalias += len(anomalias)
+            self._publicar(anomalias.to_dict("records"))
+
+
+def sondear(cola, max_items=None):
+    """Saca sin bloquear lo que haya en una cola de suscriptor."""
+    items = []
+    while max_items is None or len(items) < max_items:
+        try:
+            items.append(cola.get_nowait())
+        except queue.Empty:
+            break
+    return items
+
+
+def arrancar_en_hilo(servicio, host=HOST, puerto=PUERTO):
+    """
+    Ejecuta `servicio` en un bucle asyncio propio dentro de un hilo demonio.
+
+    Devuelve el puerto en escucha (útil con `puerto=0`). Pensado para la app
+    de Streamlit, que no tiene bucle asyncio propio.
+    """
+    listo = threading.Event()
+    resultado = {}
+
+    def _hilo():
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            resultado["puerto"] = loop.run_until_complete(servicio.iniciar(host, puerto))
+        except BaseException as e:
+            resultado["error"] = e
+            listo.set()
+            return
+        listo.set()
+        loop.run_forever()
+
+    threading.Thread(target=_hilo, name="servicio-ingesta", daemon=True).start()
+    listo.wait()
+    if "error" in resultado:
+        raise resultado["error"]
+    return resultado["puerto"]
+
+
+def detener_en_hilo(servicio, timeout=10.0):
+    """Detiene un servicio lanzado con `arrancar_en_hilo` y su bucle."""
+    loop = servicio._loop
+    asyncio.run_coroutine_threadsafe(servicio.detener(), loop).result(timeout)
+    loop.call_soon_threadsafe(loop.stop)
+
+
+# ============================================================================
+# CLIENTE DE REPRODUCCIÓN
+# ============================================================================
+
+
+async def reproducir_csv(ruta_csv, host=HOST, puerto=PUERTO, velocidad=60.0):
+    """
+    Envía un CSV al servicio respetando sus timestamps a `velocidad`× tiempo real.
+
+    Con `velocidad=0` envía tan rápido como el servicio acepte. `drain()`
+    hace que el cliente espere cuando el servicio aplica contrapresión.
+    Devuelve el número de puntos enviados.
+    """
+    _, writer = await asyncio.open_connection(host, puerto)
+    enviados = 0
+    t_ini = None
+    reloj_ini = time.perf_counter()
+    try:
+        for chunk in leer_csv_por_bloques(ruta_csv):
+            for punto in chunk.to_dict("records"):
+                ts = punto["timestamp"]
+                if velocidad > 0:
+                    if t_ini is None:
+                        t_ini = ts
+                    objetivo = (ts - t_ini).total_seconds() / velocidad
+                    retraso = objetivo - (time.perf_counter() - reloj_ini)
+                    if retraso > 0.001:
+                        await writer.drain()
+                        await asyncio.sleep(retraso)
+                punto["timestamp"] = ts.isoformat()
+                writer.write(json.dumps(punto).encode() + b"\n")
+                enviados += 1
+                if enviados % 1000 == 0:
+                    await writer.drain()
+        await writer.drain()
+    finally:
+        writer.close()
+        await writer.wait_closed()
+    return enviados
+
+
+# ============================================================================
+# CLI
+# ============================================================================
+
+
+def crear_parser():
+    parser = argparse.ArgumentParser(description="Ingesta en vivo de puntos de tráfico.")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    servir = sub.add_parser("servir", help="arrancar el servicio")
+    servir.add_argument("--historico", required=True, help="CSV para entrenar el detector")
+    servir.add_argument(
+        "--algoritmo", choices=("mad", "mad-estacional", "iforest-online"), default="mad"
+    )
+    servir.add_argument("--window-days", type=int, default=42)
+    servir.add_argument("--threshold", type=float, default=3.5)
+    servir.add_argument("--host", default=HOST)
+    servir.add_argument("--puerto", type=int, default=PUERTO)
+    servir.add_argument("--tamano-lote", type=int, default=500)
+    servir.add_argument("--max-espera", type=float, default=1.0)
+
+    rep = sub.add_parser("reproducir", help="enviar un CSV al servicio")
+    rep.add_argument("csv")
+    rep.add_argument("--host", default=HOST)
+    rep.add_argument("--puerto", type=int, default=PUERTO)
+    rep.add_argument(
+        "--velocidad", type=float, default=60.0, help="N× tiempo real (0 = sin esperas)"
+    )
+    return parser
+
+
+async def _servir(args):
+    from main import crear_detector
+    from ingesta import cargar_dataset
+
+    detector = crear_detector(
+        args.algoritmo,
+        {
+            "window_days": args.window_days,
+            "threshold": args.threshold,
+            "bucket_minutos": 15,
+            "contamination": 0.01,
+            "n_estimators": 100,
+            "features": ["intensity"],
+            "deriva": False,
+        },
+    )
+    detector.cargar_historico(cargar_dataset(args.historico).a_dataframe())
+
+    servicio = ServicioIngesta(
+        detector, tamano_lote=args.tamano_lote, max_espera=args.max_espera
+    )
+    cola = servicio.suscribir()
+    puerto = await servicio.iniciar(args.host, args.puerto)
+    print(f"Escuchando en {args.host}:{puerto}")
+    try:
+        while True:
+            await asyncio.sleep(1.0)
+            for a in sondear(cola):
+                print(f"🔴 {a['timestamp']} intensity={a['intensity']:.1f} score={a['score']:.2f}")
+    finally:
+        await servicio.detener()
+
+
+def main(argv=None):
+    args = crear_parser().parse_args(argv)
+    try:
+        if args.comando == "servir":
+            asyncio.run(_servir(args))
+        else:
+            t0 = time.perf_counter()
+            n = asyncio.run(
+                reproducir_csv(args.csv, args.host, args.puerto, args.velocidad)
+            )
+            print(f"{n} puntos enviados en {time.perf_counter() - t0:.1f} s")
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
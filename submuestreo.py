@@ -0,0 +1,63 @@
+"""
+Submuestreo por nivel de detalle para los gráficos.
+
+Divide el rango temporal visible en cubos de igual anchura (uno por "píxel")
+y conserva el mínimo y el máximo de cada cubo, así que picos y valles
+sobreviven aunque se envíe una fracción de los puntos. Los puntos marcados
+en `forzar` (anomalías) se conservan siempre.
+"""
+
+import numpy as np
+import pandas as pd
+
+MAX_PUNTOS_GRAFICO = 4000
+
+
+def indices_minmax(t, y, n_cubos):
+    """
+    Índices del mínimo y máximo de `y` en cada cubo temporal.
+
+    `t` debe estar ordenado. Devuelve índices ordenados y sin repetir,
+    incluidos el primero y el último.
+    """
+    n = len(y)
+    if n <= 2 * n_cubos:
+        return np.arange(n)
+
+    t = np.asarray(t, dtype=np.float64)
+    bordes = np.linspace(t[0], t[-1], n_cubos + 1)[1:-1]
+    inicios = np.r_[0, np.searchsorted(t, bordes, side="left")]
+    inicios = np.unique(inicios)
+    cubo = np.repeat(np.arange(len(inicios)), np.diff(np.r_[inicios, n]))
+
+    y = np.asarray(y, dtype=np.float64)
+    mins = np.minimum.reduceat(y, inicios)
+    maxs = np.maximum.reduceat(y, inicios)
+
+    es_min = y == mins[cubo]
+    es_max = y == maxs[cubo]
+    # primera aparición de cada extremo dentro de su cubo
+    idx_min = np.flatnonzero(es_min)
+    idx_min = idx_min[np.r_[True, cubo[idx_min][1:] != cubo[idx_min][:-1]]]
+    idx_max = np.flatnonzero(es_max)
+    idx_max = idx_max[np.r_[True, cubo[idx_max][1:] != cubo[idx_max][:-1]]]
+
+    return np.unique(np.r_[0, idx_min, idx_max, n - 1])
+
+
+def submuestrear(df: pd.DataFrame, columna, max_puntos=MAX_PUNTOS_GRAFICO, forzar=None):
+    """
+    Filas de `df` a pintar para `columna`, como mucho ~`max_puntos` más las forzadas.
+
+    `df` debe venir ordenado por `timestamp`; `forzar` es una máscara booleana
+    de filas que no se pueden descartar.
+    """
+    if len(df) <= max_puntos:
+        return df
+
+    t = pd.DatetimeIndex(df["timestamp"]).as_unit("ns").asi8
+    idx = indices_minmax(t, df[columna].to_numpy(), max(1, max_puntos // 2))
+    if forzar is not None:
+        idx = np.union1d(idx, np.flatnonzero(np.asarray(forzar)))
+    return df.iloc[idx]
+
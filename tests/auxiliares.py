@@ -0,0 +1,18 @@
+"""Utilidades compartidas por los tests."""
+
+import pandas as pd
+
+
+def partir(df, dias=7):
+    """(histórico de los primeros `dias` días, resto con índice desde 0)."""
+    corte = df["timestamp"].iloc[0] + pd.Timedelta(days=dias)
+    return df[df["timestamp"] < corte], df[df["timestamp"] >= corte].reset_index(drop=True)
+
+
+def por_lotes(detector, df, tamano, **kwargs):
+    """Resultado de puntuar `df` en lotes consecutivos de `tamano` filas."""
+    partes = [
+        detector.procesar_lote(df.iloc[i : i + tamano].reset_index(drop=True), **kwargs)
+        for i in range(0, len(df), tamano)
+    ]
+    return pd.concat(partes, ignore_index=True)
@@ -0,0 +1,18 @@
+import os
+
+import pytest
+
+from ingesta import cargar_dataset
+
+DATOS = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), "datos_trafico")
+
+
+def cargar(nombre):
+    return cargar_dataset(os.path.join(DATOS, nombre)).a_dataframe()
+
+
+@pytest.fixture(scope="session")
+def df_incidencias():
+    """Los 30 días con incidencias; los detectores entrenan con la primera semana."""
+    return cargar("trafico_con_incidencias.csv")
+
@@ -0,0 +1,89 @@
+"""Estado compartido de `TrafficAnomalyDetectorFlota`."""
+
+import tracemalloc
+
+import numpy as np
+import pandas as pd
+
+from detectores import TrafficAnomalyDetectorFlota
+
+
+def lote(sensores, minutos, valores):
+    return pd.DataFrame(
+        {
+            "sensor_id": sensores,
+            "timestamp": pd.to_datetime(np.asarray(minutos, dtype=np.int64), unit="m"),
+            "intensity": valores,
+        }
+    )
+
+
+def ventana_esperada(escritos, ultimo, W):
+    """Fila del anillo a fuerza bruta: lo escrito dentro de (ultimo - W, ultimo]."""
+    fila = np.full(W, np.nan, dtype=np.float32)
+    for minuto, valor in escritos.items():
+        if ultimo - W < minuto <= ultimo:
+            fila[minuto % W] = valor
+    return fila
+
+
+def test_anillo_contra_fuerza_bruta():
+    rng = np.random.default_rng(0)
+    detector = TrafficAnomalyDetectorFlota(window_days=1, min_puntos=10)
+    W = detector.window_minutos
+    escritos = {s: {} for s in range(3)}
+    ultimo = {s: None for s in range(3)}
+
+    minuto = 0
+    for _ in range(60):
+        # saltos cortos, largos (más de _HUECO_VECTORIZADO) y mayores que la ventana
+        minuto += int(rng.choice([1, 5, 200, 1000, 3000]))
+        sensores = rng.choice(3, size=rng.integers(1, 4), replace=False)
+        for s in sensores:
+            # algún punto atrasado dentro del lote
+            minutos = [minuto, minuto - int(rng.integers(0, 30))]
+            valores = rng.normal(100, 10, size=2).astype(np.float32)
+            detector._escribir(
+                detector._filas(np.array([s, s])),
+                np.array(minutos, dtype=np.int64),
+                valores,
+            )
+            nuevo = max(minutos) if ultimo[s] is None else max(ultimo[s], max(minutos))
+            for m, v in zip(minutos, valores):
+                if m > nuevo - W:
+                    escritos[s][m] = v
+            ultimo[s] = nuevo
+
+    for s in range(3):
+        fila = detector.sensor_ids.get_loc(s)
+        np.testing.assert_array_equal(
+            detector._valores[fila], ventana_esperada(escritos[s], ultimo[s], W)
+        )
+
+
+def test_alta_de_sensores_sin_copias_de_la_ventana():
+    detector = TrafficAnomalyDetectorFlota()  # 42 días por sensor
+    n = 50
+    df = lote(np.repeat(np.arange(n), 60), np.tile(np.arange(60), n), 100.0)
+    filas = detector._filas(df["sensor_id"].to_numpy())
+
+    tracemalloc.start()
+    detector._escribir(filas, detector._minutos(df["timestamp"]), np.full(len(df), 100.0))
+    pico = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+
+    assert pico < detector._valores.nbytes / 10
+    assert np.count_nonzero(~np.isnan(detector._valores)) == n * 60
+
+
+def test_ids_no_vistos_y_orden_de_alta():
+    detector = TrafficAnomalyDetectorFlota(window_days=1, min_puntos=5)
+    historico = lote(np.repeat(["b", "a"], 30), np.tile(np.arange(30), 2), 100.0)
+    detector.cargar_historico(historico)
+    assert list(detector.sensor_ids) == ["b", "a"]
+
+    res = detector.procesar_lote(lote(["a", "c"], [30, 30], [100.0, 100.0]))
+    assert list(detector.sensor_ids) == ["b", "a", "c"]
+    # "c" no tiene baseline todavía
+    assert np.isnan(res["score"].iloc[1])
+    assert detector.n_sensores == 3
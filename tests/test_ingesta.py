@@ -0,0 +1,80 @@
+"""Lectura de CSV por bloques y puntuación en streaming."""
+
+import numpy as np
+import pandas as pd
+
+import ingesta
+from detectores import TrafficAnomalyDetectorMAD
+from ingesta import DIRECTORIO_CACHE, cargar_dataset, puntuar_csv_en_streaming
+
+CSV = "timestamp,intensity\n2024-01-01 00:00:00,10\n2024-01-01 00:01:00,12\n"
+
+
+def test_cache_en_directorio_indicado(tmp_path):
+    for sub in ("a", "b"):
+        (tmp_path / sub).mkdir()
+        (tmp_path / sub / "datos.csv").write_text(CSV)
+    cache = tmp_path / "cache"
+    for sub in ("a", "b"):
+        ds = cargar_dataset(str(tmp_path / sub / "datos.csv"), str(cache))
+        assert len(ds.a_dataframe()) == 2
+        assert not (tmp_path / sub / DIRECTORIO_CACHE).exists()
+    # mismo nombre de CSV en dos directorios: dos entradas distintas
+    assert len(list(cache.iterdir())) == 2
+
+
+def test_cache_no_escribible_parsea_sin_cache(tmp_path):
+    ruta = tmp_path / "datos.csv"
+    ruta.write_text(CSV)
+    bloqueo = tmp_path / "fichero"
+    bloqueo.write_text("")
+    df = cargar_dataset(str(ruta), str(bloqueo / "cache")).a_dataframe()
+    assert df["intensity"].tolist() == [10, 12]
+
+
+def test_cache_conserva_segundos_y_microsegundos(tmp_path):
+    ruta = tmp_path / "datos.csv"
+    ruta.write_text(
+        "timestamp,intensity\n"
+        "2025-12-10 10:12:04.251800,1\n"
+        "2025-12-10 10:12:59.000000,2\n"
+        "2025-12-10 10:13:04.251800,3\n"
+    )
+    esperado = pd.to_datetime(pd.read_csv(ruta)["timestamp"]).tolist()
+    for _ in range(2):  # conversión y lectura desde la caché
+        ds = cargar_dataset(str(ruta))
+        assert ds.a_dataframe()["timestamp"].tolist() == esperado
+    assert len(ds.ventana("2025-12-10 10:12:30", "2025-12-10 10:13:04.251800")) == 1
+
+
+def test_streaming_csv_vacio(tmp_path):
+    ruta = tmp_path / "vacio.csv"
+    ruta.write_text("timestamp,intensity\n")
+    detector = TrafficAnomalyDetectorMAD(window_days=1)
+    assert list(puntuar_csv_en_streaming(ruta, detector)) == []
+    assert detector.baseline_mad is None
+
+
+def test_streaming_salta_bloques_vacios(monkeypatch, df_incidencias):
+    df = df_incidencias.iloc[: 3 * 1440]
+    vacio = df.iloc[:0]
+
+    def bloques(fuente, chunksize):
+        yield vacio
+        for i in range(0, len(df), chunksize):
+            yield df.iloc[i : i + chunksize]
+            yield vacio
+
+    monkeypatch.setattr(ingesta, "leer_csv_por_bloques", bloques)
+    en_streaming = pd.concat(
+        puntuar_csv_en_streaming(None, TrafficAnomalyDetectorMAD(window_days=1), chunksize=500),
+        ignore_index=True,
+    )
+
+    detector = TrafficAnomalyDetectorMAD(window_days=1)
+    corte = df["timestamp"].iloc[0] + pd.Timedelta(days=1)
+    detector.cargar_historico(df[df["timestamp"] < corte])
+    de_una_vez = detector.procesar_lote(df[df["timestamp"] >= corte].reset_index(drop=True))
+
+    assert len(en_streaming) == len(de_una_vez) == 2 * 1440
+    np.testing.assert_allclose(en_streaming["score"], de_una_vez["score"])
@@ -0,0 +1,61 @@
+"""_ListaOrdenada frente a una lista ordenada con sorted()."""
+
+import bisect
+
+import numpy as np
+import pytest
+
+from detectores import _ListaOrdenada
+
+
+def comprobar(lista, referencia):
+    assert len(lista) == len(referencia)
+    assert [lista[i] for i in range(len(lista))] == referencia
+    if not referencia:
+        return
+    assert lista[-1] == referencia[-1]
+    for valor in (referencia[0] - 1, referencia[len(referencia) // 3], referencia[-1] + 1):
+        assert lista.bisect_left(valor) == bisect.bisect_left(referencia, valor)
+    mediana = np.median(referencia)
+    assert lista.mediana() == pytest.approx(mediana)
+    assert lista.mad(mediana) == pytest.approx(np.median(np.abs(np.array(referencia) - mediana)))
+
+
+@pytest.mark.parametrize("semilla", range(5))
+def test_ventana_deslizante(semilla):
+    # carga pequeña para que los bloques se partan y se vacíen a menudo
+    rng = np.random.default_rng(semilla)
+    valores = rng.integers(0, 50, 600).tolist()
+    lista = _ListaOrdenada(valores[:100], carga=4)
+    referencia = sorted(valores[:100])
+    comprobar(lista, referencia)
+
+    for i, valor in enumerate(valores[100:]):
+        lista.add(valor)
+        bisect.insort(referencia, valor)
+        if rng.random() < 0.6:
+            viejo = valores[i]
+            lista.remove(viejo)
+            referencia.remove(viejo)
+        comprobar(lista, referencia)
+
+
+def test_vaciar_y_rellenar():
+    lista = _ListaOrdenada(carga=2)
+    for valor in (3, 1, 2, 2):
+        lista.add(valor)
+    for valor in (2, 1, 3, 2):
+        lista.remove(valor)
+    comprobar(lista, [])
+    lista.add(7)
+    comprobar(lista, [7])
+
+
+def test_errores():
+    lista = _ListaOrdenada([1, 2, 3], carga=2)
+    with pytest.raises(ValueError):
+        lista.remove(5)
+    with pytest.raises(ValueError):
+        lista.remove(1.5)
+    with pytest.raises(IndexError):
+        lista[3]
@@ -0,0 +1,101 @@
+"""Puntuar por micro-lotes da lo mismo que puntuar de una vez."""
+
+import numpy as np
+import pytest
+
+from auxiliares import partir, por_lotes
+from conftest import cargar
+from detectores import (
+    TrafficAnomalyDetectorEnsemble,
+    TrafficAnomalyDetectorIForest,
+    TrafficAnomalyDetectorMAD,
+    TrafficAnomalyDetectorMADEstacional,
+    TrafficAnomalyDetectorMADMultivariante,
+)
+
+N_FILAS = 600
+FEATURES = ("intensity", "occupancy", "diff_intensity", "std_intensity")
+
+
+def comparar(crear, df, tamano, n_filas=N_FILAS, **kwargs):
+    historico, resto = partir(df)
+    resto = resto.iloc[:n_filas]
+    detectores = [crear(), crear()]
+    for detector in detectores:
+        detector.cargar_historico(historico)
+
+    una = detectores[0].procesar_lote(resto, **kwargs)
+    lotes = por_lotes(detectores[1], resto, tamano, **kwargs)
+    np.testing.assert_allclose(lotes["score"], una["score"], rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(lotes["es_anomalia"], una["es_anomalia"])
+    return detectores
+
+
+@pytest.mark.parametrize("tamano", [1, 5, 64])
+@pytest.mark.parametrize(
+    "params",
+    [{}, {"ventana_movil": True}],
+    ids=["fija", "movil"],
+)
+def test_mad(df_incidencias, tamano, params):
+    comparar(lambda: TrafficAnomalyDetectorMAD(window_days=7, **params), df_incidencias, tamano)
+
+
+@pytest.mark.parametrize("tamano", [60, 1440])
+def test_mad_con_deriva(tamano):
+    # la obra de cambio_gradual confirma una deriva hacia el día 17
+    detectores = comparar(
+        lambda: TrafficAnomalyDetectorMAD(window_days=7, deriva=True),
+        cargar("trafico_cambio_gradual.csv"),
+        tamano,
+        n_filas=20 * 1440,
+    )
+    eventos = [list(d.eventos_deriva) for d in detectores]
+    assert eventos[0] and eventos[0] == eventos[1]
+
+
+@pytest.mark.parametrize("tamano", [1, 64])
+def test_mad_estacional(df_incidencias, tamano):
+    comparar(lambda: TrafficAnomalyDetectorMADEstacional(window_days=7), df_incidencias, tamano)
+
+
+@pytest.mark.parametrize("tamano", [1, 5, 64])
+def test_mad_multivariante(df_incidencias, tamano):
+    comparar(
+        lambda: TrafficAnomalyDetectorMADMultivariante(window_days=7, features=FEATURES),
+        df_incidencias,
+        tamano,
+    )
+
+
+@pytest.mark.parametrize("tamano", [5, 64])
+def test_iforest_con_features(df_incidencias, tamano):
+    comparar(lambda: TrafficAnomalyDetectorIForest(features=FEATURES), df_incidencias, tamano)
+
+
+@pytest.mark.parametrize("tamano", [1, 64])
+def test_ensemble_con_features(df_incidencias, tamano):
+    comparar(
+        lambda: TrafficAnomalyDetectorEnsemble(
+            window_days=7, features=("intensity", "std_intensity"), paralelo=False
+        ),
+        df_incidencias,
+        tamano,
+    )
+
+
+@pytest.mark.parametrize("tamano", [1, 64])
+def test_iforest(df_incidencias, tamano):
+    comparar(TrafficAnomalyDetectorIForest, df_incidencias, tamano)
+
+
+def test_iforest_no_recorta_el_historico(df_incidencias):
+    historico, _ = partir(df_incidencias)
+    detector = TrafficAnomalyDetectorIForest(features=FEATURES)
+    detector.cargar_historico(historico)
+    crudo = detector._puntuar(detector._matriz(historico))
+    detector._contexto = None
+    score = detector.procesar_lote(historico)["score"].to_numpy()
+    # solo el mínimo y el máximo del histórico tocan los límites
+    assert (score == 1.0).sum() == (crudo == crudo.min()).sum()
+    assert (score == 0.0).sum() == (crudo == crudo.max()).sum()
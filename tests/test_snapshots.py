@@ -0,0 +1,53 @@
+"""Un detector restaurado de un snapshot puntúa igual que el original."""
+
+import numpy as np
+import pytest
+
+from auxiliares import partir
+from detectores import (
+    TrafficAnomalyDetectorIForest,
+    TrafficAnomalyDetectorMAD,
+    TrafficAnomalyDetectorMADEstacional,
+    TrafficAnomalyDetectorMADMultivariante,
+)
+
+FEATURES = ("intensity", "occupancy", "diff_intensity", "std_intensity")
+
+DETECTORES = {
+    "mad": lambda: TrafficAnomalyDetectorMAD(window_days=7),
+    "mad_movil": lambda: TrafficAnomalyDetectorMAD(window_days=7, ventana_movil=True),
+    "mad_deriva": lambda: TrafficAnomalyDetectorMAD(window_days=7, deriva=True),
+    "estacional": lambda: TrafficAnomalyDetectorMADEstacional(window_days=7),
+    "multivariante": lambda: TrafficAnomalyDetectorMADMultivariante(
+        window_days=7, features=FEATURES
+    ),
+    "iforest": TrafficAnomalyDetectorIForest,
+    "iforest_features": lambda: TrafficAnomalyDetectorIForest(features=FEATURES),
+}
+
+
+@pytest.mark.parametrize("nombre", DETECTORES)
+def test_ida_y_vuelta(tmp_path, df_incidencias, nombre):
+    historico, resto = partir(df_incidencias)
+    original = DETECTORES[nombre]()
+    original.cargar_historico(historico)
+    # el snapshot se toma a mitad de serie: las features móviles necesitan el contexto
+    original.procesar_lote(resto.iloc[:300])
+    original.guardar_snapshot(tmp_path / "snap")
+
+    restaurado = type(original).desde_snapshot(tmp_path / "snap")
+    siguiente = resto.iloc[300:600].reset_index(drop=True)
+    esperado = original.procesar_lote(siguiente)
+    obtenido = restaurado.procesar_lote(siguiente)
+
+    np.testing.assert_allclose(obtenido["score"], esperado["score"], rtol=1e-9, atol=1e-9)
+    np.testing.assert_array_equal(obtenido["es_anomalia"], esperado["es_anomalia"])
+
+
+def test_snapshot_de_otra_clase(tmp_path, df_incidencias):
+    historico, _ = partir(df_incidencias)
+    detector = TrafficAnomalyDetectorMAD(window_days=7)
+    detector.cargar_historico(historico)
+    detector.guardar_snapshot(tmp_path / "snap")
+    with pytest.raises(ValueError):
+        TrafficAnomalyDetectorMADEstacional.desde_snapshot(tmp_path / "snap")